@@ -0,0 +1,88 @@
+'''
+Startup time of the command line, from `python -X importtime`.
+
+    python benchmarks/import_time.py                 # py-redis-trib.py --help
+    python benchmarks/import_time.py -- info --help
+    python benchmarks/import_time.py --budget-ms 80 --show 20
+
+The command is run --repeat times and the fastest run is kept, to leave
+out the noise of a cold disk cache. The exit status is 1 when its imports
+take longer than the budget, or when one of the modules that only the
+subcommands need (FORBIDDEN) is imported before a subcommand runs. The
+test suite only checks FORBIDDEN: the budget depends on the machine and
+is only checked here.
+'''
+
+import os
+import re
+import subprocess
+import sys
+
+import click
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'py-redis-trib.py')
+
+DEFAULT_BUDGET_MS = 100
+FORBIDDEN = ('redis', 'asyncio', 'termcolor', 'more_itertools', 'redis_trib.command')
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def measure(args, repeat=5):
+    '''
+    Run the CLI with args and return ({module: cumulative us}, total us)
+    of its fastest run.
+    '''
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', SCRIPT, *args],
+                                cwd=ROOT, capture_output=True, text=True)
+        modules, total = {}, 0
+        for line in result.stderr.splitlines():
+            m = _LINE.match(line)
+            if not m:
+                continue
+            cumulative, indent, name = int(m.group(2)), len(m.group(3)), m.group(4)
+            modules[name] = cumulative
+            # Top level imports only, nested ones are in their cumulative time.
+            if indent == 1:
+                total += cumulative
+        if best is None or total < best[1]:
+            best = (modules, total)
+    return best
+
+
+def forbidden_imports(modules):
+    return sorted(name for name in modules
+                  if any(name == f or name.startswith(f + '.') for f in FORBIDDEN))
+
+
+@click.command(context_settings={'ignore_unknown_options': True})
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+@click.option('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+@click.option('--repeat', type=int, default=5)
+@click.option('--show', type=int, default=10, help='Number of slowest imports to list.')
+def main(args, budget_ms, repeat, show):
+    args = args or ('--help',)
+    modules, total = measure(args, repeat)
+
+    print(f"py-redis-trib.py {' '.join(args)}: {total / 1000:.1f}ms of imports "
+          f"(budget {budget_ms:.0f}ms)")
+    for name, cumulative in sorted(modules.items(), key=lambda e: -e[1])[:show]:
+        print(f"  {cumulative / 1000:>8.1f}ms  {name}")
+
+    failed = False
+    forbidden = forbidden_imports(modules)
+    if forbidden:
+        print(f"FORBIDDEN imports: {', '.join(forbidden)}")
+        failed = True
+    if total > budget_ms * 1000:
+        print(f"OVER BUDGET by {total / 1000 - budget_ms:.1f}ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
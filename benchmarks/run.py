@@ -0,0 +1,302 @@
+'''
+Benchmarks of the discovery, planning and migration hot paths.
+
+    python benchmarks/run.py                  # small scale, a few seconds
+    python benchmarks/run.py --scale full     # 1000 nodes, 16384 slots
+    python benchmarks/run.py -k parse -k slots
+
+Discovery and migration run against the in-process simulated cluster
+(redis_trib.simulator), so no server is needed. Every run is appended to
+a JSON history file and each benchmark's median is compared with the
+median of its previous runs at the same scale. A benchmark more than
+--threshold slower is flagged as a regression and the exit status is 1.
+'''
+
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from redis_trib.cluster_node import Node
+from redis_trib.const import CLUSTER_HASH_SLOTS
+from redis_trib.factory import NodesFactory
+from redis_trib.mixins.create_cluster import OriginalRoleDistribution
+from redis_trib.mixins.import_cluster import key_to_slot
+from redis_trib.monkey_patch.redis_ import parse_node_line
+from redis_trib.simulator import SimulatedCluster
+from redis_trib.trib import RedisTrib
+from redis_trib.util import summarize_slots
+
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.json')
+
+SCALES = {
+    'small': {'nodes': 100, 'hosts': 10, 'keys': 100000,
+              'move_slots': 20, 'move_keys': 20000, 'repeat': 5},
+    'full': {'nodes': 1000, 'hosts': 50, 'keys': 1000000,
+             'move_slots': 100, 'move_keys': 200000, 'repeat': 3},
+}
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    '''
+    Register a benchmark. The decorated function is a context manager
+    that gets the scale parameters, does its setup and yields (func,
+    items): func is what is timed and items the number of items it
+    handles per call, for the throughput column.
+    '''
+    def decorator(func):
+        BENCHMARKS[name] = contextlib.contextmanager(func)
+        return func
+    return decorator
+
+
+def _node_id(i):
+    return f"{i:040x}"
+
+
+def _fake_nodes(num_nodes, hosts, replicas=1):
+    # Nodes as loaded from a cluster, without any connection.
+    nodes = []
+    masters = num_nodes // (replicas + 1)
+    for i in range(num_nodes):
+        n = Node(f"10.0.{i % hosts}.1:{7000 + i}")
+        n._node_id = _node_id(i)
+        n._flags = ['master'] if i < masters else ['slave']
+        if i >= masters:
+            n._replicate = _node_id(i % masters)
+        nodes.append(n)
+    for i, n in enumerate(nodes[:masters]):
+        start = i * CLUSTER_HASH_SLOTS // masters
+        end = (i + 1) * CLUSTER_HASH_SLOTS // masters
+        n.add_slots(list(range(start, end)), new=False)
+    return nodes
+
+
+def _cluster_nodes_lines(num_nodes):
+    masters = num_nodes // 2
+    lines = []
+    for i in range(num_nodes):
+        start = i * CLUSTER_HASH_SLOTS // masters
+        end = (i + 1) * CLUSTER_HASH_SLOTS // masters - 1
+        flags = 'master' if i < masters else 'slave'
+        master_id = '-' if i < masters else _node_id(i % masters)
+        line = f"{_node_id(i)} 10.0.{i % 250}.1:6379@16379 {flags} {master_id} 0 0 {i} connected"
+        if i < masters:
+            line += f" {start}-{end}"
+        lines.append(line)
+    return lines
+
+
+def _fragmented_slots():
+    # Every other slot as a single slot, the rest as 2-slot ranges.
+    return [[str(s)] if s % 4 == 0 else [str(s), str(s + 1)]
+            for s in range(0, CLUSTER_HASH_SLOTS, 2)]
+
+
+@benchmark('parse_node_line')
+def bench_parse_node_line(scale):
+    lines = _cluster_nodes_lines(scale['nodes'])
+    yield lambda: [parse_node_line(line) for line in lines], len(lines)
+
+
+@benchmark('parse_slots')
+def bench_parse_slots(scale):
+    node = Node('127.0.0.1:7000')
+    slots = _fragmented_slots()
+    yield lambda: node._parse_slots(slots), CLUSTER_HASH_SLOTS
+
+
+@benchmark('summarize_slots')
+def bench_summarize_slots(scale):
+    slots = [s for s in range(CLUSTER_HASH_SLOTS) if s % 3]
+    yield lambda: summarize_slots(slots), len(slots)
+
+
+@benchmark('key_to_slot')
+def bench_key_to_slot(scale):
+    keys = [f"user:{{{i % 1000}}}:{i}" if i % 2 else f"key:{i}"
+            for i in range(scale['keys'])]
+    yield lambda: [key_to_slot(k) for k in keys], len(keys)
+
+
+@benchmark('compute_reshard_table')
+def bench_compute_reshard_table(scale):
+    nodes = _fake_nodes(scale['nodes'], scale['hosts'])
+    trib = RedisTrib(nodes)
+    sources = trib._get_masters()
+    yield lambda: trib._compute_reshard_table(sources, CLUSTER_HASH_SLOTS // 4), \
+          CLUSTER_HASH_SLOTS // 4
+
+
+@benchmark('rebalance_plan')
+def bench_rebalance_plan(scale):
+    nodes = _fake_nodes(scale['nodes'], scale['hosts'])
+    # Half of the masters are empty, as after adding nodes.
+    masters = [n for n in nodes if n.is_master()]
+    for n in masters[len(masters) // 2:]:
+        masters[0].add_slots(list(n.slots), new=False)
+        n.del_slots(list(n.slots))
+
+    def plan():
+        with contextlib.redirect_stdout(io.StringIO()):
+            RedisTrib(nodes).rebalance_cluster({}, True, 10, 60, 2, True)
+    yield plan, len(masters)
+
+
+@benchmark('anti_affinity_score')
+def bench_anti_affinity_score(scale):
+    nodes = _fake_nodes(scale['nodes'], scale['hosts'])
+    distribution = OriginalRoleDistribution(nodes, replicas=1)
+    yield distribution._get_anti_affinity_score, len(nodes)
+
+
+@benchmark('optimize_anti_affinity')
+def bench_optimize_anti_affinity(scale):
+    # Masters and their replicas on the same hosts, the worst case.
+    nodes = _fake_nodes(scale['nodes'], scale['nodes'] // 2)
+    distribution = OriginalRoleDistribution(nodes, replicas=1)
+    replicate = [n.replicate for n in nodes]
+
+    def optimize():
+        random.seed(0)
+        for n, master_id in zip(nodes, replicate):
+            n._replicate = master_id
+        with contextlib.redirect_stdout(io.StringIO()):
+            distribution._optimize_anti_affinity()
+    yield optimize, len(nodes)
+
+
+@benchmark('create_nodes_with_friends')
+def bench_create_nodes_with_friends(scale):
+    with SimulatedCluster(masters=scale['nodes'] // 2, replicas=1) as cluster:
+        addr = cluster.addrs[0]
+        yield lambda: NodesFactory.create_nodes_with_friends(addr, None), scale['nodes']
+
+
+@benchmark('move_slot')
+def bench_move_slot(scale):
+    with SimulatedCluster(masters=2, keys=scale['move_keys']) as cluster:
+        nodes, _ = NodesFactory.create_nodes_with_friends(cluster.addrs[0], None)
+        trib = RedisTrib(nodes)
+        source, target = trib._get_masters()
+        slots = sorted(source.slots)[:scale['move_slots']]
+        keys = sum(source.cluster_count_keys_in_slot(s) for s in slots)
+
+        def move():
+            # Back and forth, so every call moves the same keys.
+            nonlocal source, target
+            with contextlib.redirect_stdout(io.StringIO()):
+                for slot in slots:
+                    trib._move_slot(source, target, slot)
+            source, target = target, source
+        yield move, keys
+
+
+def run_benchmark(name, scale, repeat):
+    with BENCHMARKS[name](scale) as (func, items):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    return {
+        'median': median,
+        'min': min(timings),
+        'runs': repeat,
+        'items_per_sec': items / median if median else None,
+    }
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_history(path, history):
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=2)
+
+
+def baselines(history, scale_name, window):
+    # {benchmark: median of its medians over the last `window` runs}
+    medians = {}
+    for run in history:
+        if run['scale'] != scale_name:
+            continue
+        for name, result in run['results'].items():
+            medians.setdefault(name, []).append(result['median'])
+    return {name: statistics.median(values[-window:])
+            for name, values in medians.items()}
+
+
+def find_regressions(results, baseline, threshold):
+    return {name: result['median'] / baseline[name]
+            for name, result in results.items()
+            if baseline.get(name) and result['median'] > baseline[name] * (1 + threshold)}
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option('--scale', 'scale_name', type=click.Choice(list(SCALES)), default='small')
+@click.option('-k', 'patterns', multiple=True, help='Only run benchmarks containing this.')
+@click.option('--repeat', type=int)
+@click.option('--history', 'history_path', default=HISTORY_FILE)
+@click.option('--window', type=int, default=5)
+@click.option('--threshold', type=float, default=0.2)
+@click.option('--no-save', is_flag=True)
+def main(scale_name, patterns, repeat, history_path, window, threshold, no_save):
+    scale = SCALES[scale_name]
+    names = [name for name in BENCHMARKS
+             if not patterns or any(p in name for p in patterns)]
+    history = load_history(history_path)
+    baseline = baselines(history, scale_name, window)
+
+    results = {}
+    print(f"{'BENCHMARK':<28}{'MEDIAN':>12}{'MIN':>12}{'ITEMS/SEC':>14}{'CHANGE':>10}")
+    for name in names:
+        result = results[name] = run_benchmark(name, scale, repeat or scale['repeat'])
+        change = f"{result['median'] / baseline[name] - 1:+.1%}" if baseline.get(name) else '-'
+        print(f"{name:<28}{result['median'] * 1000:>10.2f}ms{result['min'] * 1000:>10.2f}ms"
+              f"{result['items_per_sec'] or 0:>14,.0f}{change:>10}", flush=True)
+
+    if not no_save:
+        history.append({
+            'timestamp': time.time(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'scale': scale_name,
+            'results': results,
+        })
+        save_history(history_path, history)
+
+    regressions = find_regressions(results, baseline, threshold)
+    for name, ratio in sorted(regressions.items()):
+        print(f"REGRESSION {name}: {ratio:.2f}x slower than the last {window} runs")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
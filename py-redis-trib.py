@@ -1,50 +1,70 @@
 import click
-from redis_trib.command import (
-    create_cluster_command,
-    info_cluster_command,
-    check_cluster_command,
-    add_node_command,
-    delete_node_command,
-    reshard_cluster_command,
-    rebalance_cluster_command,
-    fix_cluster_command,
-    call_cluster_command,
-    import_cluster_command,
-)
-from redis_trib.monkey_patch import patch_click_module
+from redis_trib.monkey_patch.click_ import verbose_option, password_option
 
 
-patch_click_module()
+# Commands import redis_trib.command (and with it redis) only when they
+# run, so that --help and argument errors stay fast.
+
+
+def migrate_options(f):
+    # --large-key-timeout defaults to 10x --timeout.
+    options = [
+        click.option('--probe-key-size', is_flag=True),
+        click.option('--batch-bytes', type=int, default=8*1024*1024),
+        click.option('--large-key-threshold', type=int, default=8*1024*1024),
+        click.option('--large-key-timeout', type=int),
+        click.option('--migrate-connections', type=int, default=1,
+                     help='MIGRATE (or --relay writer) connections per slot, for slots with many keys.'),
+        click.option('--relay', is_flag=True,
+                     help='Move keys through this client with DUMP/RESTORE instead of '
+                          'MIGRATE, when the source cannot reach the target. Writes '
+                          'to a key while it is relayed are lost.'),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
 
 
 @click.group()
-def cli():
-    pass
+@click.option('--metrics-file', type=click.Path(dir_okay=False),
+              help='Write a JSON summary of the Redis round trips at exit.')
+@click.option('--prometheus-file', type=click.Path(dir_okay=False),
+              help='Write the same metrics in Prometheus text format at exit.')
+def cli(metrics_file, prometheus_file):
+    if metrics_file or prometheus_file:
+        from redis_trib.metrics import enable_metrics
+        enable_metrics(metrics_file, prometheus_file)
 
 
 @cli.command()
 @click.argument('addrs', nargs=-1)
 @click.option('-r', '--replicas', type=int, default=0)
 @click.option('-y', '--yes', 'yes', is_flag=True)
-@click.password_option()
-@click.verbose_option()
-def create(addrs, verbose, password, replicas, yes):
+@password_option()
+@verbose_option()
+def create(addrs, password, replicas, yes):
+    from redis_trib.command import create_cluster_command
     create_cluster_command(addrs, password, replicas, yes)
 
 
 @cli.command()
 @click.argument('addr')
-@click.verbose_option()
-@click.password_option()
-def info(addr, verbose, password):
-    info_cluster_command(addr, password)
+@click.option('--no-cache', is_flag=True, help='Discover the whole topology, ignoring the cache.')
+@click.option('--sample', type=int, default=0,
+              help='Estimate the bytes of the keys from this many sampled keys per master.')
+@verbose_option()
+@password_option()
+def info(addr, password, no_cache, sample):
+    from redis_trib.command import info_cluster_command
+    info_cluster_command(addr, password, use_cache=not no_cache, sample=sample)
 
 
 @cli.command()
 @click.argument('addr')
-@click.verbose_option()
-@click.password_option()
-def check(addr, verbose, password):
+@verbose_option()
+@password_option()
+def check(addr, password):
+    from redis_trib.command import check_cluster_command
     check_cluster_command(addr, password)
 
 
@@ -54,9 +74,10 @@ def check(addr, verbose, password):
 @click.option('-m', '--master-id')
 @click.option('-r', '--addr-as-master', is_flag=True)
 @click.option('-s', '--slave', 'is_slave', is_flag=True)
-@click.password_option()
-@click.verbose_option()
+@password_option()
+@verbose_option()
 def add_node(addr, new_addr, password, is_slave, master_id, addr_as_master):
+    from redis_trib.command import add_node_command
     add_node_command(addr, new_addr, password, is_slave, master_id, addr_as_master)
 
 
@@ -64,9 +85,10 @@ def add_node(addr, new_addr, password, is_slave, master_id, addr_as_master):
 @click.argument('addr')
 @click.argument('del_node_id')
 @click.option('-r', '--rename-command', 'rename_commands', multiple=True)
-@click.password_option()
-@click.verbose_option()
+@password_option()
+@verbose_option()
 def del_node(addr, del_node_id, password, rename_commands):
+    from redis_trib.command import delete_node_command
     delete_node_command(addr, del_node_id, password, rename_commands)
 
 
@@ -78,11 +100,16 @@ def del_node(addr, del_node_id, password, rename_commands):
 @click.option('--pipeline', type=int, default=10)
 @click.option('--slots', 'num_slots', type=int)
 @click.option('-y', '--yes', 'yes', is_flag=True)
-@click.verbose_option()
-@click.password_option()
-def reshard(addr, password, from_ids, to_id, pipeline, timeout, num_slots, yes):
+@click.option('--estimate', is_flag=True,
+              help='Estimate the keys and bytes to move from sampled keys.')
+@migrate_options
+@verbose_option()
+@password_option()
+def reshard(addr, password, from_ids, to_id, pipeline, timeout, num_slots, yes,
+            estimate, **migrate_opts):
+    from redis_trib.command import reshard_cluster_command
     reshard_cluster_command(addr, password, from_ids, to_id,
-            pipeline, timeout, num_slots, yes)
+            pipeline, timeout, num_slots, yes, estimate, **migrate_opts)
 
 @cli.command()
 @click.argument('addr')
@@ -92,28 +119,44 @@ def reshard(addr, password, from_ids, to_id, pipeline, timeout, num_slots, yes):
 @click.option('--timeout', type=int, default=60)
 @click.option('--threshold', type=int, default=2)
 @click.option('--simulate', is_flag=True)
-@click.verbose_option()
-@click.password_option()
-def rebalance(addr, password, weights, use_empty_masters, pipeline, timeout, threshold, simulate):
+@click.option('--estimate', is_flag=True,
+              help='Estimate the keys and bytes of each move from sampled keys.')
+@migrate_options
+@verbose_option()
+@password_option()
+def rebalance(addr, password, weights, use_empty_masters, pipeline, timeout, threshold, simulate,
+              estimate, **migrate_opts):
+    from redis_trib.command import rebalance_cluster_command
     rebalance_cluster_command(addr, password, weights, use_empty_masters, 
-            pipeline, timeout, threshold, simulate)
+            pipeline, timeout, threshold, simulate, estimate, **migrate_opts)
 
 
 @cli.command()
 @click.argument('addr')
-@click.verbose_option()
-@click.password_option()
+@verbose_option()
+@password_option()
 def fix(addr, password):
+    from redis_trib.command import fix_cluster_command
     fix_cluster_command(addr, password)
 
 
 @cli.command()
 @click.argument('addr')
 @click.argument('command', nargs=-1)
-@click.verbose_option()
-@click.password_option()
-def call(addr, password, command):
-    call_cluster_command(addr, password, *command)
+@click.option('--parallel', type=click.IntRange(1), default=32)
+@click.option('--role', type=click.Choice(['all', 'master', 'replica']), default='all')
+@click.option('-f', '--file', 'batch_file', type=click.File('r'))
+@click.option('--format', 'output_format', type=click.Choice(['json', 'table']), default='json')
+@click.option('--no-cache', is_flag=True, help='Discover the whole topology, ignoring the cache.')
+@verbose_option()
+@password_option()
+def call(addr, password, command, parallel, role, batch_file, output_format, no_cache):
+    if command and batch_file:
+        raise click.UsageError('Give either COMMAND or --file, not both.')
+    from redis_trib.command import call_cluster_command
+    call_cluster_command(addr, password, *command, parallel=parallel, role=role,
+                         batch_file=batch_file, output_format=output_format,
+                         use_cache=not no_cache)
 
 
 @cli.command('import')
@@ -122,21 +165,148 @@ def call(addr, password, command):
 @click.option('--from', 'from_addr')
 @click.option('--replace', is_flag=True)
 @click.option('--copy', is_flag=True)
-@click.verbose_option()
-@click.password_option()
-def import_(addr, password, from_addr, from_password, replace, copy):
-    import_cluster_command(addr, password, from_addr, from_password, replace, copy)
+@click.option('--sync', is_flag=True)
+@click.option('--max-lag', type=int, default=100)
+@click.option('--max-pending', type=int, default=1000000)
+@click.option('--sync-batch', 'batch', type=int, default=500)
+@verbose_option()
+@password_option()
+def import_(addr, password, from_addr, from_password, replace, copy, sync, max_lag,
+            max_pending, batch):
+    from redis_trib.command import import_cluster_command
+    import_cluster_command(addr, password, from_addr, from_password, replace, copy,
+                           sync=sync, max_lag=max_lag, max_pending=max_pending,
+                           batch=batch)
 
 
 @cli.command('backup')
 @click.argument('addr')
-@click.verbose_option()
-@click.password_option()
-def backup(addr, password):
-    pass
+@click.option('-d', '--dir', 'backup_dir', default='backup')
+@click.option('--count', type=int, default=1000)
+@click.option('--no-compress', is_flag=True)
+@click.option('--parallel', type=click.IntRange(1), default=32)
+@click.option('--slots')
+@click.option('--incremental-from', type=click.Path(exists=True, file_okay=False))
+@click.option('--by-slot', is_flag=True,
+              help='List keys slot by slot with GETKEYSINSLOT instead of SCAN. '
+                   'Holds the key list of a whole slot in memory.')
+@verbose_option()
+@password_option()
+def backup(addr, password, backup_dir, count, no_compress, parallel, slots, incremental_from,
+           by_slot):
+    from redis_trib.command import backup_cluster_command
+    backup_cluster_command(addr, password, backup_dir, count, not no_compress, parallel,
+                           slots, incremental_from, by_slot)
+
+
+@cli.command('restore')
+@click.argument('addr')
+@click.option('-d', '--dir', 'backup_dir', default='backup')
+@click.option('--batch', type=int, default=500)
+@click.option('--rate', type=int)
+@click.option('--resume', is_flag=True)
+@click.option('--slots')
+@verbose_option()
+@password_option()
+def restore(addr, password, backup_dir, batch, rate, resume, slots):
+    from redis_trib.command import restore_cluster_command
+    restore_cluster_command(addr, password, backup_dir, batch, rate, resume, slots)
+
+
+@cli.command('extract')
+@click.argument('backup_dir', type=click.Path(exists=True, file_okay=False))
+@click.argument('out_dir')
+@click.option('--slots', required=True)
+@click.option('--no-compress', is_flag=True)
+@verbose_option()
+def extract(backup_dir, out_dir, slots, no_compress):
+    from redis_trib.command import extract_backup_command
+    extract_backup_command(backup_dir, out_dir, slots, not no_compress)
+
+
+@cli.command('verify')
+@click.argument('addr')
+@click.option('--from', 'from_addr')
+@click.option('--from-password')
+@click.option('-d', '--dir', 'backup_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--mode', type=click.Choice(['dump', 'light']), default='dump')
+@click.option('--slots')
+@click.option('--count', type=int, default=1000)
+@click.option('--parallel', type=click.IntRange(1), default=32)
+@click.option('--drill-down', is_flag=True)
+@verbose_option()
+@password_option()
+def verify(addr, password, from_addr, from_password, backup_dir, mode, slots, count,
+           parallel, drill_down):
+    if not (from_addr or backup_dir) or (from_addr and backup_dir):
+        raise click.UsageError('Use either --from or --dir.')
+    from redis_trib.command import verify_cluster_command
+    verify_cluster_command(addr, password, from_addr, from_password, backup_dir,
+                           mode, slots, count, parallel, drill_down)
+
+
+@cli.command('watch')
+@click.argument('addr')
+@click.option('--interval', type=float, default=1.0, help='Seconds between two polls.')
+@click.option('--nodes-per-tick', type=int, default=3)
+@click.option('--format', 'output_format', type=click.Choice(['text', 'json']), default='text')
+@verbose_option()
+@password_option()
+def watch(addr, password, interval, nodes_per_tick, output_format):
+    from redis_trib.command import watch_cluster_command
+    watch_cluster_command(addr, password, interval, nodes_per_tick, output_format)
+
 
+@cli.command('heatmap')
+@click.argument('addr')
+@click.option('--top', type=int, default=10, help='Number of heaviest slots to list.')
+@click.option('--batch', type=int, default=1000, help='Slots counted per round trip.')
+@click.option('--parallel', type=click.IntRange(1), default=32)
+@click.option('-o', '--output', type=click.Path(dir_okay=False),
+              help='Write the per-slot counts and statistics as JSON.')
+@verbose_option()
+@password_option()
+def heatmap(addr, password, top, batch, parallel, output):
+    from redis_trib.command import heatmap_cluster_command
+    heatmap_cluster_command(addr, password, top, batch, parallel, output)
 
 
+@cli.command('bigkeys')
+@click.argument('addr')
+@click.option('--top', type=int, default=10, help='Number of keys to list.')
+@click.option('--slot-top', type=int, default=3, help='Number of keys kept per slot.')
+@click.option('--count', type=int, default=1000, help='SCAN COUNT, keys per round trip.')
+@click.option('--hot', is_flag=True,
+              help='Rank keys by OBJECT FREQ (needs an LFU maxmemory policy).')
+@click.option('--samples', type=int, help='MEMORY USAGE SAMPLES.')
+@click.option('--parallel', type=click.IntRange(1), default=32)
+@click.option('-o', '--output', type=click.Path(dir_okay=False),
+              help='Write the report as JSON.')
+@verbose_option()
+@password_option()
+def bigkeys(addr, password, top, slot_top, count, hot, samples, parallel, output):
+    from redis_trib.command import bigkeys_cluster_command
+    bigkeys_cluster_command(addr, password, top, slot_top, count, hot, samples,
+                            parallel, output)
+
+
+@cli.command('sample')
+@click.argument('addr')
+@click.option('--size', type=int, default=1000, help='Keys sampled per master.')
+@click.option('--by-slot', is_flag=True,
+              help='Sample keys of random slots instead of RANDOMKEY, with estimates per slot.')
+@click.option('--probe-keys', type=int, default=10, help='Keys read per probed slot.')
+@click.option('--batch', type=int, default=100, help='Keys sampled per round trip.')
+@click.option('--parallel', type=click.IntRange(1), default=32)
+@click.option('-o', '--output', type=click.Path(dir_okay=False),
+              help='Write the estimates as JSON.')
+@verbose_option()
+@password_option()
+def sample(addr, password, size, by_slot, probe_keys, batch, parallel, output):
+    from redis_trib.command import sample_cluster_command
+    sample_cluster_command(addr, password, size, by_slot, probe_keys, batch,
+                           parallel, output)
+
 
 if __name__ == '__main__':
     cli()
@@ -0,0 +1,92 @@
+import redis
+import redis.asyncio
+
+from .cluster_node import Node, SOCKET_TIMEOUT
+from .metrics import get_metrics
+from .monkey_patch.redis_ import set_response_callbacks
+from .xprint import xprint
+from .exceptions import (
+    NodeConnectionException,
+    AssertNodeException,
+    LoadInfoFailureException,
+)
+
+
+class AsyncNode(Node):
+    '''
+    A Node on a redis.asyncio connection, so that many nodes can be talked
+    to from a single event loop instead of a thread per node.
+
+    Every method that talks to the server is a coroutine. The parsed state
+    (id, slots, flags, friends, ...) is the one of Node, so the mixins that
+    only read it, like check, work on AsyncNode as well. CLUSTER NODES is
+    only fetched by load_info and refresh, never implicitly.
+
+    Discovery, check and call run on AsyncNode. fix and the slot migrations
+    go through the many mutating methods of Node and stay on it, with
+    threads where they handle nodes concurrently.
+    '''
+
+    async def connect(self, ping=True):
+        if self._r:
+            return
+        xprint.verbose(f"Connecting to node {self}: ", end="")
+        try:
+            self._r = set_response_callbacks(
+                          redis.asyncio.StrictRedis(host=self.host, port=self.port,
+                                                    password=self._password,
+                                                    socket_timeout=SOCKET_TIMEOUT,
+                                                    decode_responses=True))
+            metrics = get_metrics()
+            if metrics:
+                metrics.instrument_async(self._r, str(self))
+            if ping:
+                await self._r.ping()
+        except redis.exceptions.RedisError as e:
+            xprint.verbose("FAIL", ignore_header=True)
+            self._r = None
+            raise NodeConnectionException(f"Sorry, can't connect to node '{self}'. Reason: {e}")
+        xprint.verbose("OK", ignore_header=True)
+
+    async def close(self):
+        if not self._r:
+            return
+        # aclose() replaced close() in redis-py 5.
+        close = getattr(self._r, 'aclose', None) or self._r.close
+        await close()
+        self._r = None
+
+    async def assert_cluster(self):
+        cluster_enabled = (await self._r.info()).get('cluster_enabled') or 0
+        if int(cluster_enabled) != 1:
+            raise AssertNodeException(f"Node {self} is not configured as a cluster node.")
+
+    async def load_info(self):
+        await self.refresh()
+        super().load_info()
+
+    async def refresh(self):
+        try:
+            self._cluster_nodes = await self._r.cluster('NODES')
+        except redis.exceptions.ResponseError as e:
+            raise LoadInfoFailureException(e)
+
+    async def cluster_info_and_id(self):
+        async with self._r.pipeline(transaction=False) as p:
+            p.cluster('INFO')
+            p.cluster('MYID')
+            return await p.execute()
+
+    def _refresh_cluster_nodes(self):
+        # Node refreshes CLUSTER NODES lazily, which can't be done without
+        # awaiting. The snapshot of the last refresh() is used instead.
+        pass
+
+    async def execute_command(self, *command):
+        return await self._r.execute_command(*command)
+
+    async def execute_pipeline(self, commands):
+        async with self._r.pipeline(transaction=False) as p:
+            for command in commands:
+                p.execute_command(*command)
+            return await p.execute(raise_on_error=False)
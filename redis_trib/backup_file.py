@@ -0,0 +1,249 @@
+'''
+Backup file layout (all integers big-endian):
+
+    header   MAGIC, version, flags
+    block*   stored length, raw length, records, data (zlib if compressed)
+    index    (slot, start offset, end offset, records) per extent
+    footer   index offset, index entries, MAGIC
+
+A block holds whole records:
+
+    slot, key length, pttl, payload length, key, DUMP payload
+
+The pttl of a record counts from the creation time of the backup in its
+manifest, -1 meaning no expiry.
+
+Since version 2 a block never mixes slots, and the index maps every slot
+to the byte ranges (extents) of its blocks. When records are written in
+slot order, which is how the backup command writes them, each slot is a
+single extent. Records written in any other order start a block and an
+extent at every change of slot. Readers map the file with mmap, so
+reading one slot only touches the pages of its extents.
+
+The writer keeps a single block and the index in memory, so the memory
+used does not depend on the size of the dataset.
+'''
+
+import mmap
+import struct
+import zlib
+
+
+MAGIC = b'RTRIBBK1'
+VERSION = 2
+FLAG_COMPRESSED = 0x01
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+_HEADER = struct.Struct('>8sBB')
+_BLOCK_HEADER = struct.Struct('>III')
+_RECORD_HEADER = struct.Struct('>HIqI')
+_INDEX_ENTRY = struct.Struct('>HQQI')
+_FOOTER = struct.Struct('>QI8s')
+
+
+class BackupFileError(Exception): pass
+
+
+class BackupWriter:
+
+    def __init__(self, path, compress=True, block_size=DEFAULT_BLOCK_SIZE):
+        self._path = path
+        self._compress = compress
+        self._block_size = block_size
+        self._f = open(path, 'wb')
+        self._f.write(_HEADER.pack(MAGIC, VERSION,
+                                   FLAG_COMPRESSED if compress else 0))
+        self._offset = _HEADER.size
+        self._block = bytearray()
+        self._block_records = 0
+        self._block_slot = None
+        self._extents = []
+        self._last_extent = {}
+        self._records = 0
+        self._bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def records(self):
+        return self._records
+
+    @property
+    def bytes_written(self):
+        return self._bytes
+
+    def write(self, slot, key, pttl, payload):
+        if self._block_records and slot != self._block_slot:
+            self.flush()
+
+        self._block += _RECORD_HEADER.pack(slot, len(key), pttl, len(payload))
+        self._block += key
+        self._block += payload
+        self._block_records += 1
+        self._block_slot = slot
+        self._records += 1
+        if len(self._block) >= self._block_size:
+            self.flush()
+
+    def flush(self):
+        if not self._block_records:
+            return
+
+        raw = bytes(self._block)
+        data = zlib.compress(raw, 1) if self._compress else raw
+        self._f.write(_BLOCK_HEADER.pack(len(data), len(raw), self._block_records))
+        self._f.write(data)
+
+        start = self._offset
+        self._offset += _BLOCK_HEADER.size + len(data)
+        self._bytes += len(raw)
+
+        # Grow the slot's last extent if this block follows it, otherwise
+        # the slot gets a new extent.
+        extent = self._last_extent.get(self._block_slot)
+        if extent and extent[2] == start:
+            extent[2] = self._offset
+            extent[3] += self._block_records
+        else:
+            extent = [self._block_slot, start, self._offset, self._block_records]
+            self._extents.append(extent)
+            self._last_extent[self._block_slot] = extent
+
+        self._block = bytearray()
+        self._block_records = 0
+
+    def close(self):
+        if self._f.closed:
+            return
+        self.flush()
+        index_offset = self._offset
+        for extent in sorted(self._extents):
+            self._f.write(_INDEX_ENTRY.pack(*extent))
+        self._f.write(_FOOTER.pack(index_offset, len(self._extents), MAGIC))
+        self._f.close()
+
+
+class BackupReader:
+
+    def __init__(self, path):
+        self._path = path
+        with open(path, 'rb') as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise BackupFileError(f"{path} is empty")
+
+        if len(self._mm) < _HEADER.size + _FOOTER.size:
+            self.close()
+            raise BackupFileError(f"{path} is not a backup file")
+        magic, self._version, self._flags = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise BackupFileError(f"{path} is not a backup file")
+        if self._version > VERSION:
+            self.close()
+            raise BackupFileError(f"{path} is a version {self._version} backup file, "
+                                  f"this version only reads up to version {VERSION}")
+        self._index_offset, self._index = self._read_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        for _, _, records in self.iter_blocks():
+            yield from records
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def index(self):
+        # {slot: [(start, end, records), ...]}
+        return self._index
+
+    @property
+    def slots(self):
+        return sorted(self._index)
+
+    @property
+    def records(self):
+        return sum(records for extents in self._index.values()
+                           for _, _, records in extents)
+
+    def _read_index(self):
+        index_offset, entries, magic = _FOOTER.unpack_from(
+                                           self._mm, len(self._mm) - _FOOTER.size)
+        if magic != MAGIC:
+            raise BackupFileError(f"{self._path} is truncated")
+
+        index = {}
+        for slot, start, end, records in _INDEX_ENTRY.iter_unpack(
+                self._mm[index_offset:index_offset + entries * _INDEX_ENTRY.size]):
+            index.setdefault(slot, []).append((start, end, records))
+        return index_offset, index
+
+    def iter_blocks(self, start=None, end=None):
+        '''
+        Yield (offset, next_offset, records) for the blocks between start
+        and end, by default the whole file.
+        '''
+        offset = start or _HEADER.size
+        end = min(end or self._index_offset, self._index_offset)
+        while offset < end:
+            stored_len, raw_len, num_records = _BLOCK_HEADER.unpack_from(self._mm, offset)
+            data_offset = offset + _BLOCK_HEADER.size
+            data = self._mm[data_offset:data_offset + stored_len]
+            if self._flags & FLAG_COMPRESSED:
+                data = zlib.decompress(data)
+            next_offset = data_offset + stored_len
+            yield offset, next_offset, list(_parse_records(data, num_records))
+            offset = next_offset
+
+    def iter_slots(self, slots, start=None):
+        '''
+        Like iter_blocks, but only read the extents of the given slots, in
+        file order, skipping the blocks before `start`. Only records of
+        these slots are returned.
+        '''
+        slots = set(slots)
+        for extent_start, extent_end in self._merge_extents(slots):
+            if start and extent_end <= start:
+                continue
+            for offset, next_offset, records in self.iter_blocks(
+                    max(extent_start, start or 0), extent_end):
+                yield offset, next_offset, [r for r in records if r[0] in slots]
+
+    def _merge_extents(self, slots):
+        # Version 1 extents of different slots may overlap.
+        merged = []
+        for start, end, _ in sorted(extent for slot in slots
+                                           for extent in self._index.get(slot, [])):
+            if merged and start < merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def close(self):
+        self._mm.close()
+
+
+def _parse_records(data, num_records):
+    pos = 0
+    for _ in range(num_records):
+        slot, key_len, pttl, payload_len = _RECORD_HEADER.unpack_from(data, pos)
+        pos += _RECORD_HEADER.size
+        key = data[pos:pos+key_len]
+        pos += key_len
+        payload = data[pos:pos+payload_len]
+        pos += payload_len
+        yield slot, key, pttl, payload
@@ -6,6 +6,7 @@ from .xprint import xprint
 from .const import CLUSTER_HASH_SLOTS
 from functools import wraps
 from .util import group_by, summarize_slots
+from .metrics import get_metrics
 from .exceptions import (
     NodeConnectionException,
     AssertNodeException,
@@ -13,8 +14,21 @@ from .exceptions import (
 )
 
 
-from .monkey_patch import patch_redis_module
-patch_redis_module()
+from .monkey_patch.redis_ import set_response_callbacks
+
+
+# Seconds a command may take before the client gives up on the node.
+SOCKET_TIMEOUT = 5
+
+# Length command of each data type, as returned by TYPE.
+_LENGTH_COMMANDS = {
+    b'string': 'STRLEN',
+    b'list': 'LLEN',
+    b'hash': 'HLEN',
+    b'set': 'SCARD',
+    b'zset': 'ZCARD',
+    b'stream': 'XLEN',
+}
 
 
 class Node:
@@ -41,11 +55,16 @@ class Node:
         self._replicas = []
         self._dirty = False
         self._r = None
+        self._raw_r = None
+        self._migrate_r = None
+        self._migrate_socket_timeout = None
         self._friends = []
         self._cluster_nodes = None
+        self._cached = False
         self._dbsize = None
         self._weight = None
         self._balance = 0
+        self._stats = {}
 
     def __eq__(self, obj):
         return self is obj
@@ -77,6 +96,11 @@ class Node:
     def master_addr(self):
         return self._master_addr
     
+    @property
+    def cached(self):
+        # Loaded from a TopologyCache rather than from its own CLUSTER NODES.
+        return self._cached
+
     @property
     def replicate(self):
         return self._replicate
@@ -97,6 +121,21 @@ class Node:
     def r(self):
         return self._r
 
+    @property
+    def raw_r(self):
+        # Connection without response decoding, for binary keys and DUMP
+        # payloads.
+        if not self._raw_r:
+            self._raw_r = set_response_callbacks(
+                              redis.StrictRedis(self.host, self.port,
+                                                password=self._password,
+                                                socket_timeout=60,
+                                                decode_responses=False))
+            metrics = get_metrics()
+            if metrics:
+                metrics.instrument(self._raw_r, str(self))
+        return self._raw_r
+
     @property
     def migrating(self):
         return self._migrating
@@ -127,6 +166,22 @@ class Node:
             self._dbsize = self._r.dbsize()
         return self._dbsize
 
+    @property
+    def stats(self):
+        return self._stats
+
+    def load_stats(self):
+        # DBSIZE and the INFO sections used by `info`, in one round trip.
+        with self._r.pipeline(transaction=False) as p:
+            p.dbsize()
+            for section in ('memory', 'keyspace', 'stats'):
+                p.info(section)
+            dbsize, memory, keyspace, stats = p.execute()
+
+        self._dbsize = dbsize
+        self._stats = {**memory, **keyspace, **stats}
+        return self._stats
+
     @property
     def friends(self):
         for addr, n in  self._get_cluster_nodes().items():
@@ -154,15 +209,22 @@ class Node:
     def add_replica(self, node):
         self.replicas.append(node)
 
-    def connect(self):
+    def connect(self, ping=True):
+        # Without ping, the connection is only made by the first command.
         if self._r:
             return
         xprint.verbose(f"Connecting to node {self}: ", end="")
         try:
-            self._r = redis.StrictRedis(self.host, self.port,
-                                        password=self._password,
-                                        socket_timeout=5, decode_responses=True)
-            self._r.ping()
+            self._r = set_response_callbacks(
+                          redis.StrictRedis(self.host, self.port,
+                                            password=self._password,
+                                            socket_timeout=SOCKET_TIMEOUT,
+                                            decode_responses=True))
+            metrics = get_metrics()
+            if metrics:
+                metrics.instrument(self._r, str(self))
+            if ping:
+                self._r.ping()
         except redis.exceptions.RedisError as e:
             xprint.verbose("FAIL", ignore_header=True)
             self._r = None
@@ -188,22 +250,35 @@ class Node:
 
     def load_info(self):
         for k, n in self._get_cluster_nodes().items():
-            flags = self._parse_flags(n.get('flags'))
-            if 'myself' in flags:
-                host, port = k.split('@')[0].split(':')[:2]
-                if host:
-                    self._host, self._port = host, port
-                self._node_id = n['node_id']
-                self._flags = flags
-                if n['master_id'] != '-':
-                    self._replicate = n['master_id']
-                slots = self._parse_slots(n['slots'])
-                self.add_slots(slots)
-                self._migrating = n['migrating']
-                self._importing = n['importing']
-                self._dirty = False
+            if 'myself' in self._parse_flags(n.get('flags')):
+                self.load_entry(k, n)
                 break
 
+    def load_entry(self, addr, n, cached=False):
+        # Load the state of this node from its parsed CLUSTER NODES line,
+        # which may come from the view of another node.
+        flags = self._parse_flags(n.get('flags'))
+        host, port = addr.split('@')[0].split(':')[:2]
+        if host:
+            self._host, self._port = host, port
+        self._node_id = n['node_id']
+        self._flags = flags
+        self._cached = cached
+        if n['master_id'] != '-':
+            self._replicate = n['master_id']
+        slots = self._parse_slots(n['slots'])
+        self.add_slots(slots)
+        self._migrating = n['migrating']
+        self._importing = n['importing']
+        self._dirty = False
+
+    def cluster_info_and_id(self):
+        # CLUSTER INFO and CLUSTER MYID in one round trip.
+        with self._r.pipeline(transaction=False) as p:
+            p.cluster('INFO')
+            p.cluster('MYID')
+            return p.execute()
+
     def _parse_flags(self, flags):
         return flags.split(',')
 
@@ -245,6 +320,7 @@ class Node:
         if not isinstance(slots, (list, tuple, range)):
             slots = [slots] 
 
+        slots = set(slots)
         self._slots = {s: v for s, v in self._slots.items()
                        if s not in slots}
 
@@ -320,16 +396,16 @@ class Node:
         self._r.cluster('BUMPEPOCH')
 
     def cluster_setslot_importing(self, slot, source):
-        self._cluster_setslot(slot, ClusterNode._IMPORTING, source.node_id)
+        self._cluster_setslot(slot, Node._IMPORTING, source.node_id)
 
     def cluster_setslot_migrating(self, slot, target):
-        self._cluster_setslot(slot, ClusterNode._MIGRATING, target.node_id)
+        self._cluster_setslot(slot, Node._MIGRATING, target.node_id)
 
     def cluster_setslot_stable(self, slot):
-        self._cluster_setslot(slot, ClusterNode._STABLE)
+        self._cluster_setslot(slot, Node._STABLE)
 
     def cluster_setslot_node(self, slot, target):
-        self._cluster_setslot(slot, ClusterNode._NODE, target.node_id)
+        self._cluster_setslot(slot, Node._NODE, target.node_id)
 
     def _cluster_setslot(self, slot, subcommand, node_id=None):
         cluster_setslot_cmd = ['SETSLOT', slot, subcommand]
@@ -343,11 +419,191 @@ class Node:
     def cluster_count_keys_in_slot(self, slot):
         return self._r.cluster('COUNTKEYSINSLOT', slot)
 
+    def execute_pipeline(self, commands):
+        # Send all commands in one round trip. Errors are returned in place
+        # of the failed command's result instead of being raised.
+        with self._r.pipeline(transaction=False) as p:
+            for command in commands:
+                p.execute_command(*command)
+            return p.execute(raise_on_error=False)
+
+    def scan_pages(self, count=1000, match=None):
+        # Yield SCAN pages of raw (bytes) keys until the cursor wraps.
+        cursor = 0
+        while True:
+            cursor, keys = self.raw_r.scan(cursor, match=match, count=count)
+            if keys:
+                yield keys
+            if cursor == 0:
+                break
+
+    def count_keys_in_slots(self, slots):
+        # Pipelined CLUSTER COUNTKEYSINSLOT, one count per slot.
+        with self._r.pipeline(transaction=False) as p:
+            for slot in slots:
+                p.cluster('COUNTKEYSINSLOT', slot)
+            return p.execute()
+
+    def get_all_keys_in_slot(self, slot):
+        # Every key of the slot as raw bytes.
+        count = self.cluster_count_keys_in_slot(slot)
+        if not count:
+            return []
+        return self.get_raw_keys_in_slot(slot, count)
+
+    def get_raw_keys_in_slot(self, slot, count):
+        # CLUSTER GETKEYSINSLOT with the keys as raw bytes.
+        return self.raw_r.execute_command('CLUSTER', 'GETKEYSINSLOT', slot, count)
+
+    def object_idletime(self, keys):
+        # Pipelined OBJECT IDLETIME. Entries are None for vanished keys and
+        # an exception when the server can't tell (e.g. LFU maxmemory policy).
+        with self.raw_r.pipeline(transaction=False) as p:
+            for k in keys:
+                p.object('IDLETIME', k)
+            return p.execute(raise_on_error=False)
+
+    def dump_keys(self, keys):
+        # Pipelined DUMP + PTTL. Returns (payload, pttl) per key, payload is
+        # None if the key vanished meanwhile. In a migrating slot, a
+        # vanished key is redirected with ASK rather than missing.
+        with self.raw_r.pipeline(transaction=False) as p:
+            for k in keys:
+                p.dump(k)
+                p.pttl(k)
+            replies = p.execute(raise_on_error=False)
+        for r in replies:
+            if isinstance(r, Exception) and not str(r).startswith('ASK '):
+                raise r
+        replies = [None if isinstance(r, Exception) else r for r in replies]
+        return list(zip(replies[0::2], replies[1::2]))
+
+    def restore_keys(self, records, replace=True, asking=False):
+        # Pipelined RESTORE of (key, expire_at_ms, payload) records, 0 means
+        # no expiry. Returns the errors, if any.
+        return [r for r in self.restore_replies(records, replace, asking)
+                if isinstance(r, Exception)]
+
+    def restore_replies(self, records, replace=True, asking=False):
+        # Same as restore_keys, with one reply per record. With asking, each
+        # RESTORE follows an ASKING, for a slot this node is importing.
+        with self.raw_r.pipeline(transaction=False) as p:
+            for key, expire_at, payload in records:
+                args = ['RESTORE', key, expire_at, payload]
+                if replace:
+                    args.append('REPLACE')
+                if expire_at:
+                    args.append('ABSTTL')
+                if asking:
+                    p.execute_command('ASKING')
+                p.execute_command(*args)
+            replies = p.execute(raise_on_error=False)
+        return replies[1::2] if asking else replies
+
+    def unlink_keys(self, keys):
+        # Pipelined UNLINK, one reply per key: 0 or an ASK error for the
+        # keys that are already gone.
+        with self.raw_r.pipeline(transaction=False) as p:
+            for k in keys:
+                p.unlink(k)
+            return p.execute(raise_on_error=False)
+
+    def key_types(self, keys):
+        # Pipelined TYPE, as raw bytes (b'none' for vanished keys).
+        with self.raw_r.pipeline(transaction=False) as p:
+            for k in keys:
+                p.type(k)
+            return p.execute()
+
+    def key_lengths(self, keys, types):
+        # Pipelined STRLEN/LLEN/HLEN/... according to each key's type. Keys
+        # of unknown type get None.
+        lengths = [None] * len(keys)
+        with self.raw_r.pipeline(transaction=False) as p:
+            queued = []
+            for i, (k, t) in enumerate(zip(keys, types)):
+                cmd = _LENGTH_COMMANDS.get(t)
+                if cmd:
+                    p.execute_command(cmd, k)
+                    queued.append(i)
+            for i, length in zip(queued, p.execute(raise_on_error=False)):
+                lengths[i] = None if isinstance(length, Exception) else length
+        return lengths
+
+    def memory_usage(self, keys, samples=None):
+        # Pipelined MEMORY USAGE, one entry per key (None if the key is gone).
+        with self._r.pipeline(transaction=False) as p:
+            for k in keys:
+                p.memory_usage(k, samples=samples)
+            return p.execute()
+
+    def key_weights(self, keys, hot=False, samples=None):
+        # Pipelined TYPE and MEMORY USAGE, or OBJECT FREQ if hot, as one
+        # (type, weight) per key. The weight is None for vanished keys and
+        # an exception when the server refuses (e.g. FREQ without LFU).
+        with self.raw_r.pipeline(transaction=False) as p:
+            for k in keys:
+                p.type(k)
+                if hot:
+                    p.object('FREQ', k)
+                else:
+                    p.memory_usage(k, samples=samples)
+            replies = p.execute(raise_on_error=False)
+        return list(zip(replies[::2], replies[1::2]))
+
+    def random_keys(self, count):
+        # Pipelined RANDOMKEY, as raw bytes, without the None of an empty
+        # node. The same key may come more than once.
+        with self.raw_r.pipeline(transaction=False) as p:
+            for _ in range(count):
+                p.randomkey()
+            return [k for k in p.execute() if k is not None]
+
+    def probe_slots(self, slots, count):
+        # Pipelined COUNTKEYSINSLOT and GETKEYSINSLOT, one (keys in the
+        # slot, up to `count` of its raw keys) per slot.
+        with self.raw_r.pipeline(transaction=False) as p:
+            for slot in slots:
+                p.execute_command('CLUSTER', 'COUNTKEYSINSLOT', slot)
+                p.execute_command('CLUSTER', 'GETKEYSINSLOT', slot, count)
+            replies = p.execute()
+        return list(zip(replies[::2], replies[1::2]))
+
+    def key_samples(self, keys, samples=None):
+        # Pipelined TYPE, MEMORY USAGE and PTTL, one (type, size, pttl) per
+        # key. The size is None and the pttl -2 for vanished keys.
+        with self.raw_r.pipeline(transaction=False) as p:
+            for k in keys:
+                p.type(k)
+                p.memory_usage(k, samples=samples)
+                p.pttl(k)
+            replies = p.execute(raise_on_error=False)
+        return list(zip(replies[::3], replies[1::3], replies[2::3]))
+
     def migrate(self, host, port, keys_in_slot, timeout=None,
             auth=None, copy=False, replace=False):
-        self._r.migrate(host, port, keys_in_slot, 0, timeout,
+        # MIGRATE may take up to `timeout` ms to reply: longer ones are sent
+        # on a connection that waits for them.
+        r = self._r
+        if timeout and timeout / 1000 >= SOCKET_TIMEOUT:
+            r = self._get_migrate_r(timeout / 1000 + SOCKET_TIMEOUT)
+        r.migrate(host, port, keys_in_slot, 0, timeout,
                 copy=copy, replace=replace, auth=auth)
 
+    def _get_migrate_r(self, socket_timeout):
+        # Kept for the longest socket timeout asked for so far.
+        if not self._migrate_r or self._migrate_socket_timeout < socket_timeout:
+            self._migrate_r = set_response_callbacks(
+                                  redis.StrictRedis(self.host, self.port,
+                                                    password=self._password,
+                                                    socket_timeout=socket_timeout,
+                                                    decode_responses=True))
+            self._migrate_socket_timeout = socket_timeout
+            metrics = get_metrics()
+            if metrics:
+                metrics.instrument(self._migrate_r, str(self))
+        return self._migrate_r
+
     def shutdown(self, rename_commands=None):
         try:
             self._execute_with_rename_commands('SHUTDOWN',
@@ -1,6 +1,12 @@
+import asyncio
+
 from .trib import RedisTrib
-from .factory import NodeFactory, NodesFactory
+from .factory import NodeFactory, NodesFactory, AsyncNodesFactory
+from .topology_cache import TopologyCache
 from .xprint import xprint
+from .mixins.call_cluster import parse_command_lines
+from .mixins.backup_cluster import extract_backup
+from .util import parse_slots_expression
 from .exceptions import (
     RedisTribException,
     NodeException,
@@ -20,16 +26,27 @@ def create_cluster_command(addrs, password, replicas, yes):
         xprint.error(e)
 
 
-def info_cluster_command(addr, password):
-    nodes, unreachable_masters = NodesFactory.create_nodes_with_friends(addr, password)
+def info_cluster_command(addr, password, use_cache=True, sample=0):
+    cache = TopologyCache() if use_cache else None
+    nodes, unreachable_masters = NodesFactory.create_nodes_with_friends(addr, password,
+                                                                        cache)
     redis_trib = RedisTrib(nodes, unreachable_masters=unreachable_masters)
-    redis_trib.show()
+    redis_trib.show(sample=sample)
 
 
 def check_cluster_command(addr, password):
-    nodes, unreachable_masters = NodesFactory.create_nodes_with_friends(addr, password)
-    redis_trib = RedisTrib(nodes, unreachable_masters=unreachable_masters)
-    redis_trib.check()
+    asyncio.run(_check_cluster(addr, password))
+
+
+async def _check_cluster(addr, password):
+    # check only reads the CLUSTER NODES of every node, loaded concurrently.
+    nodes, unreachable_masters = await AsyncNodesFactory.create_nodes_with_friends(
+                                          addr, password)
+    try:
+        redis_trib = RedisTrib(nodes, unreachable_masters=unreachable_masters)
+        redis_trib.check()
+    finally:
+        await asyncio.gather(*(n.close() for n in nodes))
 
 
 def add_node_command(addr, new_addr, password, is_slave, master_id, addr_as_master):
@@ -49,19 +66,21 @@ def delete_node_command(addr, del_node_id, password, rename_commands):
 
 
 def reshard_cluster_command(addr, password, from_ids, to_id,
-        pipeline, timeout, num_slots, yes):
+        pipeline, timeout, num_slots, yes, estimate=False, **migrate_opts):
     nodes, _ = NodesFactory.create_nodes_with_friends(addr, password)
     redis_trib = RedisTrib(nodes, password)
     redis_trib.check()
-    redis_trib.reshard_cluster(from_ids, to_id, pipeline, timeout, num_slots, yes=False)
+    redis_trib.reshard_cluster(from_ids, to_id, pipeline, timeout, num_slots,
+                               yes=yes, estimate=estimate, **migrate_opts)
 
 
 def rebalance_cluster_command(addr, password, weights, use_empty_masters,
-        pipeline, timeout, threshold, simulate):
+        pipeline, timeout, threshold, simulate, estimate=False, **migrate_opts):
     nodes, _ = NodesFactory.create_nodes_with_friends(addr, password)
     redis_trib = RedisTrib(nodes, password)
     redis_trib.check()
-    redis_trib.rebalance_cluster(weights, use_empty_masters, pipeline, timeout, threshold, simulate)
+    redis_trib.rebalance_cluster(weights, use_empty_masters, pipeline, timeout,
+                                 threshold, simulate, estimate, **migrate_opts)
 
 
 def fix_cluster_command(addr, password):
@@ -71,26 +90,116 @@ def fix_cluster_command(addr, password):
     redis_trib.fix()
 
 
-def call_cluster_command(addr, password, *command):
+def call_cluster_command(addr, password, *command, parallel, role,
+                         batch_file=None, output_format='json', use_cache=True):
+    commands = parse_command_lines(batch_file) if batch_file else None
+    cache = TopologyCache() if use_cache else None
+    asyncio.run(_call_cluster(addr, password, command, commands, parallel, role,
+                              output_format, cache))
+
+
+async def _call_cluster(addr, password, command, commands, parallel, role,
+                        output_format, cache=None):
     import sys, os
     old_stdout = sys.stdout
     try:
         f = open(os.devnull, 'w')
         sys.stdout = f
 
-        nodes, _ = NodesFactory.create_nodes_with_friends(addr, password)
+        nodes, _ = await AsyncNodesFactory.create_nodes_with_friends(addr, password,
+                                                                     cache)
         redis_trib = RedisTrib(nodes, password)
-        redis_trib.check(quiet=True)
+        # A cached topology was validated against a few nodes instead: its
+        # nodes have no CLUSTER NODES of their own to compare, and async
+        # nodes can't fetch it lazily.
+        if not any(n.cached for n in nodes):
+            redis_trib.check(quiet=True)
     finally:
         if f: f.close()
         sys.stdout = old_stdout
 
-    redis_trib.call(*command)
+    try:
+        if commands is not None:
+            await redis_trib.call_batch_async(commands, parallel=parallel, role=role,
+                                              output_format=output_format)
+        else:
+            await redis_trib.call_async(*command, parallel=parallel, role=role)
+    finally:
+        await asyncio.gather(*(n.close() for n in nodes))
 
 
-def import_cluster_command(addr, password, from_addr, from_password, replace, copy):
+def import_cluster_command(addr, password, from_addr, from_password, replace, copy,
+                          **sync_opts):
     nodes, _ = NodesFactory.create_nodes_with_friends(addr, password)
     redis_trib = RedisTrib(nodes, password)
     redis_trib.check()
-    redis_trib.import_cluster(from_addr, from_password, replace, copy)
+    redis_trib.import_cluster(from_addr, from_password, replace, copy, **sync_opts)
+
+
+
+def backup_cluster_command(addr, password, backup_dir, count, compress, parallel,
+                           slots=None, incremental_from=None, by_slot=False):
+    nodes, _ = NodesFactory.create_nodes_with_friends(addr, password)
+    redis_trib = RedisTrib(nodes, password)
+    redis_trib.check()
+    redis_trib.backup(backup_dir, count, compress, parallel,
+                      slots=parse_slots_expression(slots) if slots else None,
+                      incremental_from=incremental_from, by_slot=by_slot)
+
+
+def restore_cluster_command(addr, password, backup_dir, batch, rate, resume,
+                            slots=None):
+    nodes, _ = NodesFactory.create_nodes_with_friends(addr, password)
+    redis_trib = RedisTrib(nodes, password)
+    redis_trib.check()
+    redis_trib.restore(backup_dir, batch, rate, resume,
+                       slots=parse_slots_expression(slots) if slots else None)
+
 
+def extract_backup_command(backup_dir, out_dir, slots, compress):
+    entries = extract_backup(backup_dir, out_dir, parse_slots_expression(slots),
+                             compress)
+    xprint.ok(f"{sum(e['keys'] for e in entries)} keys extracted to {out_dir}.")
+
+
+def verify_cluster_command(addr, password, from_addr, from_password, backup_dir,
+                           mode, slots, count, parallel, drill_down):
+    nodes, _ = NodesFactory.create_nodes_with_friends(addr, password)
+    redis_trib = RedisTrib(nodes, password)
+    redis_trib.check()
+    source_nodes = None
+    if from_addr:
+        source_nodes = NodesFactory.create_nodes_or_standalone(from_addr, from_password)
+    redis_trib.verify(source_nodes, backup_dir, mode,
+                      slots=parse_slots_expression(slots) if slots else None,
+                      count=count, parallel=parallel, drill_down=drill_down)
+
+
+def watch_cluster_command(addr, password, interval, nodes_per_tick, output_format):
+    nodes, _ = NodesFactory.create_nodes_with_friends(addr, password)
+    redis_trib = RedisTrib(nodes, password)
+    try:
+        redis_trib.watch(interval, nodes_per_tick=nodes_per_tick,
+                         output_format=output_format)
+    except KeyboardInterrupt:
+        pass
+
+
+def heatmap_cluster_command(addr, password, top, batch, parallel, output):
+    nodes, _ = NodesFactory.create_nodes_with_friends(addr, password)
+    redis_trib = RedisTrib(nodes, password)
+    redis_trib.heatmap(top, batch, parallel, output)
+
+
+def bigkeys_cluster_command(addr, password, top, slot_top, count, hot, samples,
+                            parallel, output):
+    nodes, _ = NodesFactory.create_nodes_with_friends(addr, password)
+    redis_trib = RedisTrib(nodes, password)
+    redis_trib.bigkeys(top, slot_top, count, hot, samples, parallel, output)
+
+
+def sample_cluster_command(addr, password, size, by_slot, probe_keys, batch,
+                           parallel, output):
+    nodes, _ = NodesFactory.create_nodes_with_friends(addr, password)
+    redis_trib = RedisTrib(nodes, password)
+    redis_trib.sample(size, by_slot, probe_keys, batch, parallel, output)
@@ -9,6 +9,7 @@ class AssertNodeException(NodeException): pass
 class LoadInfoFailureException(NodeException): pass
 
 class TooSmallMastersError(RedisTribException): pass
+class MigrationStalledException(RedisTribException): pass
 
 class CreateClusterException(Exception): pass
 class UnassignedNodesRemain(CreateClusterException): pass
@@ -1,6 +1,10 @@
+import asyncio
+
 from .cluster_node import Node
+from .async_node import AsyncNode
 from .exceptions import (
     NodeConnectionException,
+    AssertNodeException,
     LoadInfoFailureException,
 )
 from .xprint import xprint
@@ -36,6 +40,30 @@ class NodeFactory:
         return None
 
 
+class AsyncNodeFactory:
+    @classmethod
+    async def create_normal_node(cls, addr, password):
+        node = AsyncNode(addr, password)
+        await node.connect()
+        await node.assert_cluster()
+        await node.load_info()
+        return node
+
+    @classmethod
+    async def create_friend_node(cls, addr, password):
+        node = AsyncNode(addr, password)
+        try:
+            await node.connect()
+            await node.load_info()
+            return node
+        except NodeConnectionException as e:
+            xprint.error(e)
+        except LoadInfoFailureException as e:
+            xprint.error(f"Unable to load info for node {node}: {e}")
+        await node.close()
+        return None
+
+
 class NodesFactory:
     @classmethod
     def create_new_nodes(cls, addrs, password):
@@ -51,7 +79,15 @@ class NodesFactory:
         return nodes
 
     @classmethod
-    def create_nodes_with_friends(cls, addr, password):
+    def create_nodes_with_friends(cls, addr, password, cache=None):
+        # With a TopologyCache, the cached topology is used as long as it
+        # is still valid, and refreshed otherwise.
+        if cache:
+            cached = cache.load_nodes(addr, password, Node)
+            if cached:
+                cls._populate_nodes_replicas_info(cached[0])
+                return cached
+
         nodes = []
         unreachable_masters = 0
 
@@ -69,9 +105,24 @@ class NodesFactory:
 
 
         cls._populate_nodes_replicas_info(nodes)
+        if cache:
+            info, _ = node.cluster_info_and_id()
+            cache.save(addr, node._get_cluster_nodes(), info, unreachable_masters)
 
         return nodes, unreachable_masters
 
+    @classmethod
+    def create_nodes_or_standalone(cls, addr, password):
+        # Like create_nodes_with_friends, but a standalone (non cluster)
+        # server is accepted as a single node.
+        try:
+            nodes, _ = cls.create_nodes_with_friends(addr, password)
+        except AssertNodeException:
+            node = Node(addr, password)
+            node.connect()
+            nodes = [node]
+        return nodes
+
     @classmethod
     def _populate_nodes_replicas_info(cls, nodes):
         for n in nodes:
@@ -82,3 +133,32 @@ class NodesFactory:
                     continue
                 master.add_replica(n)
 
+
+class AsyncNodesFactory:
+    @classmethod
+    async def create_nodes_with_friends(cls, addr, password, cache=None):
+        # Like NodesFactory.create_nodes_with_friends, with the friends
+        # connected and loaded concurrently.
+        if cache:
+            cached = await cache.load_nodes_async(addr, password, AsyncNode)
+            if cached:
+                NodesFactory._populate_nodes_replicas_info(cached[0])
+                return cached
+
+        node = await AsyncNodeFactory.create_normal_node(addr, password)
+        friends = [(faddr, flags) for faddr, flags in node.friends
+                   if not set(flags) & set(['noaddr', 'disconnected', 'fail'])]
+        fnodes = await asyncio.gather(
+                     *(AsyncNodeFactory.create_friend_node(faddr, password)
+                       for faddr, _ in friends))
+
+        nodes = [node] + [fnode for fnode in fnodes if fnode]
+        unreachable_masters = sum(1 for fnode, (_, flags) in zip(fnodes, friends)
+                                  if not fnode and 'master' in flags)
+
+        NodesFactory._populate_nodes_replicas_info(nodes)
+        if cache:
+            info, _ = await node.cluster_info_and_id()
+            cache.save(addr, node._cluster_nodes, info, unreachable_masters)
+
+        return nodes, unreachable_masters
@@ -0,0 +1,265 @@
+'''
+Metrics of the Redis round trips, per node and command, and of the keys
+and bytes moved per slot.
+
+Metrics are off unless enable_metrics() is called, before the nodes
+connect. Connections are then wrapped as they are created, so when
+metrics are off no command pays anything for them. At exit, a JSON
+summary and/or a Prometheus text file (for the node_exporter textfile
+collector) are written.
+'''
+
+import atexit
+import bisect
+import json
+import threading
+import time
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PIPELINE = 'PIPELINE'
+
+_metrics = None
+
+
+def get_metrics():
+    return _metrics
+
+
+def enable_metrics(json_path=None, prometheus_path=None):
+    global _metrics
+    _metrics = Metrics()
+    if json_path:
+        atexit.register(_metrics.write_json, json_path)
+    if prometheus_path:
+        atexit.register(_metrics.write_prometheus, prometheus_path)
+    return _metrics
+
+
+def disable_metrics():
+    global _metrics
+    _metrics = None
+
+
+def command_name(args):
+    name = args[0].decode() if isinstance(args[0], bytes) else str(args[0])
+    name = name.upper()
+    # redis-py sends some subcommands as part of the name ('CLUSTER NODES').
+    if name in ('CLUSTER', 'CONFIG', 'OBJECT', 'MEMORY', 'CLIENT') and len(args) > 1:
+        sub = args[1].decode() if isinstance(args[1], bytes) else str(args[1])
+        name = f"{name} {sub.upper()}"
+    return name
+
+
+class Histogram:
+
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-quantile.
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.latencies = {}
+        self.errors = {}
+        self.pipelined = {}
+        self.slots = {}
+
+    def observe(self, node, command, seconds, error=False):
+        with self._lock:
+            key = (node, command)
+            histogram = self.latencies.get(key)
+            if histogram is None:
+                histogram = self.latencies[key] = Histogram()
+            histogram.observe(seconds)
+            if error:
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def observe_pipeline(self, node, commands, seconds, error=False):
+        # A pipeline is one round trip, its commands are only counted.
+        self.observe(node, PIPELINE, seconds, error)
+        with self._lock:
+            for command in commands:
+                key = (node, command)
+                self.pipelined[key] = self.pipelined.get(key, 0) + 1
+
+    def record_slot(self, slot, source, target, keys, nbytes, seconds):
+        with self._lock:
+            stats = self.slots.setdefault(slot, {'source': source, 'target': target,
+                                                 'keys': 0, 'bytes': 0, 'seconds': 0.0})
+            stats.update(source=source, target=target)
+            stats['keys'] += keys
+            stats['bytes'] += nbytes or 0
+            stats['seconds'] += seconds
+
+    def instrument(self, client, node):
+        '''
+        Time every command and pipeline of a redis-py client, as `node`.
+        '''
+        execute_command = client.execute_command
+        make_pipeline = client.pipeline
+
+        def timed_execute_command(*args, **options):
+            start = time.perf_counter()
+            error = True
+            try:
+                result = execute_command(*args, **options)
+                error = False
+                return result
+            finally:
+                self.observe(node, command_name(args), time.perf_counter() - start, error)
+
+        def pipeline(*args, **kwargs):
+            p = make_pipeline(*args, **kwargs)
+            execute = p.execute
+
+            def timed_execute(*args, **kwargs):
+                commands = [command_name(c[0]) for c in p.command_stack]
+                start = time.perf_counter()
+                error = True
+                try:
+                    result = execute(*args, **kwargs)
+                    error = False
+                    return result
+                finally:
+                    self.observe_pipeline(node, commands, time.perf_counter() - start,
+                                          error)
+            p.execute = timed_execute
+            return p
+
+        client.execute_command = timed_execute_command
+        client.pipeline = pipeline
+        return client
+
+    def instrument_async(self, client, node):
+        '''
+        Like instrument, for a redis.asyncio client.
+        '''
+        execute_command = client.execute_command
+        make_pipeline = client.pipeline
+
+        async def timed_execute_command(*args, **options):
+            start = time.perf_counter()
+            error = True
+            try:
+                result = await execute_command(*args, **options)
+                error = False
+                return result
+            finally:
+                self.observe(node, command_name(args), time.perf_counter() - start, error)
+
+        def pipeline(*args, **kwargs):
+            p = make_pipeline(*args, **kwargs)
+            execute = p.execute
+
+            async def timed_execute(*args, **kwargs):
+                commands = [command_name(c[0]) for c in p.command_stack]
+                start = time.perf_counter()
+                error = True
+                try:
+                    result = await execute(*args, **kwargs)
+                    error = False
+                    return result
+                finally:
+                    self.observe_pipeline(node, commands, time.perf_counter() - start,
+                                          error)
+            p.execute = timed_execute
+            return p
+
+        client.execute_command = timed_execute_command
+        client.pipeline = pipeline
+        return client
+
+    def summary(self):
+        with self._lock:
+            commands = [{
+                'node': node,
+                'command': command,
+                'count': h.count,
+                'errors': self.errors.get((node, command), 0),
+                'seconds': round(h.sum, 6),
+                'p50': h.quantile(0.5),
+                'p99': h.quantile(0.99),
+                'max': round(h.max, 6),
+            } for (node, command), h in sorted(self.latencies.items())]
+            pipelined = [{'node': node, 'command': command, 'count': count}
+                         for (node, command), count in sorted(self.pipelined.items())]
+            slots = {slot: dict(stats) for slot, stats in sorted(self.slots.items())}
+
+        return {
+            'started_at': self.started_at,
+            'duration': time.time() - self.started_at,
+            'commands': commands,
+            'pipelined': pipelined,
+            'slots': slots,
+            'keys_moved': sum(s['keys'] for s in slots.values()),
+            'bytes_moved': sum(s['bytes'] for s in slots.values()),
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=4)
+
+    def write_prometheus(self, path):
+        with open(path, 'w') as f:
+            f.write(self.prometheus_text())
+
+    def prometheus_text(self):
+        lines = [
+            '# HELP redis_trib_command_duration_seconds Round trip time of Redis commands.',
+            '# TYPE redis_trib_command_duration_seconds histogram',
+        ]
+        with self._lock:
+            for (node, command), h in sorted(self.latencies.items()):
+                labels = f'node="{node}",command="{command}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), h.counts):
+                    cumulative += count
+                    lines.append(f'redis_trib_command_duration_seconds_bucket'
+                                 f'{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'redis_trib_command_duration_seconds_sum{{{labels}}} {h.sum}')
+                lines.append(f'redis_trib_command_duration_seconds_count{{{labels}}} {h.count}')
+
+            lines += ['# HELP redis_trib_command_errors_total Failed Redis commands.',
+                      '# TYPE redis_trib_command_errors_total counter']
+            lines += [f'redis_trib_command_errors_total{{node="{node}",command="{command}"}} {count}'
+                      for (node, command), count in sorted(self.errors.items())]
+
+            lines += ['# HELP redis_trib_pipelined_commands_total Commands sent in pipelines.',
+                      '# TYPE redis_trib_pipelined_commands_total counter']
+            lines += [f'redis_trib_pipelined_commands_total{{node="{node}",command="{command}"}} {count}'
+                      for (node, command), count in sorted(self.pipelined.items())]
+
+            for name, field, help_text in (
+                    ('keys', 'keys', 'Keys moved per slot.'),
+                    ('bytes', 'bytes', 'Bytes moved per slot, when key sizes are probed.')):
+                lines += [f'# HELP redis_trib_slot_{name}_moved_total {help_text}',
+                          f'# TYPE redis_trib_slot_{name}_moved_total counter']
+                lines += [f'redis_trib_slot_{name}_moved_total{{slot="{slot}"}} {stats[field]}'
+                          for slot, stats in sorted(self.slots.items())]
+        return '\n'.join(lines) + '\n'
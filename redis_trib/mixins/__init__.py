@@ -10,4 +10,11 @@ from .rebalance_cluster import RebalanceCluster
 from .fix_cluster import FixCluster
 from .call_cluster import CallCluster
 from .import_cluster import ImportCluster
+from .backup_cluster import BackupCluster
+from .restore_cluster import RestoreCluster
+from .verify_cluster import VerifyCluster
+from .watch_cluster import WatchCluster
+from .heatmap_cluster import HeatmapCluster
+from .bigkeys_cluster import BigKeysCluster
+from .sample_cluster import SampleCluster
 
@@ -0,0 +1,240 @@
+import json
+import os
+import time
+
+from ..backup_file import BackupWriter, BackupReader
+from ..progress import Progress
+from ..slot_sort import SlotSorter
+from ..util import (
+    parallel_map,
+    summarize_slots,
+    chunk,
+    fold_digest,
+    DEFAULT_PARALLEL,
+)
+from ..xprint import xprint
+from .import_cluster import key_to_slot
+
+
+MANIFEST_FILE = 'manifest.json'
+BACKUP_FILE_EXT = '.rtb'
+
+
+def load_manifest(backup_dir):
+    with open(os.path.join(backup_dir, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def merge_slot_digests(manifest):
+    # {slot: [keys, digest]} over every master of a backup manifest.
+    slot_digests = {}
+    for entry in manifest['masters']:
+        for slot, digest in entry.get('slot_digests', {}).items():
+            slot_digests[int(slot)] = digest
+    return slot_digests
+
+
+def extract_backup(backup_dir, out_dir, slots, compress=True):
+    '''
+    Copy the records of the given slots from a backup into a new backup,
+    reading only their extents of each file.
+    '''
+    manifest = load_manifest(backup_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    slots = set(slots)
+    entries = []
+    for entry in manifest['masters']:
+        with BackupReader(os.path.join(backup_dir, entry['file'])) as r, \
+             BackupWriter(os.path.join(out_dir, entry['file']), compress) as w:
+            for _, _, records in r.iter_slots(slots):
+                for record in records:
+                    w.write(*record)
+        entry_slots = set(r.slots) & slots
+        entries.append({**entry,
+            'slots': summarize_slots(entry_slots),
+            'keys': w.records,
+            'bytes': w.bytes_written,
+            'slot_digests': {slot: digest for slot, digest
+                                 in entry.get('slot_digests', {}).items()
+                                 if int(slot) in slots},
+        })
+
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'w') as f:
+        json.dump({**manifest, 'compress': compress, 'masters': entries}, f, indent=4)
+    return entries
+
+
+class BackupCluster:
+
+    __slots__ = ()
+
+    def backup(self, backup_dir, count=1000, compress=True,
+               parallel=DEFAULT_PARALLEL, slots=None, incremental_from=None,
+               by_slot=False):
+        '''
+        Back up every master in parallel into one file per master. Keys are
+        read with SCAN pages of `count` keys, and their DUMP payload and PTTL
+        fetched with one pipeline per page. Only servers with a dictionary
+        per slot (Redis 7.4+) scan slot by slot, so the records go through a
+        SlotSorter, spilling to temporary files in `backup_dir`, and are
+        written in slot order: every slot is a single extent of the file
+        and the memory used doesn't depend on the size of the dataset.
+        With `by_slot`, keys are read slot by slot with CLUSTER
+        GETKEYSINSLOT instead, which needs no temporary files but holds the
+        key list of a whole slot.
+
+        `slots` restricts the backup to the given slots. An incremental
+        backup (`incremental_from`) skips the slots whose key set digest
+        matches the previous manifest and that have no key touched since
+        the previous backup started (by OBJECT IDLETIME), and writes only
+        the touched keys of the other slots, so it always reads by slot.
+        Deleted keys are not recorded.
+
+        The PTTL of each key is recorded from the start of the backup, the
+        manifest's `created_at`, rather than from its DUMP: a key keeps its
+        expiry however long the backup runs.
+        '''
+        os.makedirs(backup_dir, exist_ok=True)
+        masters = [n for n in self._get_masters() if n.slots]
+        xprint(f">>> Backing up {len(masters)} masters to {backup_dir}")
+
+        previous = load_manifest(incremental_from) if incremental_from else None
+        if previous:
+            xprint(f">>> Incremental backup since {incremental_from}")
+
+        started_at = time.time()
+        created_at_ms = int(started_at * 1000)
+
+        def backup_master(n):
+            master_slots = sorted(set(n.slots) & set(slots)) \
+                               if slots is not None else sorted(n.slots)
+            if not by_slot and not previous:
+                return self._backup_master(n, master_slots, backup_dir,
+                                           count, compress, created_at_ms, progress)
+            return self._backup_master_slots(n, master_slots, backup_dir,
+                                             count, compress, created_at_ms,
+                                             previous, progress)
+
+        total_slots = sum(len(n.slots) if slots is None else len(set(n.slots) & set(slots))
+                          for n in masters)
+        with Progress('Backing up', total_slots=total_slots) as progress:
+            entries = [future.result()
+                       for _, future in parallel_map(backup_master, masters, parallel)]
+        for entry in sorted(entries, key=lambda e: e['addr']):
+            xprint.ok(f"{entry['addr']}: {entry['keys']} keys, {entry['bytes']} bytes")
+
+        manifest = {
+            'version': 1,
+            'created_at': started_at,
+            'finished_at': time.time(),
+            'compress': compress,
+            'incremental_from': incremental_from,
+            'masters': sorted(entries, key=lambda e: e['file']),
+        }
+        with open(os.path.join(backup_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+        keys = sum(e['keys'] for e in entries)
+        xprint.ok(f"{keys} keys backed up from {len(masters)} masters.")
+        return manifest
+
+    def _backup_master(self, n, slots, backup_dir, count, compress, created_at_ms,
+                       progress=None):
+        file_name = f"{n.node_id}{BACKUP_FILE_EXT}"
+        slots = set(slots)
+        slot_digests = {}
+        with SlotSorter(tmp_dir=backup_dir) as sorter:
+            for keys in n.scan_pages(count):
+                if len(slots) != len(n.slots):
+                    keys = [k for k in keys if key_to_slot(k) in slots]
+                self._backup_page(n, sorter, keys, created_at_ms, progress)
+            # Keys SCAN returned more than once come out of the sorter once.
+            with BackupWriter(os.path.join(backup_dir, file_name), compress) as w:
+                for slot, key, pttl, payload in sorter:
+                    w.write(slot, key, pttl, payload)
+                    num_keys, digest = slot_digests.get(slot, (0, 0))
+                    slot_digests[slot] = (num_keys + 1, fold_digest(digest, key))
+        if progress:
+            # Slots are only done when the whole scan is.
+            progress.slot_done(len(slots))
+
+        return self._make_manifest_entry(n, file_name, summarize_slots(slots),
+                                         w, slot_digests)
+
+    def _backup_master_slots(self, n, slots, backup_dir, count, compress,
+                             created_at_ms, previous=None, progress=None):
+        file_name = f"{n.node_id}{BACKUP_FILE_EXT}"
+        previous_digests = merge_slot_digests(previous) if previous else {}
+        slot_digests = {}
+        skipped = 0
+        with BackupWriter(os.path.join(backup_dir, file_name), compress) as w:
+            for slot in slots:
+                keys = n.get_all_keys_in_slot(slot)
+                digest = 0
+                for key in keys:
+                    digest = fold_digest(digest, key)
+                slot_digests[slot] = (len(keys), digest)
+                unchanged = previous_digests.get(slot) == [len(keys), f"{digest:016x}"]
+
+                if previous:
+                    max_idle = time.time() - previous['created_at']
+                    keys = self._get_touched_keys(n, keys, max_idle)
+                    if not keys and unchanged:
+                        skipped += 1
+                        if progress:
+                            progress.slot_done()
+                        continue
+
+                for page in chunk(keys, count):
+                    self._backup_page(n, w, page, created_at_ms, progress)
+                if progress:
+                    progress.slot_done()
+
+        if previous:
+            xprint.verbose(f"{n}: {skipped} unchanged slots skipped")
+        return self._make_manifest_entry(n, file_name, summarize_slots(slots),
+                                         w, slot_digests)
+
+    def _get_touched_keys(self, n, keys, max_idle):
+        touched = []
+        for page in chunk(keys, 1000):
+            for key, idle in zip(page, n.object_idletime(page)):
+                # Can't tell under an LFU policy, keep the key to be safe.
+                if isinstance(idle, Exception) or (idle is not None and idle <= max_idle):
+                    touched.append(key)
+        return touched
+
+    def _make_manifest_entry(self, n, file_name, slots, writer, slot_digests):
+        return {
+            'node_id': n.node_id,
+            'addr': n.addr,
+            'file': file_name,
+            'slots': slots,
+            'keys': writer.records,
+            'bytes': writer.bytes_written,
+            'slot_digests': {slot: [keys, f"{digest:016x}"]
+                             for slot, (keys, digest) in sorted(slot_digests.items())},
+        }
+
+    def _backup_page(self, n, writer, keys, created_at_ms, progress):
+        if progress:
+            progress.start(n, len(keys))
+        # PTTL is relative to the DUMP: shift it to the start of the backup.
+        dumped_at_ms = int(time.time() * 1000)
+        nbytes = self._write_records(writer, keys, n.dump_keys(keys),
+                                     dumped_at_ms - created_at_ms)
+        if progress:
+            progress.done(n, len(keys), nbytes)
+
+    def _write_records(self, writer, keys, dumps, pttl_offset=0):
+        # Write to a BackupWriter or a SlotSorter. Returns the size of the
+        # payloads written.
+        nbytes = 0
+        for key, (payload, pttl) in zip(keys, dumps):
+            # The key expired or was deleted between SCAN and DUMP.
+            if payload is None or pttl == -2:
+                continue
+            nbytes += len(payload)
+            writer.write(key_to_slot(key), key,
+                         pttl + pttl_offset if pttl >= 0 else -1, payload)
+        return nbytes
@@ -0,0 +1,218 @@
+import heapq
+import json
+
+from ..exceptions import RedisTribException
+from ..progress import Progress, format_bytes
+from ..slot_sort import SlotSorter
+from ..util import parallel_map, DEFAULT_PARALLEL
+from ..xprint import xprint
+from .import_cluster import key_to_slot
+from .move_slot import LARGE_KEY_THRESHOLD
+
+
+SCAN_COUNT = 1000
+TOP_KEYS = 10
+TOP_KEYS_PER_SLOT = 3
+
+
+class TopK:
+    '''
+    The `k` heaviest (weight, key, type) entries pushed, in a min-heap of
+    at most `k` entries: memory doesn't grow with the number of keys. A key
+    already in the heap isn't pushed again.
+    '''
+
+    __slots__ = ('k', 'heap', 'keys')
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+        self.keys = set()
+
+    def push(self, entry):
+        key = entry[1]
+        if key in self.keys:
+            return
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry > self.heap[0]:
+            self.keys.discard(heapq.heapreplace(self.heap, entry)[1])
+        else:
+            return
+        self.keys.add(key)
+
+    def merge(self, other):
+        for entry in other.heap:
+            self.push(entry)
+        return self
+
+    def entries(self):
+        return sorted(self.heap, reverse=True)
+
+
+class _NodeScan:
+
+    __slots__ = ('node', 'keys', 'weight', 'skipped', 'top', 'slots', 'types')
+
+    def __init__(self, node, top):
+        self.node = node
+        self.keys = 0
+        self.weight = 0
+        self.skipped = 0
+        self.top = TopK(top)
+        # {slot: [keys, weight, TopK]}, {type: [keys, weight]}
+        self.slots = {}
+        self.types = {}
+
+
+def _key_str(key):
+    return key.decode(errors='backslashreplace')
+
+
+class BigKeysCluster:
+
+    __slots__ = ()
+
+    def bigkeys(self, top=TOP_KEYS, slot_top=TOP_KEYS_PER_SLOT, count=SCAN_COUNT,
+                hot=False, samples=None, parallel=DEFAULT_PARALLEL, output=None):
+        '''
+        Find the biggest keys of the cluster, or the most accessed with
+        `hot` (OBJECT FREQ, which needs an LFU maxmemory policy). Masters
+        are scanned in parallel, SCAN pages of `count` keys with their
+        TYPE and MEMORY USAGE (or OBJECT FREQ) pipelined in one round
+        trip. Only the `top` heaviest keys per node and the `slot_top`
+        heaviest per slot are kept, and merged into a cluster-wide
+        report, with the totals per slot and per type. Keys SCAN returns
+        more than once are counted once, through a SlotSorter that spills
+        to temporary files. With `output`, the report is written as JSON.
+        '''
+        masters = [n for n in self._get_masters() if n.slots]
+        if hot:
+            self._assert_lfu(masters)
+
+        total_keys = sum(n.r.dbsize() for n in masters)
+        with Progress('Scanning', total_keys=total_keys) as progress:
+            def scan(n):
+                return self._scan_weights(n, top, slot_top, count, hot, samples,
+                                          progress)
+            scans = [future.result() for _, future in parallel_map(scan, masters, parallel)]
+
+        cluster_top = TopK(top)
+        slots, types = {}, {}
+        for s in scans:
+            cluster_top.merge(s.top)
+            for slot, (keys, weight, slot_keys) in s.slots.items():
+                # A slot migrating during the scan is seen on two nodes.
+                merged = slots.setdefault(slot, [0, 0, TopK(slot_top)])
+                merged[0] += keys
+                merged[1] += weight
+                merged[2].merge(slot_keys)
+            for t, (keys, weight) in s.types.items():
+                merged = types.setdefault(t, [0, 0])
+                merged[0] += keys
+                merged[1] += weight
+
+        owners = {}
+        for s in scans:
+            for weight, key, _ in s.top.heap:
+                owners[key] = s.node
+        report = {
+            'metric': 'freq' if hot else 'memory',
+            'keys': [{'key': _key_str(key), 'slot': key_to_slot(key), 'type': t,
+                      'weight': weight, 'node': owners[key].addr}
+                     for weight, key, t in cluster_top.entries()],
+            'nodes': {s.node.addr: {'node_id': s.node.node_id, 'keys': s.keys,
+                                    'weight': s.weight, 'skipped': s.skipped,
+                                    'top': [{'key': _key_str(key), 'type': t, 'weight': weight}
+                                            for weight, key, t in s.top.entries()]}
+                      for s in scans},
+            'types': {t: {'keys': keys, 'weight': weight}
+                      for t, (keys, weight) in sorted(types.items())},
+            'slots': {str(slot): {'keys': keys, 'weight': weight,
+                                  'top': [{'key': _key_str(key), 'type': t, 'weight': weight}
+                                          for weight, key, t in slot_keys.entries()]}
+                      for slot, (keys, weight, slot_keys) in sorted(slots.items())},
+        }
+        self._print_bigkeys(report, hot, top)
+
+        if output:
+            with open(output, 'w') as f:
+                json.dump(report, f)
+        return report
+
+    def _assert_lfu(self, masters):
+        for n in masters:
+            policy = n.r.config_get('maxmemory-policy').get('maxmemory-policy', '')
+            if 'lfu' not in policy:
+                raise RedisTribException(
+                    f"{n}: maxmemory-policy is {policy}, "
+                    f"an LFU policy is needed for OBJECT FREQ")
+
+    def _scan_weights(self, n, top, slot_top, count, hot, samples, progress):
+        scan = _NodeScan(n, top)
+        # SCAN may return a key more than once: the weights go through a
+        # SlotSorter, which gives every key once in bounded memory.
+        with SlotSorter() as sorter:
+            for page in n.scan_pages(count):
+                progress.start(n, len(page))
+                page_weight = 0
+                for key, (t, weight) in zip(page, n.key_weights(page, hot, samples)):
+                    # Gone since the SCAN, or refused by the server.
+                    if not isinstance(weight, int) or isinstance(t, Exception):
+                        scan.skipped += 1
+                        continue
+                    page_weight += weight
+                    sorter.write(key_to_slot(key), key, weight, t)
+                progress.done(n, len(page), 0 if hot else page_weight)
+
+            for key_slot, key, weight, t in sorter:
+                t = t.decode()
+                entry = (weight, key, t)
+                scan.keys += 1
+                scan.weight += weight
+                scan.top.push(entry)
+                slot = scan.slots.get(key_slot)
+                if slot is None:
+                    slot = scan.slots[key_slot] = [0, 0, TopK(slot_top)]
+                slot[0] += 1
+                slot[1] += weight
+                slot[2].push(entry)
+                by_type = scan.types.setdefault(t, [0, 0])
+                by_type[0] += 1
+                by_type[1] += weight
+        return scan
+
+    def _print_bigkeys(self, report, hot, top):
+        fmt = str if hot else format_bytes
+        unit = 'freq' if hot else 'memory'
+        if not report['keys']:
+            xprint.warning("No key found.")
+            return
+
+        xprint(f">>> Top {len(report['keys'])} keys by {unit}")
+        for k in report['keys']:
+            warning = '' if hot or k['weight'] < LARGE_KEY_THRESHOLD \
+                          else '  (too large for a MIGRATE batch)'
+            xprint(f"    {fmt(k['weight']):>10}  {k['type']:<6} slot {k['slot']:>5}  "
+                   f"{k['node']}  {k['key']}{warning}")
+
+        xprint(">>> Keys by type")
+        for t, s in report['types'].items():
+            xprint(f"    {t:<6} {s['keys']:>10} keys  {fmt(s['weight']):>10}")
+
+        heaviest = heapq.nlargest(top, report['slots'].items(),
+                                  key=lambda e: e[1]['weight'])
+        xprint(f">>> Top {len(heaviest)} slots by {unit}")
+        for slot, s in heaviest:
+            keys = ', '.join(k['key'] for k in s['top'])
+            xprint(f"    slot {slot:>5}  {fmt(s['weight']):>10} in {s['keys']} keys  "
+                   f"largest: {keys}")
+
+        for addr, s in sorted(report['nodes'].items()):
+            largest = s['top'][0] if s['top'] else None
+            line = f"{addr}: {s['keys']} keys, {fmt(s['weight'])}"
+            if largest:
+                line += f", largest {largest['key']} ({fmt(largest['weight'])})"
+            if s['skipped']:
+                line += f", {s['skipped']} skipped"
+            xprint.ok(line)
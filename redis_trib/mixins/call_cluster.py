@@ -1,20 +1,156 @@
-from ..util import xprint
+from ..util import xprint, parallel_map, DEFAULT_PARALLEL
+import asyncio
 import json
+import shlex
+import time
 import redis
 
 
+ROLE_ALL = 'all'
+ROLE_MASTER = 'master'
+ROLE_REPLICA = 'replica'
+
+FORMAT_JSON = 'json'
+FORMAT_TABLE = 'table'
+
+
+def parse_command_lines(lines):
+    '''
+    Parse a batch file with one command per line. Blank lines and lines
+    starting with '#' are skipped.
+    '''
+    commands = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        commands.append(shlex.split(line))
+    return commands
+
+
+def _json_default(obj):
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+
 class CallCluster:
 
     __slots__ = ()
 
-    def call(self, *command):
-        results = {}
-        for n in self._nodes:
-            result = None
+    def call(self, *command, parallel=DEFAULT_PARALLEL, role=ROLE_ALL):
+        '''
+        Run the command on every node concurrently and stream one JSON
+        object per node (NDJSON) as soon as the node answers.
+        '''
+        nodes = self._get_nodes_by_role(role)
+        for n, future in parallel_map(lambda n: self._call_node(n, command),
+                                      nodes, parallel):
+            print(json.dumps(future.result(), default=_json_default), flush=True)
+
+    def call_batch(self, commands, parallel=DEFAULT_PARALLEL, role=ROLE_ALL,
+                   output_format=FORMAT_JSON):
+        '''
+        Pipeline every command to each node in a single round trip, with
+        the nodes handled concurrently, and print the results in command
+        order, each with its argv and its replies by node.
+        '''
+        nodes = self._get_nodes_by_role(role)
+        node_replies = []
+        for n, future in parallel_map(lambda n: n.execute_pipeline(commands),
+                                      nodes, parallel):
             try:
-                result = n.r.execute_command(*command)
-            except redis.exceptions.ResponseError as e:
-                result = str(e)
-            results[str(n)] = result
+                node_replies.append((n, future.result()))
+            except redis.exceptions.RedisError as e:
+                node_replies.append((n, [e] * len(commands)))
+        self._print_batch_results(commands, node_replies, output_format)
+
+    async def call_async(self, *command, parallel=DEFAULT_PARALLEL, role=ROLE_ALL):
+        '''
+        Like call, for AsyncNodes: every node is called from a single event
+        loop, with at most `parallel` commands in flight.
+        '''
+        semaphore = asyncio.Semaphore(parallel)
+
+        async def call_node(n):
+            async with semaphore:
+                return await self._call_node_async(n, command)
+
+        for line in asyncio.as_completed([call_node(n)
+                                          for n in self._get_nodes_by_role(role)]):
+            print(json.dumps(await line, default=_json_default), flush=True)
+
+    async def call_batch_async(self, commands, parallel=DEFAULT_PARALLEL,
+                               role=ROLE_ALL, output_format=FORMAT_JSON):
+        '''
+        Like call_batch, for AsyncNodes.
+        '''
+        semaphore = asyncio.Semaphore(parallel)
+
+        async def pipeline(n):
+            async with semaphore:
+                try:
+                    return n, await n.execute_pipeline(commands)
+                except redis.exceptions.RedisError as e:
+                    return n, [e] * len(commands)
+
+        node_replies = await asyncio.gather(*(pipeline(n)
+                                              for n in self._get_nodes_by_role(role)))
+        self._print_batch_results(commands, node_replies, output_format)
+
+    def _print_batch_results(self, commands, node_replies, output_format):
+        # One entry per command, a command may be repeated.
+        results = [{'command': list(command), 'replies': {}} for command in commands]
+        for n, replies in node_replies:
+            for result, reply in zip(results, replies):
+                if isinstance(reply, Exception):
+                    reply = {'error': str(reply)}
+                result['replies'][str(n)] = reply
+
+        if output_format == FORMAT_TABLE:
+            self._print_batch_table(results)
+        else:
+            print(json.dumps(results, indent=4, default=_json_default))
+
+    def _print_batch_table(self, results):
+        for result in results:
+            replies = result['replies']
+            print(shlex.join(result['command']))
+            width = max(map(len, replies.keys()), default=0)
+            for addr in sorted(replies.keys()):
+                reply = json.dumps(replies[addr], default=_json_default)
+                print(f"  {addr:<{width}}  {reply}")
+
+    def _get_nodes_by_role(self, role):
+        if role == ROLE_MASTER:
+            return [n for n in self._nodes if n.is_master()]
+        elif role == ROLE_REPLICA:
+            return [n for n in self._nodes if n.is_slave()]
+        return list(self._nodes)
+
+    def _call_node(self, n, command):
+        line = self._make_call_line(n)
+        start = time.perf_counter()
+        try:
+            line['result'] = n.r.execute_command(*command)
+        except redis.exceptions.RedisError as e:
+            line['error'] = str(e)
+        line['latency_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        return line
+
+    async def _call_node_async(self, n, command):
+        line = self._make_call_line(n)
+        start = time.perf_counter()
+        try:
+            line['result'] = await n.execute_command(*command)
+        except redis.exceptions.RedisError as e:
+            line['error'] = str(e)
+        line['latency_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        return line
 
-        print(json.dumps(results, indent=4))
+    def _make_call_line(self, n):
+        return {
+            'node': str(n),
+            'node_id': n.node_id,
+            'role': ROLE_REPLICA if n.is_slave() else ROLE_MASTER,
+        }
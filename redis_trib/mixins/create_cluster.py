@@ -200,22 +200,23 @@ class OriginalRoleDistribution(RoleDistribution):
             # an affinity problem with another random slave, to see if we
             # can improve the affinity.
             first = random.choice(offenders)
-            nodes = list(filter(lambda n: n != first and n.replicate, nodes))
+            nodes = list(filter(lambda n: n != first and n.replicate, self._nodes))
             if len(nodes) == 0:
                 break
 
             second = random.choice(nodes)
 
-            first.set_as_replica(second.replicate)
-            second.set_as_replica(first.replicate)
+            first_master, second_master = first.replicate, second.replicate
+            first.set_as_replica(second_master)
+            second.set_as_replica(first_master)
 
             new_score, new_offenders = self._get_anti_affinity_score()
             # If the change actually makes thing worse, revert. Otherwise
             # leave as it is becuase the best solution may need a few
             # combined swaps.
             if new_score > score:
-                first.set_as_replica(first.replicate)
-                second.set_as_replica(second.replicate)
+                first.set_as_replica(first_master)
+                second.set_as_replica(second_master)
             else:
                 score = new_score
                 offenders = new_offenders
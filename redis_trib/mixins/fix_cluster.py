@@ -117,7 +117,7 @@ class FixCluster:
                     # actually migrate keys away) in order to avoid receiving
                     # redirections for MIGRATE.
                     src.cluster_setslot_importing(slot, target)
-                    self._move_slot(src, target, slot, dots=True, fix=True, cold=True)
+                    self._move_slot(src, target, slot, quiet=False, fix=True, cold=True)
                     src.cluster_setslot_stable(slot)
 
              
@@ -0,0 +1,154 @@
+import heapq
+import json
+import math
+from array import array
+
+import redis
+
+from ..const import CLUSTER_HASH_SLOTS
+from ..util import parallel_map, chunk, DEFAULT_PARALLEL
+from ..xprint import xprint
+
+
+COUNT_BATCH = 1000
+TOP_SLOTS = 10
+# Upper bounds of the keys-per-slot buckets of the per-node histograms.
+HISTOGRAM_BOUNDS = (0, 10, 100, 1000, 10000, 100000)
+# Count of the slots of a master whose keys couldn't be counted.
+UNREACHABLE = -2
+
+
+def slot_stats(counts):
+    '''
+    Skew statistics of keys per slot, over the assigned slots.
+    '''
+    values = sorted(counts)
+    if not values:
+        return {}
+    total = sum(values)
+    mean = total / len(values)
+    stddev = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+    # Gini coefficient: 0 when every slot has as many keys, near 1 when a
+    # few slots hold all of them.
+    weighted = sum((i + 1) * v for i, v in enumerate(values))
+    gini = (2 * weighted / (len(values) * total) - (len(values) + 1) / len(values)) \
+               if total else 0.0
+    return {
+        'slots': len(values),
+        'keys': total,
+        'mean': mean,
+        'stddev': stddev,
+        'cv': stddev / mean if mean else 0.0,
+        'min': values[0],
+        'p50': values[len(values) // 2],
+        'p99': values[min(len(values) - 1, len(values) * 99 // 100)],
+        'max': values[-1],
+        'max_to_mean': values[-1] / mean if mean else 0.0,
+        'gini': gini,
+        'empty': sum(1 for v in values if not v),
+    }
+
+
+def histogram(counts, bounds=HISTOGRAM_BOUNDS):
+    # Number of slots per bucket of keys per slot, the last bucket is open.
+    buckets = [0] * (len(bounds) + 1)
+    for c in counts:
+        i = 0
+        while i < len(bounds) and c > bounds[i]:
+            i += 1
+        buckets[i] += 1
+    return buckets
+
+
+def _bucket_labels(bounds=HISTOGRAM_BOUNDS):
+    labels = [str(bounds[0])]
+    labels += [f"{lo + 1}-{hi}" for lo, hi in zip(bounds, bounds[1:])]
+    labels.append(f">{bounds[-1]}")
+    return labels
+
+
+class HeatmapCluster:
+
+    __slots__ = ()
+
+    def heatmap(self, top=TOP_SLOTS, batch=COUNT_BATCH, parallel=DEFAULT_PARALLEL,
+                output=None):
+        '''
+        Count the keys of every slot with pipelined CLUSTER COUNTKEYSINSLOT,
+        `batch` slots per round trip and masters in parallel, and report
+        how the keys are spread: skew statistics, the `top` heaviest slots
+        and a histogram of keys per slot for each master. With `output`,
+        the counts of the 16384 slots and the statistics are written as
+        JSON. Unassigned slots count as -1, and the slots of a master that
+        couldn't be reached as UNREACHABLE: they are left out of the
+        statistics and shown as '-'.
+        '''
+        counts = array('q', [-1]) * CLUSTER_HASH_SLOTS
+        masters = [n for n in self._get_masters() if n.slots]
+
+        def count(n):
+            slots = sorted(n.slots)
+            return slots, [c for page in chunk(slots, batch)
+                           for c in n.count_keys_in_slots(page)]
+
+        owners = {}
+        # {addr: error} of the masters that couldn't be reached.
+        failed = {}
+        for n, future in parallel_map(count, masters, parallel):
+            try:
+                slots, slot_counts = future.result()
+            except redis.exceptions.RedisError as e:
+                xprint.warning(f"Can't count the keys of {n}: {e}")
+                failed[n.addr] = str(e)
+                for slot in n.slots:
+                    counts[slot] = UNREACHABLE
+                continue
+            for slot, c in zip(slots, slot_counts):
+                counts[slot] = c
+                owners[slot] = n
+
+        assigned = [c for c in counts if c >= 0]
+        stats = slot_stats(assigned)
+        self._print_heatmap(counts, owners, masters, stats, top, failed)
+
+        if output:
+            with open(output, 'w') as f:
+                json.dump({
+                    'stats': stats,
+                    'nodes': {n.addr: {'node_id': n.node_id,
+                                       'histogram': histogram(counts[s] for s in n.slots)}
+                                      if n.addr not in failed else
+                                      {'node_id': n.node_id, 'histogram': None,
+                                       'error': failed[n.addr]}
+                              for n in masters},
+                    'histogram_bounds': list(HISTOGRAM_BOUNDS),
+                    'counts': counts.tolist(),
+                }, f)
+        return counts
+
+    def _print_heatmap(self, counts, owners, masters, stats, top, failed=()):
+        if not stats:
+            xprint.warning("No slot is assigned.")
+            return
+        xprint(f">>> {stats['keys']} keys in {stats['slots']} slots: "
+               f"mean {stats['mean']:.2f}, stddev {stats['stddev']:.2f} "
+               f"(cv {stats['cv']:.2f}), gini {stats['gini']:.3f}")
+        xprint(f"    min {stats['min']}, p50 {stats['p50']}, p99 {stats['p99']}, "
+               f"max {stats['max']} ({stats['max_to_mean']:.1f}x the mean), "
+               f"{stats['empty']} empty slots")
+
+        heaviest = heapq.nlargest(top, (s for s in range(CLUSTER_HASH_SLOTS)
+                                        if counts[s] > 0), key=counts.__getitem__)
+        if heaviest:
+            xprint(f">>> Top {len(heaviest)} slots")
+            for slot in heaviest:
+                xprint(f"    slot {slot:>5}  {counts[slot]:>10} keys  {owners[slot]}")
+
+        labels = _bucket_labels()
+        widths = [max(len(l), 6) for l in labels]
+        xprint(">>> Slots per keys-per-slot bucket")
+        xprint('    ' + f"{'NODE':<22}" + ' '.join(f"{l:>{w}}" for l, w in zip(labels, widths)))
+        for n in sorted(masters, key=lambda n: n.addr):
+            buckets = histogram(counts[s] for s in n.slots) \
+                          if n.addr not in failed else ['-'] * len(labels)
+            xprint('    ' + f"{n.addr:<22}" + ' '.join(f"{b:>{w}}" for b, w in zip(buckets, widths)))
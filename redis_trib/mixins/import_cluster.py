@@ -1,19 +1,114 @@
-from ..util import xprint
+import threading
+
+from ..exceptions import RedisTribException
+from ..monkey_patch.redis_ import set_response_callbacks
+from ..progress import Progress
+from ..util import xprint, chunk, group_by
 
 import redis
 
 
+KEYSPACE_PATTERN = '__keyspace@0__:*'
+KEYSPACE_EVENTS = 'KA'
+
+SYNC_MAX_LAG = 100
+SYNC_MAX_PENDING = 1000000
+SYNC_BATCH = 500
+# Bulk passes run again when too many keys change, before giving up.
+SYNC_MAX_RESYNCS = 3
+
+
+class ChangedKeys:
+    '''
+    Keys changed on the source masters and not replayed yet, deduplicated
+    and bounded. Once full, new changes are dropped and `overflowed` is
+    set, so the caller knows it has to copy everything again.
+    '''
+
+    def __init__(self, max_keys=SYNC_MAX_PENDING):
+        self._max_keys = max_keys
+        self._keys = {}
+        self._lock = threading.Lock()
+        self.overflowed = False
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, source, key):
+        with self._lock:
+            if (source, key) in self._keys:
+                return
+            if len(self._keys) >= self._max_keys:
+                self.overflowed = True
+                return
+            self._keys[(source, key)] = None
+
+    def drain(self):
+        with self._lock:
+            keys, self._keys = list(self._keys), {}
+            overflowed, self.overflowed = self.overflowed, False
+        return keys, overflowed
+
+
+class KeyspaceListener(threading.Thread):
+    '''
+    Feeds the keyspace notifications of one source master into a
+    ChangedKeys set. The subscription is confirmed before the constructor
+    returns, so no change made after that can be missed.
+    '''
+
+    def __init__(self, source, r, changed):
+        super().__init__(daemon=True)
+        self._source = source
+        self._changed = changed
+        self._stopped = threading.Event()
+        self._pubsub = r.pubsub()
+        self._pubsub.psubscribe(KEYSPACE_PATTERN)
+        message = self._pubsub.get_message(timeout=5)
+        if not message or message['type'] != 'psubscribe':
+            self._pubsub.close()
+            raise redis.ConnectionError(f"Failed to subscribe to {KEYSPACE_PATTERN}")
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self._pubsub.close()
+
+    def run(self):
+        prefix_len = len(KEYSPACE_PATTERN) - 1
+        while not self._stopped.is_set():
+            message = self._pubsub.get_message(timeout=0.1)
+            if message and message['type'] == 'pmessage':
+                self._changed.add(self._source, message['channel'][prefix_len:])
+
+
 class ImportCluster:
 
     __slots__ = ()
 
-    def import_cluster(self, from_addr, from_password, replace=False, copy=False, timeout=60):
+    def import_cluster(self, from_addr, from_password, replace=False, copy=False,
+                       timeout=60, sync=False, max_lag=SYNC_MAX_LAG,
+                       max_pending=SYNC_MAX_PENDING, batch=SYNC_BATCH,
+                       max_resyncs=SYNC_MAX_RESYNCS):
+        '''
+        Copy every key of from_addr (a standalone server or a cluster) into
+        this cluster with MIGRATE.
+
+        With `sync` the source keeps serving writes: keyspace notifications
+        of every source master are subscribed to before the bulk pass, and
+        the changed keys are then replayed in batches (MIGRATE, or DEL when
+        the key is gone from the source) until a round has no more than
+        `max_lag` keys to replay. Keys are always copied and replaced in
+        this mode. If more than `max_pending` keys change during a round,
+        the bulk pass is run again, up to `max_resyncs` times.
+        '''
         xprint(f">>> Importing data from {from_addr} "
                f"to cluster {self._nodes[0]}")
 
         *host, port = from_addr.split(':')
         host = ':'.join(host)
-        r = redis.StrictRedis(host, port, password=from_password, decode_responses=True)
+        r = set_response_callbacks(redis.StrictRedis(host, port, password=from_password,
+                                                     decode_responses=True))
 
         info_cluster = r.info('cluster')
         cluster_enabled = info_cluster and info_cluster.get('cluster_enabled')
@@ -27,17 +122,100 @@ class ImportCluster:
                     _host = ':'.join(_host)
                     nodes.append(redis.StrictRedis(_host, _port,
                                 password=from_password, decode_responses=True))
-        else:
-            nodes.append(r)
 
         slot_table = self._make_slots_table()
-        for _r in nodes:
-            for k in _r.scan_iter():
-                slot = key_to_slot(k)
-                host, port = slot_table[slot]
-                _r.migrate(host, port, k, 0, timeout,
-                        auth=self._password, copy=copy, replace=replace)
+        if not sync:
+            self._import_keys(nodes, slot_table, timeout, copy, replace)
+            return
+
+        self._import_sync(nodes, slot_table, timeout, max_lag, max_pending, batch,
+                          max_resyncs)
+
+    def _import_sync(self, nodes, slot_table, timeout, max_lag, max_pending, batch,
+                     max_resyncs=SYNC_MAX_RESYNCS):
+        changed = ChangedKeys(max_pending)
+        # What was set up so far, undone even if a later node fails.
+        events, listeners = [], []
+        try:
+            for i, _r in enumerate(nodes):
+                events.append((_r, self._enable_keyspace_events(_r)))
+                listeners.append(KeyspaceListener(i, _r, changed))
+                listeners[-1].start()
+            self._import_keys(nodes, slot_table, timeout, copy=True, replace=True)
+            self._sync_changes(nodes, slot_table, changed, timeout, max_lag, batch,
+                               max_resyncs)
+        finally:
+            for l in listeners:
+                l.stop()
+            for _r, prev in events:
+                if prev is not None:
+                    _r.config_set('notify-keyspace-events', prev)
+
+    def _import_keys(self, nodes, slot_table, timeout, copy, replace):
+        total_keys = sum(_r.dbsize() for _r in nodes)
+        with Progress('Importing', total_keys=total_keys) as progress:
+            for _r in nodes:
+                kwargs = _r.connection_pool.connection_kwargs
+                source = f"{kwargs['host']}:{kwargs['port']}"
+                for k in _r.scan_iter():
+                    slot = key_to_slot(k)
+                    host, port = slot_table[slot]
+                    progress.start(source, 1)
+                    _r.migrate(host, port, k, 0, timeout,
+                            auth=self._password, copy=copy, replace=replace)
+                    progress.done(source, 1)
+
+    def _enable_keyspace_events(self, r):
+        # Returns the previous setting when it had to be changed.
+        events = r.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+        if 'K' in events and 'A' in events:
+            return None
+        r.config_set('notify-keyspace-events', events + KEYSPACE_EVENTS)
+        return events
+
+    def _sync_changes(self, nodes, slot_table, changed, timeout, max_lag, batch,
+                      max_resyncs=SYNC_MAX_RESYNCS):
+        resyncs = 0
+        while True:
+            keys, overflowed = changed.drain()
+            if overflowed:
+                if resyncs >= max_resyncs:
+                    raise RedisTribException(
+                        f"More keys keep changing than can be tracked (--max-pending) "
+                        f"after {resyncs} full copies: the target can't catch up.")
+                resyncs += 1
+                xprint.warning("Too many keys changed during the import, "
+                               "copying everything again.")
+                self._import_keys(nodes, slot_table, timeout, copy=True, replace=True)
+                continue
+
+            for source, source_keys in group_by(keys, key=lambda k: k[0]).items():
+                for page in chunk([k for _, k in source_keys], batch):
+                    self._replay_keys(nodes[source], page, slot_table, timeout)
+            xprint(f">>> {len(keys)} changed keys replayed, {len(changed)} pending")
+            if len(keys) <= max_lag:
+                break
+
+        xprint.ok(f"Source and target are in sync, lag is under {max_lag} keys.")
+
+    def _replay_keys(self, r, keys, slot_table, timeout):
+        with r.pipeline(transaction=False) as p:
+            for k in keys:
+                p.exists(k)
+            exists = p.execute()
 
+        # MIGRATE of several keys must not cross slots on a cluster source.
+        targets = {(n.host, n.port): n for n in self._get_masters()}
+        by_slot = group_by(zip(keys, exists), key=lambda e: key_to_slot(e[0]))
+        for slot, entries in by_slot.items():
+            host, port = slot_table[slot]
+            live = [k for k, e in entries if e]
+            deleted = [k for k, e in entries if not e]
+            if live:
+                r.migrate(host, port, live, 0, timeout,
+                          auth=self._password, copy=True, replace=True)
+            if deleted:
+                targets[(host, port)].execute_pipeline([('DEL', k) for k in deleted])
 
     def _make_slots_table(self):
         table = {}
@@ -52,7 +230,7 @@ class ImportCluster:
 def crc16(bbb):
     crc = 0
     for b in bbb:
-        crc = ((crc << 8) & 0xff00) ^ XMODEMCRC16Lookup[((crc >> 8) ^ ord(b)) & 0xff]
+        crc = ((crc << 8) & 0xff00) ^ XMODEMCRC16Lookup[((crc >> 8) ^ b) & 0xff]
     return crc 
 
 
@@ -93,11 +271,11 @@ XMODEMCRC16Lookup = [
 
 
 def key_to_slot(key):
-    _key = key
-    s = _key.find('{')
+    _key = key.encode() if isinstance(key, str) else key
+    s = _key.find(b'{')
     if s != -1:
-        e = _key.find('}', s + 1)
+        e = _key.find(b'}', s + 1)
         if e != -1 and e != s + 1:
-            _key = key[s+1:e-1]
+            _key = _key[s+1:e]
     return crc16(_key) % 16384
 
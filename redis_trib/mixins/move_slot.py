@@ -1,70 +1,381 @@
 from math import ceil, floor
-from ..util import query_yes_no
+from ..util import query_yes_no, parallel_map, chunk, summarize_slots
+from ..xprint import xprint
+from ..metrics import get_metrics
+from ..ownership import OwnershipBroadcaster, setslot_pipelined
+from ..relay import Relay
+from ..exceptions import MigrationStalledException
+import queue
 import redis
+import time
+from contextlib import nullcontext
 
 class IsNotMasterNode(Exception): pass
 class NotExistNode(Exception): pass
 
 
+# Defaults for the key-size aware migration mode.
+PROBE_KEYS_COUNT = 1000
+MIGRATE_BATCH_BYTES = 8 * 1024 * 1024
+LARGE_KEY_THRESHOLD = 8 * 1024 * 1024
+MIGRATE_BATCH_MAX_KEYS = 1000
+# Slots counted per round trip by the empty slots fast path.
+EMPTY_SLOTS_BATCH = 1000
+# Keys listed per GETKEYSINSLOT when a slot is migrated over many connections.
+FANOUT_FETCH_KEYS = 100000
+
+
+def plan_migrate_batches(keys, sizes, batch_bytes=MIGRATE_BATCH_BYTES,
+                         large_key_threshold=LARGE_KEY_THRESHOLD,
+                         max_keys=MIGRATE_BATCH_MAX_KEYS):
+    '''
+    Split keys into MIGRATE batches by byte budget rather than key count.
+    Keys bigger than large_key_threshold get a batch of their own.
+    Yields (keys, is_large) tuples.
+    '''
+    batch, batch_size = [], 0
+    for key, size in zip(keys, sizes):
+        size = size or 0
+        if size >= large_key_threshold:
+            yield [key], True
+            continue
+
+        if batch and (batch_size + size > batch_bytes
+                      or len(batch) >= max_keys):
+            yield batch, False
+            batch, batch_size = [], 0
+
+        batch.append(key)
+        batch_size += size
+
+    if batch:
+        yield batch, False
+
+
+def sized_batches(source, keys, batch_bytes, large_key_threshold,
+                  large_key_timeout, timeout):
+    '''
+    Probe the size of keys with pipelined MEMORY USAGE and pack them in
+    batches by byte budget. Big keys are migrated alone with a longer
+    timeout. Yields (keys, timeout, bytes) tuples.
+    '''
+    sizes = {}
+    for page in chunk(keys, PROBE_KEYS_COUNT):
+        sizes.update(zip(page, source.memory_usage(page)))
+    for keys, is_large in plan_migrate_batches(sizes.keys(), sizes.values(),
+                                               batch_bytes, large_key_threshold):
+        if is_large:
+            xprint.verbose(f"Migrating large key {keys[0]} "
+                           f"({sizes[keys[0]]} bytes) alone")
+        yield (keys, large_key_timeout if is_large else timeout,
+               sum(sizes[k] or 0 for k in keys))
+
+
+def assert_keys_moved(source, slot, keys_in_slot, listed):
+    '''
+    Raise MigrationStalledException when GETKEYSINSLOT lists the same keys
+    as last time. MIGRATE errors are reported, not raised, so none of them
+    could be migrated and they would be listed forever.
+    '''
+    if keys_in_slot == listed:
+        raise MigrationStalledException(
+            f"No key of slot {slot} could be migrated from {source}, "
+            f"the slot is left open")
+
+
 class MoveSlot:
 
     __slots__ = ()
 
 
-    def _set_importing_and_migrating(self, source, target):
+    def _set_importing_and_migrating(self, source, target, slot):
         target.cluster_setslot_importing(slot, source)
         source.cluster_setslot_migrating(slot, target)
    
 
-    def _notify_new_owner(self, source, target):
-        target.cluster_setslot_node(slot, target)
-        source.cluster_setslot_node(slot, target)
-        for n in [n for n in self._get_masters()
-                    if n not in (source, target)]:
-            n.cluster_setslot_node(slot, target)
+    def _notify_new_owner(self, source, target, slot, broadcaster=None):
+        # Without a broadcaster, the other masters are told right away.
+        with self._broadcaster(broadcaster) as broadcaster:
+            broadcaster.notify(source, target, slot)
+
+    def _broadcaster(self, broadcaster=None):
+        return nullcontext(broadcaster) if broadcaster \
+                   else OwnershipBroadcaster(self._get_masters())
 
 
-    def _update_node_config(self, source, target):
+    def _update_node_config(self, source, target, slot):
         source.del_slots(slot)
         target.add_slots(slot, new=False)
 
 
+    def _move_slots(self, moves, target, progress=None, **move_opts):
+        '''
+        Move the (source, slot) pairs of a reshard table to target: the
+        empty slots all at once with _move_empty_slots, then the others
+        one by one with _move_slot. The other masters are told the new
+        owners in batches.
+        '''
+        with self._broadcaster() as broadcaster:
+            moved = self._move_empty_slots(moves, target, progress,
+                                           quiet=move_opts.get('quiet', True),
+                                           update=move_opts.get('update', True),
+                                           broadcaster=broadcaster)
+            for source, slot in moves:
+                if slot not in moved:
+                    self._move_slot(source, target, slot, progress=progress,
+                                    broadcaster=broadcaster, **move_opts)
+
+
+    def _move_empty_slots(self, moves, target, progress=None, quiet=True, update=True,
+                          broadcaster=None):
+        '''
+        Reassign the slots without keys of the (source, slot) pairs to
+        target with pipelined SETSLOT and an OwnershipBroadcaster, in a
+        few round trips per source instead of the 3 + masters round trips
+        per slot of _move_slot. A slot is counted again once MIGRATING, when
+        no key can be added to it on the source anymore: the slots that got
+        keys in the meantime are left open, for _move_slot to finish.
+        Returns the slots moved.
+        '''
+        by_source = {}
+        for source, slot in moves:
+            by_source.setdefault(source.node_id, (source, []))[1].append(slot)
+
+        def empty_slots(source, slots):
+            return [slot for page in chunk(slots, EMPTY_SLOTS_BATCH)
+                    for slot, count in zip(page, source.count_keys_in_slots(page))
+                    if not count]
+        candidates = [(source, future.result()) for (source, _), future in parallel_map(
+                          lambda e: empty_slots(*e), list(by_source.values()))]
+        candidates = [(source, slots) for source, slots in candidates if slots]
+        if not candidates:
+            return set()
+
+        quiet_or_not = xprint.quiet_or_not(quiet)
+        started_at = time.perf_counter()
+        importing = []
+        for source, slots in candidates:
+            quiet_or_not(f"Moving {len(slots)} empty slots "
+                         f"{summarize_slots(slots)} from {source} to {target}")
+            importing.append((source, setslot_pipelined(target, slots,
+                                                        'IMPORTING', source)))
+
+        # Once MIGRATING, keys of the slot that the source doesn't have are
+        # created on the target, so an empty slot stays empty.
+        def migrating(source, slots):
+            empty = []
+            for page in chunk(slots, EMPTY_SLOTS_BATCH):
+                replies = source.execute_pipeline(
+                              [c for slot in page
+                                 for c in (('CLUSTER', 'SETSLOT', slot, 'MIGRATING',
+                                            target.node_id),
+                                           ('CLUSTER', 'COUNTKEYSINSLOT', slot))])
+                empty += [slot for slot, ok, count in zip(page, replies[::2], replies[1::2])
+                          if not isinstance(ok, Exception) and count == 0]
+            return empty
+        moved = [(source, future.result()) for (source, _), future in parallel_map(
+                     lambda e: migrating(*e), importing)]
+        with self._broadcaster(broadcaster) as broadcaster:
+            moved = [(source, broadcaster.notify(source, target, slots))
+                     for source, slots in moved if slots]
+        empty = [slot for _, slots in moved for slot in slots]
+        if not empty:
+            return set()
+
+        metrics = get_metrics()
+        elapsed = (time.perf_counter() - started_at) / len(empty)
+        for source, slots in moved:
+            if update:
+                self._update_node_config(source, target, slots)
+            if metrics:
+                for slot in slots:
+                    metrics.record_slot(slot, str(source), str(target), 0, 0, elapsed)
+        if progress:
+            progress.slot_done(len(empty))
+        return set(empty)
+
     def _move_slot(self, source, target, slot, pipeline=10, timeout=60,
-                         update=True, cold=False, quiet=True, fix=False):
+                         update=True, cold=False, quiet=True, fix=False,
+                         probe_key_size=False, batch_bytes=MIGRATE_BATCH_BYTES,
+                         large_key_threshold=LARGE_KEY_THRESHOLD,
+                         large_key_timeout=None, progress=None, broadcaster=None,
+                         migrate_connections=1, relay=False):
         quiet_or_not = xprint.quiet_or_not(quiet)
 
-        quiet_or_not(f"Moving slot {slot} from {source} to {target}: ", end="")
+        quiet_or_not(f"Moving slot {slot} from {source} to {target}")
+
+        if not cold:
+           self._set_importing_and_migrating(source, target, slot)
+
+        metrics = get_metrics()
+        started_at = time.perf_counter()
+        if probe_key_size:
+            plan = lambda keys: sized_batches(source, keys, batch_bytes,
+                                   large_key_threshold,
+                                   large_key_timeout or timeout * 10, timeout)
+        else:
+            plan = lambda keys: ((batch, timeout, None)
+                                 for batch in chunk(keys, pipeline))
+        if relay:
+            moved_keys, moved_bytes = self._relay_slot(source, target, slot,
+                                          migrate_connections, plan, progress)
+        elif migrate_connections > 1:
+            moved_keys, moved_bytes = self._migrate_fanout(source, target, slot,
+                                          migrate_connections, plan, fix, progress)
+        else:
+            if probe_key_size:
+                batches = self._iter_sized_batches(source, slot, batch_bytes,
+                                large_key_threshold, large_key_timeout or timeout * 10,
+                                timeout)
+            else:
+                batches = self._iter_fixed_batches(source, slot, pipeline, timeout)
+            moved_keys, moved_bytes = 0, 0
+            for batch in batches:
+                self._migrate_batch(source, target, batch, fix, progress)
+                moved_keys += len(batch[0])
+                moved_bytes += batch[2] or 0
+
+        if progress:
+            progress.slot_done()
+        if metrics:
+            metrics.record_slot(slot, str(source), str(target), moved_keys,
+                                moved_bytes, time.perf_counter() - started_at)
 
         if not cold:
-           self._set_importing_and_migrating(source, target) 
+            # The source drops the keys of a slot it lost.
+            left = source.cluster_count_keys_in_slot(slot)
+            if left:
+                raise MigrationStalledException(
+                    f"{left} keys of slot {slot} are still on {source}, "
+                    f"the slot is left open")
+            self._notify_new_owner(source, target, slot, broadcaster)
 
+        if update:
+            self._update_node_config(source, target, slot)
+
+    def _iter_fixed_batches(self, source, slot, pipeline, timeout):
+        listed = None
         while True:
             keys_in_slot = source.cluster_get_keys_in_slot(slot, pipeline)
             if len(keys_in_slot) == 0:
                 break
-    
-            try:
-                source.migrate(target.host, target.port, keys_in_slot, timeout,
-                               auth=self._password)
-            except redis.exceptions.ResponseError as e:
-                if fix and str(e).find('BUSYKEY'):
-                    xprint("*** Target key exists. Replacing it for FIX.")
-                    source.migrate(target.host, target.port, keys_in_slot,
-                        timeout, auth=self._password, replace=True)
-                else:
-                    xprint("")
-                    xprint.error(f"Calling MIGRATE: {e}")
-   
-            quiet_or_not("." * len(keys_in_slot))
+            assert_keys_moved(source, slot, keys_in_slot, listed)
+            listed = keys_in_slot
+            # The size of the keys isn't known.
+            yield keys_in_slot, timeout, None
 
-        quiet_or_not()
+    def _iter_sized_batches(self, source, slot, batch_bytes,
+                            large_key_threshold, large_key_timeout, timeout):
+        '''
+        Probe the size of the next keys in the slot with pipelined
+        MEMORY USAGE, then hand out batches packed by byte budget. Big keys
+        are migrated alone with a longer timeout.
+        '''
+        listed = None
+        while True:
+            keys_in_slot = source.cluster_get_keys_in_slot(slot, PROBE_KEYS_COUNT)
+            if len(keys_in_slot) == 0:
+                break
+            assert_keys_moved(source, slot, keys_in_slot, listed)
+            listed = keys_in_slot
+            yield from sized_batches(source, keys_in_slot, batch_bytes,
+                                     large_key_threshold, large_key_timeout, timeout)
 
-        if not cold:
-            self._notify_new_owner(source, target)
+    def _migrate_fanout(self, source, target, slot, connections, plan, fix, progress):
+        '''
+        Migrate the keys of the slot over `connections` MIGRATE connections
+        to the target at once. Each round lists FANOUT_FETCH_KEYS keys with
+        one GETKEYSINSLOT, splits them with `plan` and shares the batches
+        between the connections through a queue, until the slot is drained.
+        A key is in a single batch of a round, and MIGRATE skips the keys
+        that are gone from the source, so a key migrated since it was
+        listed is harmless. Returns the keys and bytes moved, or raises
+        MigrationStalledException if a round moved no key: the slot is
+        left open rather than handed over with keys on the source.
+        '''
+        moved_keys, moved_bytes = 0, 0
+        while True:
+            left = source.cluster_count_keys_in_slot(slot)
+            keys = source.cluster_get_keys_in_slot(slot, FANOUT_FETCH_KEYS)
+            if not keys:
+                break
+            batches = queue.SimpleQueue()
+            for batch in plan(keys):
+                batches.put(batch)
 
-        if update:
-            self._update_node_config(source, target)
-    
+            def migrate(_):
+                moved = [0, 0]
+                while True:
+                    try:
+                        batch = batches.get_nowait()
+                    except queue.Empty:
+                        return moved
+                    self._migrate_batch(source, target, batch, fix, progress)
+                    moved[0] += len(batch[0])
+                    moved[1] += batch[2] or 0
+
+            for _, future in parallel_map(migrate, range(connections), connections):
+                keys_moved, bytes_moved = future.result()
+                moved_keys += keys_moved
+                moved_bytes += bytes_moved
+            # MIGRATE errors are reported, not raised: don't list the same
+            # keys forever.
+            if source.cluster_count_keys_in_slot(slot) >= left:
+                raise MigrationStalledException(
+                    f"No key of slot {slot} could be migrated from {source} to "
+                    f"{target}, the slot is left open")
+        return moved_keys, moved_bytes
+
+    def _relay_slot(self, source, target, slot, writers, plan, progress):
+        '''
+        Move the keys of the slot through this client with a Relay instead
+        of MIGRATE: batches from `plan` are read with DUMP on the source
+        while `writers` threads RESTORE the previous ones on the target.
+        Each round lists FANOUT_FETCH_KEYS raw keys, as _migrate_fanout
+        does. RESTORE replaces the keys the target already has. Returns
+        the keys and payload bytes moved, or raises
+        MigrationStalledException if a round moved no key.
+        '''
+        with Relay(source, target, writers, progress=progress) as relay:
+            while True:
+                left = source.cluster_count_keys_in_slot(slot)
+                keys = source.get_raw_keys_in_slot(slot, FANOUT_FETCH_KEYS)
+                if not keys:
+                    break
+                for batch, _, _ in plan(keys):
+                    relay.read(batch)
+                relay.join()
+                if source.cluster_count_keys_in_slot(slot) >= left:
+                    raise MigrationStalledException(
+                        f"No key of slot {slot} could be relayed from {source} to "
+                        f"{target}, the slot is left open")
+        return relay.moved, relay.bytes
+
+    def _migrate_batch(self, source, target, batch, fix, progress):
+        keys_in_slot, timeout, nbytes = batch
+        if progress:
+            progress.start(source, len(keys_in_slot))
+        self._migrate_keys(source, target, keys_in_slot, timeout, fix)
+        if progress:
+            progress.done(source, len(keys_in_slot), nbytes)
+
+    def _migrate_keys(self, source, target, keys_in_slot, timeout, fix):
+        try:
+            source.migrate(target.host, target.port, keys_in_slot, timeout,
+                           auth=self._password)
+        except redis.exceptions.ResponseError as e:
+            if fix and 'BUSYKEY' in str(e):
+                xprint("*** Target key exists. Replacing it for FIX.")
+                source.migrate(target.host, target.port, keys_in_slot,
+                    timeout, auth=self._password, replace=True)
+            else:
+                xprint("")
+                xprint.error(f"Calling MIGRATE: {e}")
+        except (redis.exceptions.TimeoutError, redis.exceptions.ConnectionError) as e:
+            # Whether the keys were migrated isn't known.
+            raise MigrationStalledException(
+                f"MIGRATE of {len(keys_in_slot)} keys from {source} to {target} "
+                f"failed: {e}, the slot is left open")
 
 
     def _compute_reshard_table(self, sources, num_slots):
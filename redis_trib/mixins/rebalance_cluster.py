@@ -1,6 +1,7 @@
 from math import ceil, floor
 from ..util import query_yes_no, xprint
 from ..const import CLUSTER_HASH_SLOTS
+from ..progress import Progress
 
 class IsNotMasterNode(Exception): pass
 class NotExistNode(Exception): pass
@@ -9,7 +10,8 @@ class RebalanceCluster:
 
     __slots__ = ()
  
-    def rebalance_cluster(self, custom_weights, use_empty_masters, pipeline, timeout, threshold, simulate):
+    def rebalance_cluster(self, custom_weights, use_empty_masters, pipeline,
+                          timeout, threshold, simulate, estimate=False, **migrate_opts):
         weights = self._create_custom_weights(custom_weights) 
 
         # Assign a weight to each node, and compute the total cluster weight.
@@ -37,10 +39,12 @@ class RebalanceCluster:
         for n in sorted_nodes:
             print(f"{n} balance is {n.balance} slots")
 
-        self._rebalance(sorted_nodes, pipeline, False) 
+        self._rebalance(sorted_nodes, pipeline, simulate, timeout=timeout,
+                        estimate=estimate, **migrate_opts)
 
  
-    def _rebalance(self, nodes_to_change, pipeline, simulate=True):
+    def _rebalance(self, nodes_to_change, pipeline, simulate=True, timeout=60,
+                   estimate=False, **migrate_opts):
         '''
         Now we have at the start of the 'sn' array nodes that should get
         slots, at the end nodes that must give slots.
@@ -50,40 +54,41 @@ class RebalanceCluster:
         '''
         dst_idx = 0
         src_idx = len(nodes_to_change) - 1
-
-        while dst_idx < src_idx:
-            dst = nodes_to_change[dst_idx]
-            src = nodes_to_change[src_idx]
-            num_slots = min(map(abs, [dst.balance, src.balance]))
-            print([dst.balance, src.balance])
-
-            if num_slots > 0:
-                xprint(f"Moving {num_slots} slots from {src} to {dst}")
-
-                # Actaully move the slots.
-                reshard_table = self._compute_reshard_table([src], num_slots)
-                if len(reshard_table) != num_slots:
-                    xprint("*** Assertion failed: Reshard table != number of slots")
-
-                if simulate:
-                    print("#" * len(reshard_table))
-                else:
-                    for _, slot in reshard_table:
-                        self._move_slot(src, dst, slot,
-                            quiet=False,
-                            dots=False,
+        total_slots = sum(n.balance for n in nodes_to_change if n.balance > 0)
+        with Progress('Rebalancing', total_slots=total_slots,
+                      quiet=simulate) as progress:
+            while dst_idx < src_idx:
+                dst = nodes_to_change[dst_idx]
+                src = nodes_to_change[src_idx]
+                num_slots = min(map(abs, [dst.balance, src.balance]))
+                print([dst.balance, src.balance])
+
+                if num_slots > 0:
+                    xprint(f"Moving {num_slots} slots from {src} to {dst}")
+
+                    # Actaully move the slots.
+                    reshard_table = self._compute_reshard_table([src], num_slots)
+                    if len(reshard_table) != num_slots:
+                        xprint("*** Assertion failed: Reshard table != number of slots")
+                    if estimate:
+                        self._print_estimated_moves(reshard_table)
+
+                    if not simulate:
+                        self._move_slots(reshard_table, dst,
+                            quiet=True,
                             update=True,
-                            pipeline=pipeline)
-                        print("#", end="")
-                print()
-
-            # Update nodes balance.
-            dst.balance += num_slots
-            src.balance -= num_slots
-            if dst.balance == 0:
-                dst_idx += 1
-            if src.balance == 0:
-                src_idx -= 1
+                            pipeline=pipeline,
+                            timeout=timeout,
+                            progress=progress,
+                            **migrate_opts)
+
+                # Update nodes balance.
+                dst.balance += num_slots
+                src.balance -= num_slots
+                if dst.balance == 0:
+                    dst_idx += 1
+                if src.balance == 0:
+                    src_idx -= 1
 
     def _create_custom_weights(self, custom_weights):
         weights = {}
@@ -1,5 +1,6 @@
 from math import ceil, floor
 from ..util import query_yes_no
+from ..progress import Progress
 
 class IsNotMasterNode(Exception): pass
 class NotExistNode(Exception): pass
@@ -8,7 +9,8 @@ class ReshardCluster:
 
     __slots__ = ()
 
-    def reshard_cluster(self, from_ids, to_id, pipeline, timeout, num_slots, slots_range, yes=False):
+    def reshard_cluster(self, from_ids, to_id, pipeline, timeout, num_slots,
+                        slots_range=None, yes=False, estimate=False, **migrate_opts):
         target = self._get_master_by_id(to_id)
         sources = [self._get_master_by_id(_id)
                    for _id in from_ids.split(',') or []]
@@ -29,12 +31,14 @@ class ReshardCluster:
         reshard_table = self._compute_reshard_table(sources, num_slots)
         print(f"  Resharding plan:")
         self._show_reshard_table(reshard_table)
+        if estimate:
+            self._print_estimated_moves(reshard_table)
 
         if yes or query_yes_no("Do you want to proceed with "\
                                "the proposed reshard plan? ", default=True):
-            for source, slot in reshard_table:
-                self._move_slot(source, target, slot,
-                                dots=True, pipeline=pipeline)
+            with Progress('Resharding', total_slots=len(reshard_table)) as progress:
+                self._move_slots(reshard_table, target, pipeline=pipeline,
+                                 timeout=timeout, progress=progress, **migrate_opts)
 
     def _get_master_by_id(self, node_id):
         node = self._get_node_by_id(node_id)
@@ -0,0 +1,192 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from ..backup_file import BackupReader
+from ..progress import Progress
+from ..util import summarize_slots
+from ..xprint import xprint
+from .backup_cluster import load_manifest
+
+
+RESTORE_STATE_FILE = 'restore.state.json'
+CHECKPOINT_BLOCKS = 64
+
+
+class RestoreWorker(threading.Thread):
+    '''
+    Pipelines RESTORE commands to a single destination master. Batches are
+    fed through a bounded queue so reading the backup can't run too far
+    ahead of the slowest destination.
+    '''
+
+    def __init__(self, node, replace=True, max_pending=8, progress=None):
+        super().__init__(daemon=True)
+        self._node = node
+        self._replace = replace
+        self._progress = progress
+        self._queue = queue.Queue(max_pending)
+        self.restored = 0
+        self.errors = 0
+
+    def put(self, records):
+        if self._progress:
+            self._progress.start(self._node, len(records))
+        self._queue.put(records)
+
+    def join_queue(self):
+        self._queue.join()
+
+    def stop(self):
+        self._queue.put(None)
+        self.join()
+
+    def run(self):
+        while True:
+            records = self._queue.get()
+            try:
+                if records is None:
+                    return
+                self._restore(records)
+            finally:
+                self._queue.task_done()
+
+    def _restore(self, records):
+        try:
+            errors = self._node.restore_keys(records, self._replace)
+        except Exception as e:
+            errors = [e] * len(records)
+        for e in errors[:1]:
+            xprint.error(f"RESTORE on {self._node}: {e}")
+        self.errors += len(errors)
+        self.restored += len(records) - len(errors)
+        if self._progress:
+            self._progress.done(self._node, len(records),
+                                sum(len(payload) for _, _, payload in records))
+
+
+class Throttle:
+
+    def __init__(self, rate):
+        self._rate = rate
+        self._started_at = time.monotonic()
+        self._count = 0
+
+    def wait(self, count):
+        if not self._rate:
+            return
+        self._count += count
+        delay = self._count / self._rate - (time.monotonic() - self._started_at)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RestoreCluster:
+
+    __slots__ = ()
+
+    def restore(self, backup_dir, batch=500, rate=None, resume=False,
+                replace=True, slots=None):
+        '''
+        Restore the backup files in backup_dir into this cluster. Records
+        are routed to the current owner of their slot, with one worker per
+        destination master pipelining RESTORE in batches. Progress is
+        checkpointed per file so an interrupted restore can be resumed.
+
+        With `slots` only the extents of these slots are read, so a large
+        restore can be split across processes by slot range.
+        '''
+        manifest = load_manifest(backup_dir)
+        created_at_ms = int(manifest['created_at'] * 1000)
+        state_path = os.path.join(backup_dir, RESTORE_STATE_FILE)
+        if slots is not None:
+            state_path = os.path.join(backup_dir,
+                             f"restore.{summarize_slots(slots)}.state.json")
+        state = self._load_restore_state(state_path) if resume else {}
+
+        slots_table = self._make_slots_table()
+        # The number of keys of the selected slots isn't known upfront.
+        total_keys = None
+        if slots is None and not resume \
+                and all('keys' in e for e in manifest['masters']):
+            total_keys = sum(e['keys'] for e in manifest['masters'])
+        progress = Progress('Restoring', total_keys=total_keys)
+        workers = {(n.host, n.port): RestoreWorker(n, replace, progress=progress)
+                   for n in self._get_masters() if n.slots}
+        for w in workers.values():
+            w.start()
+
+        throttle = Throttle(rate)
+        expired = 0
+        unowned = {}
+        try:
+            for entry in manifest['masters']:
+                file_name = entry['file']
+                offset = state.get(file_name)
+                xprint.verbose(f">>> Restoring {file_name}"
+                       + (f" from offset {offset}" if offset else ""))
+
+                with BackupReader(os.path.join(backup_dir, file_name)) as r:
+                    blocks = r.iter_blocks(offset) if slots is None \
+                                 else r.iter_slots(slots, offset)
+                    for i, (_, offset, records) in enumerate(blocks, 1):
+                        routed, skipped = self._route_records(records, slots_table,
+                                                              created_at_ms, unowned)
+                        expired += skipped
+                        for addr, dest_records in routed.items():
+                            for j in range(0, len(dest_records), batch):
+                                workers[addr].put(dest_records[j:j+batch])
+                        throttle.wait(len(records))
+
+                        if i % CHECKPOINT_BLOCKS == 0:
+                            self._checkpoint(workers, state, state_path,
+                                             file_name, offset)
+                self._checkpoint(workers, state, state_path, file_name, offset)
+        finally:
+            for w in workers.values():
+                w.stop()
+            progress.close()
+
+        restored = sum(w.restored for w in workers.values())
+        errors = sum(w.errors for w in workers.values())
+        xprint.ok(f"{restored} keys restored, {expired} expired keys skipped.")
+        if unowned:
+            xprint.error(f"{sum(unowned.values())} keys of slots without an owner "
+                         f"skipped: {summarize_slots(unowned)}")
+        if errors:
+            xprint.error(f"{errors} keys failed to restore.")
+
+    def _route_records(self, records, slots_table, created_at_ms, unowned):
+        # The PTTL of a record counts from the creation of the backup. The
+        # records of slots without an owner are counted in `unowned`.
+        routed = {}
+        expired = 0
+        now_ms = int(time.time() * 1000)
+        for slot, key, pttl, payload in records:
+            expire_at = 0
+            if pttl >= 0:
+                expire_at = created_at_ms + pttl
+                if expire_at <= now_ms:
+                    expired += 1
+                    continue
+            addr = slots_table.get(slot)
+            if addr is None:
+                unowned[slot] = unowned.get(slot, 0) + 1
+                continue
+            routed.setdefault(addr, []).append((key, expire_at, payload))
+        return routed, expired
+
+    def _checkpoint(self, workers, state, state_path, file_name, offset):
+        for w in workers.values():
+            w.join_queue()
+        state[file_name] = offset
+        with open(state_path, 'w') as f:
+            json.dump(state, f)
+
+    def _load_restore_state(self, state_path):
+        if not os.path.exists(state_path):
+            return {}
+        with open(state_path) as f:
+            return json.load(f)
@@ -0,0 +1,144 @@
+import json
+import math
+import random
+
+from ..progress import format_bytes
+from ..sampler import KeySample, PERCENTILES, scale_ci, sum_ci
+from ..util import parallel_map, chunk, DEFAULT_PARALLEL
+from ..xprint import xprint
+
+
+SAMPLE_SIZE = 1000
+# Keys sampled per round trip.
+SAMPLE_BATCH = 100
+# Keys read in each probed slot, with --by-slot.
+PROBE_KEYS = 10
+# Keys sampled per source node to size the moves of reshard and rebalance.
+PLANNER_SAMPLE_SIZE = 300
+
+
+def format_ci(ci, fmt=str, relative=True):
+    # The estimate and the half width of its interval relative to it, or
+    # the bounds of the interval.
+    if not ci:
+        return '-'
+    value, low, high = ci
+    if low == high:
+        return fmt(value)
+    if not relative:
+        return f"{fmt(value)} ({fmt(low)}-{fmt(high)})"
+    if not value:
+        return fmt(value)
+    return f"{fmt(value)} ±{max(value - low, high - value) / value:.0%}"
+
+
+def _decode_samples(samples):
+    # Vanished keys and errors are left out.
+    return [(t.decode(), size, pttl) for t, size, pttl in samples
+            if isinstance(size, int) and isinstance(pttl, int)]
+
+
+class SampleCluster:
+
+    __slots__ = ()
+
+    def sample(self, size=SAMPLE_SIZE, by_slot=False, probe_keys=PROBE_KEYS,
+               batch=SAMPLE_BATCH, parallel=DEFAULT_PARALLEL, output=None):
+        '''
+        Estimate the keyspace of every master from `size` sampled keys
+        rather than a full SCAN: bytes, mean and percentile key sizes,
+        type mix and TTLs, with 95% confidence intervals. Keys are sampled
+        with pipelined RANDOMKEY, or with `by_slot` by reading
+        `probe_keys` keys in random slots, which also estimates the keys
+        and bytes per slot. Masters are sampled in parallel. With
+        `output`, the estimates are written as JSON.
+        '''
+        masters = [n for n in self._get_masters() if n.slots]
+        summaries = self._sample_masters(masters, size, by_slot, probe_keys,
+                                         batch, parallel)
+        self._print_samples(masters, summaries)
+        if output:
+            with open(output, 'w') as f:
+                json.dump(summaries, f)
+        return summaries
+
+    def _sample_masters(self, masters, size=SAMPLE_SIZE, by_slot=False,
+                        probe_keys=PROBE_KEYS, batch=SAMPLE_BATCH,
+                        parallel=DEFAULT_PARALLEL):
+        # {addr: summary}
+        def sample(n):
+            return self._sample_node(n, size, by_slot, probe_keys, batch)
+        return {n.addr: future.result()
+                for n, future in parallel_map(sample, masters, parallel)}
+
+    def _sample_node(self, n, size, by_slot, probe_keys, batch):
+        keys = n.r.dbsize()
+        sample = KeySample()
+        if by_slot:
+            # GETKEYSINSLOT returns the first keys of a slot, not random ones.
+            slots = random.sample(sorted(n.slots),
+                                  min(len(n.slots), math.ceil(size / probe_keys)))
+            for page in chunk(slots, max(1, batch // probe_keys)):
+                probes = n.probe_slots(page, probe_keys)
+                replies = iter(n.key_samples([k for _, ks in probes for k in ks]))
+                for slot, (count, ks) in zip(page, probes):
+                    sample.add_slot(slot, count, _decode_samples(
+                                                     [next(replies) for _ in ks]))
+        elif keys:
+            # Keys deleted in the meantime are not replaced.
+            for page in chunk(range(size), batch):
+                for t, key_size, pttl in _decode_samples(
+                                             n.key_samples(n.random_keys(len(page)))):
+                    sample.add(t, key_size, pttl)
+        return sample.summary(keys, len(n.slots))
+
+    def _estimate_moves(self, moves, size=PLANNER_SAMPLE_SIZE):
+        '''
+        Keys and estimated bytes of the (source, slot) moves of a plan: the
+        keys of each slot are counted and their size is the mean key size
+        of a sample of the source.
+        '''
+        sources = {}
+        for source, slot in moves:
+            sources.setdefault(source.node_id, (source, []))[1].append(slot)
+        nodes = [source for source, _ in sources.values()]
+        summaries = self._sample_masters(nodes, size)
+
+        total_keys, estimates = 0, []
+        for source, slots in sources.values():
+            keys = sum(c for page in chunk(sorted(slots), 1000)
+                       for c in source.count_keys_in_slots(page))
+            total_keys += keys
+            estimates.append(scale_ci(summaries[source.addr].get('mean_size'), keys))
+        return total_keys, sum_ci(estimates)
+
+    def _print_estimated_moves(self, moves):
+        keys, nbytes = self._estimate_moves(moves)
+        if nbytes:
+            xprint(f"    {keys} keys to move, {format_bytes(nbytes[0])} estimated "
+                   f"(95% CI {format_bytes(nbytes[1])} - {format_bytes(nbytes[2])})")
+        else:
+            xprint(f"    {keys} keys to move")
+
+    def _print_samples(self, masters, summaries):
+        rows = [('ADDR', 'SAMPLED', 'KEYS', 'BYTES', 'MEAN_SIZE',
+                 *(f"P{p}_SIZE" for p in PERCENTILES), 'VOLATILE', 'P50_TTL', 'TYPES')]
+        for n in sorted(masters, key=lambda n: n.addr):
+            s = summaries[n.addr]
+            types = ' '.join(f"{t}={ci[0]:.0%}" for t, ci in s.get('types', {}).items())
+            rows.append((n.addr, s['sampled'], format_ci(s['keys'], lambda v: f"{v:.0f}"),
+                         format_ci(s.get('bytes'), format_bytes),
+                         format_ci(s.get('mean_size'), format_bytes),
+                         *(format_bytes(s[f'p{p}_size'][0]) if f'p{p}_size' in s else '-'
+                           for p in PERCENTILES),
+                         format_ci(s.get('volatile'), lambda v: f"{v:.0%}", relative=False),
+                         f"{s['p50_ttl'][0]:.0f}s" if 'p50_ttl' in s else '-',
+                         types or '-'))
+        widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+        for row in rows:
+            xprint('  '.join(f"{str(c):<{w}}" for c, w in zip(row, widths)).rstrip())
+
+        total = sum_ci(s.get('bytes') for s in summaries.values())
+        if total:
+            xprint.ok(f"{format_bytes(total[0])} estimated in {len(masters)} masters "
+                      f"(95% CI {format_bytes(total[1])} - {format_bytes(total[2])}).")
@@ -1,19 +1,67 @@
+import redis
+
 from ..xprint import xprint
+from ..util import parallel_map, DEFAULT_PARALLEL
+from ..const import CLUSTER_HASH_SLOTS
+from ..progress import format_bytes
+from ..sampler import sum_ci
+from .sample_cluster import format_ci
 
 
 class ShowCluster:
 
     __slots__ = ()
 
-    def show(self):
-        masters = 0
+    def show(self, parallel=DEFAULT_PARALLEL, sample=0):
+        # With `sample`, the bytes of the keys and their mean size are
+        # estimated from that many sampled keys per master.
+        masters = self._get_masters()
+        failed = self._load_masters_stats(masters, parallel)
+        summaries = self._sample_masters([n for n in masters
+                                          if n.slots and n.addr not in failed], sample,
+                                         parallel=parallel) if sample else {}
+
+        rows = [('ADDR', 'ID', 'KEYS', 'USED_MEMORY', 'OPS/SEC',
+                 'SLOTS', 'KEYS/SLOT', 'SLAVES')]
+        if sample:
+            rows[0] += ('KEY_BYTES', 'MEAN_KEY')
         keys = 0
-        for n in self._nodes:
-            if n.is_master():
-                xprint(f"{n} ({n.node_id[:8]}...) -> {n.dbsize} keys "\
-                       f"| {len(n.slots)} slots | {len(n.replicas)} slaves.")
-                masters += 1
-                keys += n.dbsize
-        xprint.ok(f"{keys} keys in {masters} masters.")
-        xprint(f"{keys/16384.0:.2f} keys per slot on average.")
+        for n in masters:
+            # A master whose stats couldn't be loaded shows '-'.
+            dbsize = n.dbsize if n.addr not in failed else None
+            row = (str(n), f"{n.node_id[:8]}...",
+                   dbsize if dbsize is not None else '-',
+                   n.stats.get('used_memory_human', '-'),
+                   n.stats.get('instantaneous_ops_per_sec', '-'),
+                   len(n.slots),
+                   f"{dbsize/len(n.slots):.2f}" if n.slots and dbsize is not None else '-',
+                   len(n.replicas))
+            if sample:
+                s = summaries.get(n.addr, {})
+                row += (format_ci(s.get('bytes'), format_bytes),
+                        format_ci(s.get('mean_size'), format_bytes))
+            rows.append(row)
+            keys += dbsize or 0
+
+        widths = [max(len(str(row[i])) for row in rows)
+                  for i in range(len(rows[0]))]
+        for row in rows:
+            xprint('  '.join(f"{str(c):<{w}}" for c, w in zip(row, widths)).rstrip())
+
+        xprint.ok(f"{keys} keys in {len(masters)} masters.")
+        xprint(f"{keys/float(CLUSTER_HASH_SLOTS):.2f} keys per slot on average.")
+        total = sum_ci(s.get('bytes') for s in summaries.values())
+        if total:
+            xprint(f"{format_bytes(total[0])} of keys estimated "
+                   f"(95% CI {format_bytes(total[1])} - {format_bytes(total[2])}).")
 
+    def _load_masters_stats(self, masters, parallel):
+        # The addresses of the masters whose stats couldn't be loaded.
+        failed = set()
+        for n, future in parallel_map(lambda n: n.load_stats(), masters, parallel):
+            try:
+                future.result()
+            except redis.exceptions.RedisError as e:
+                xprint.warning(f"Can't load the stats of {n}: {e}")
+                failed.add(n.addr)
+        return failed
@@ -0,0 +1,183 @@
+import os
+
+from more_itertools import chunked
+
+from ..backup_file import BackupReader
+from ..const import CLUSTER_HASH_SLOTS
+from ..slot_sort import SlotSorter
+from ..util import (
+    parallel_map,
+    chunk,
+    summarize_slots,
+    fold_digest,
+    merge_digests,
+    DEFAULT_PARALLEL,
+)
+from ..xprint import xprint
+from .backup_cluster import load_manifest
+from .import_cluster import key_to_slot
+
+
+MODE_DUMP = 'dump'
+MODE_LIGHT = 'light'
+
+DRILL_DOWN_LIMIT = 10
+
+
+class VerifyCluster:
+
+    __slots__ = ()
+
+    def verify(self, source_nodes=None, backup_dir=None, mode=MODE_DUMP,
+               slots=None, count=1000, parallel=DEFAULT_PARALLEL,
+               drill_down=False):
+        '''
+        Compare the data of this cluster with another cluster (source_nodes)
+        or a backup, slot by slot. Each side computes an order-independent
+        digest per slot, of key + DUMP payload (`dump`) or of key + type +
+        length (`light`), with parallel workers and pipelined commands, so
+        only the slots that differ need a closer look.
+
+        DUMP payloads depend on the object encoding, which can differ for
+        equal values (e.g. a hash that grew and shrank again), so `dump`
+        may report false differences that `light` doesn't. Backups can only
+        be verified in `dump` mode.
+        '''
+        if backup_dir and mode != MODE_DUMP:
+            xprint.error("Backups can only be verified in dump mode.")
+            return None
+
+        slots = set(slots) if slots is not None else set(range(CLUSTER_HASH_SLOTS))
+        xprint(f">>> Verifying {len(slots)} slots ({mode} mode)")
+
+        jobs = [('target', n) for n in self._get_masters() if n.slots]
+        if backup_dir:
+            jobs += [('source', os.path.join(backup_dir, e['file']))
+                     for e in load_manifest(backup_dir)['masters']]
+        else:
+            jobs += [('source', n) for n in self._get_verify_masters(source_nodes)]
+
+        def compute(job):
+            side, n = job
+            if isinstance(n, str):
+                return self._backup_slot_digests(n, slots)
+            return self._node_slot_digests(n, slots, mode, count)
+
+        digests = {'target': {}, 'source': {}}
+        for (side, _), future in parallel_map(compute, jobs, parallel):
+            merged = digests[side]
+            for slot, (num_keys, digest) in future.result().items():
+                prev_keys, prev_digest = merged.get(slot, (0, 0))
+                merged[slot] = (prev_keys + num_keys,
+                                merge_digests(prev_digest, digest))
+
+        diff = sorted(slot for slot in slots
+                      if digests['target'].get(slot, (0, 0))
+                         != digests['source'].get(slot, (0, 0)))
+        keys = sum(num_keys for num_keys, _ in digests['source'].values())
+        if not diff:
+            xprint.ok(f"All {len(slots)} slots match ({keys} keys).")
+            return diff
+
+        xprint.error(f"{len(diff)} slots differ: {summarize_slots(diff)}")
+        if drill_down:
+            target, source = self._drill_down_key_digests(diff, source_nodes,
+                                                          backup_dir, mode, count)
+        for slot in diff:
+            target_keys, _ = digests['target'].get(slot, (0, 0))
+            source_keys, _ = digests['source'].get(slot, (0, 0))
+            xprint(f"  slot {slot}: {source_keys} keys in source, "
+                   f"{target_keys} keys in target")
+            if drill_down:
+                self._print_slot_problems(target[slot], source[slot])
+        return diff
+
+    def _get_verify_masters(self, nodes):
+        # A standalone source (no node id) is a single "master".
+        return [n for n in nodes if n.is_master() and (n.slots or not n.node_id)]
+
+    def _node_slot_digests(self, n, slots, mode, count):
+        digests = {}
+        for keys in self._iter_node_keys(n, slots, count):
+            for key, digest in self._key_digests(n, keys, mode):
+                slot = key_to_slot(key)
+                num_keys, slot_digest = digests.get(slot, (0, 0))
+                digests[slot] = (num_keys + 1, merge_digests(slot_digest, digest))
+        return digests
+
+    def _iter_node_keys(self, n, slots, count):
+        # Pages of the keys of the slots, each key once: SCAN may return a
+        # key twice, which would count it twice in the digest. Cluster nodes
+        # list their keys slot by slot with GETKEYSINSLOT. A standalone node
+        # has no slots: its keys are scanned through a SlotSorter, which
+        # gives them back once each in bounded memory.
+        if n.node_id:
+            for slot in sorted(slots & set(n.slots)):
+                yield from chunk(n.get_all_keys_in_slot(slot), count)
+            return
+        with SlotSorter() as sorter:
+            for keys in n.scan_pages(count):
+                for key in keys:
+                    slot = key_to_slot(key)
+                    if slot in slots:
+                        sorter.write(slot, key)
+            yield from chunked((key for _, key, _, _ in sorter), count)
+
+    def _backup_slot_digests(self, path, slots):
+        digests = {}
+        with BackupReader(path) as r:
+            for _, _, records in r.iter_slots(slots):
+                for slot, key, _, payload in records:
+                    num_keys, digest = digests.get(slot, (0, 0))
+                    digests[slot] = (num_keys + 1, fold_digest(digest, key, payload))
+        return digests
+
+    def _key_digests(self, n, keys, mode):
+        if not keys:
+            return
+        if mode == MODE_LIGHT:
+            types = n.key_types(keys)
+            lengths = n.key_lengths(keys, types)
+            for key, t, length in zip(keys, types, lengths):
+                if t != b'none':
+                    yield key, fold_digest(0, key, t, length)
+        else:
+            for key, (payload, _) in zip(keys, n.dump_keys(keys)):
+                if payload is not None:
+                    yield key, fold_digest(0, key, payload)
+
+    def _slot_key_digests(self, nodes, slots, mode, count):
+        # {slot: {key: digest}} of the given slots, in one pass over each node.
+        key_digests = {slot: {} for slot in slots}
+        for n in nodes:
+            for keys in self._iter_node_keys(n, slots, count):
+                for key, digest in self._key_digests(n, keys, mode):
+                    key_digests[key_to_slot(key)][key] = digest
+        return key_digests
+
+    def _drill_down_key_digests(self, diff, source_nodes, backup_dir, mode, count):
+        # The key digests of the differing slots, target and source. Only
+        # these slots are held in memory.
+        slots = set(diff)
+        target = self._slot_key_digests(self._get_masters(), slots, mode, count)
+        if backup_dir:
+            source = {slot: {} for slot in slots}
+            for e in load_manifest(backup_dir)['masters']:
+                with BackupReader(os.path.join(backup_dir, e['file'])) as r:
+                    for _, _, records in r.iter_slots(slots):
+                        for slot, key, _, payload in records:
+                            source[slot][key] = fold_digest(0, key, payload)
+        else:
+            source = self._slot_key_digests(
+                         self._get_verify_masters(source_nodes), slots, mode, count)
+        return target, source
+
+    def _print_slot_problems(self, target, source):
+        problems = [('missing', k) for k in source if k not in target] \
+                 + [('extra', k) for k in target if k not in source] \
+                 + [('different', k) for k in source
+                    if k in target and source[k] != target[k]]
+        for problem, key in problems[:DRILL_DOWN_LIMIT]:
+            xprint(f"    {problem} key {key!r}")
+        if len(problems) > DRILL_DOWN_LIMIT:
+            xprint(f"    ... {len(problems) - DRILL_DOWN_LIMIT} more")
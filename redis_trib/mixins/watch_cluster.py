@@ -0,0 +1,213 @@
+import itertools
+import json
+import time
+
+import redis
+
+from ..cluster_node import Node
+from ..util import parallel_map, summarize_slots
+from ..xprint import xprint
+
+
+# CLUSTER INFO is polled on this many nodes per tick, in turn. Gossip
+# spreads epochs and slot states to every node, so a few are enough to
+# notice a change and the cost of a tick doesn't grow with the cluster.
+WATCH_NODES_PER_TICK = 3
+# Open slots only show in the CLUSTER NODES of their own node, and neither
+# opening one nor moving a slot to the master with the highest epoch
+# changes CLUSTER INFO: every SWEEP_TICKS ticks, the CLUSTER NODES of the
+# next master is fetched to catch them.
+SWEEP_TICKS = 30
+
+_TRIGGER_FIELDS = (
+    'cluster_state',
+    'cluster_current_epoch',
+    'cluster_known_nodes',
+    'cluster_slots_assigned',
+    'cluster_slots_pfail',
+    'cluster_slots_fail',
+)
+
+
+def _parse_slots(slots):
+    parsed = set()
+    for s in slots:
+        parsed.update(range(int(s[0]), int(s[-1]) + 1))
+    return parsed
+
+
+def snapshot(cluster_nodes):
+    '''
+    {node id: state} of a parsed CLUSTER NODES. Slot ranges are kept as
+    they are and only expanded for the nodes whose ranges changed. Open
+    slots are None for all nodes but the one the view comes from.
+    '''
+    return {n['node_id']: {
+        'addr': addr.split('@')[0],
+        'flags': set(n['flags'].split(',')) - {'myself'},
+        'master_id': None if n['master_id'] == '-' else n['master_id'],
+        'epoch': int(n['epoch']),
+        'slots': n['slots'],
+        'open': {**{int(s): ('migrating', dst) for s, dst in n['migrating'].items()},
+                 **{int(s): ('importing', src) for s, src in n['importing'].items()}}
+                if 'myself' in n['flags'] else None,
+    } for addr, n in cluster_nodes.items()}
+
+
+class WatchCluster:
+
+    __slots__ = ()
+
+    def watch(self, interval=1.0, ticks=None, nodes_per_tick=WATCH_NODES_PER_TICK,
+              sweep_ticks=SWEEP_TICKS, output_format='text', emit=None, stop=None):
+        '''
+        Watch the cluster and report changes as events, until interrupted,
+        for `ticks` ticks or until the `stop` event is set. Each tick polls
+        CLUSTER INFO on a few nodes only, over connections kept open.
+        CLUSTER NODES is fetched when one of them reports a change (epochs,
+        known nodes, cluster state or failing slots), and every SWEEP_TICKS
+        ticks on the next master, and then the roles and slots of all the
+        nodes are diffed. The cluster state and failing slots are the view
+        of each node, so a node is only compared with its own last reply,
+        or with the first node's until it has one.
+
+        Events: state, failover, slot_moved, node_joined, node_removed,
+        node_failed, node_recovered, open_slot and unreachable.
+        '''
+        emit = emit or self._make_event_printer(output_format)
+        seed = self._nodes[0]
+        info, _ = seed.cluster_info_and_id()
+        info = {k: str(info.get(k)) for k in _TRIGGER_FIELDS}
+        # {node id: trigger fields of its last CLUSTER INFO}
+        infos = {seed.node_id: info}
+        state = snapshot(seed.r.cluster('NODES'))
+        self._watch_open_slots({}, state, seed.node_id, emit)
+        clients = {n.node_id: n for n in self._nodes}
+        polled_ids, master_ids = self._watch_order(state)
+        unreachable = set()
+
+        for tick in (itertools.count() if ticks is None else range(ticks)):
+            started_at = time.monotonic()
+            polled = [clients[polled_ids[(tick * nodes_per_tick + i) % len(polled_ids)]]
+                      for i in range(min(nodes_per_tick, len(polled_ids)))]
+
+            changed_node = None
+            for n, future in parallel_map(lambda n: n.r.cluster('INFO'), polled):
+                try:
+                    node_info = future.result()
+                except redis.exceptions.RedisError as e:
+                    if n.node_id not in unreachable:
+                        emit('unreachable', node=str(n), error=str(e))
+                    unreachable.add(n.node_id)
+                    continue
+                unreachable.discard(n.node_id)
+                fields = {k: str(node_info.get(k)) for k in _TRIGGER_FIELDS}
+                previous = infos.get(n.node_id, info)
+                if fields != previous:
+                    if fields['cluster_state'] != previous['cluster_state']:
+                        emit('state', node=str(n), state=fields['cluster_state'],
+                             slots_fail=fields['cluster_slots_fail'])
+                    changed_node = n
+                infos[n.node_id] = fields
+
+            n = changed_node
+            if not n and sweep_ticks and master_ids \
+                    and tick % sweep_ticks == sweep_ticks - 1:
+                n = clients[master_ids[tick // sweep_ticks % len(master_ids)]]
+            if n:
+                try:
+                    new_state = snapshot(n.r.cluster('NODES'))
+                except redis.exceptions.RedisError:
+                    new_state = None
+                if new_state:
+                    self._diff(state, new_state, emit)
+                    self._watch_open_slots(state, new_state, n.node_id, emit)
+                    self._update_watch_clients(clients, new_state)
+                    state = new_state
+                    polled_ids, master_ids = self._watch_order(state)
+
+            if stop and stop.is_set():
+                break
+            if ticks is None or tick < ticks - 1:
+                time.sleep(max(0, interval - (time.monotonic() - started_at)))
+
+    def _make_event_printer(self, output_format):
+        def emit(event, **fields):
+            if output_format == 'json':
+                print(json.dumps({'time': time.time(), 'event': event, **fields}),
+                      flush=True)
+            else:
+                details = ' '.join(f"{k}={v}" for k, v in fields.items())
+                xprint(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {event} {details}",
+                       flush=True)
+        return emit
+
+    def _watch_order(self, state):
+        # The nodes polled in turn (all but the failed ones) and the
+        # masters swept in turn.
+        healthy = sorted(i for i, s in state.items() if 'fail' not in s['flags'])
+        return healthy or sorted(state), [i for i in healthy if not state[i]['master_id']]
+
+    def _diff(self, old, new, emit):
+        for node_id in new.keys() - old.keys():
+            emit('node_joined', node=new[node_id]['addr'], id=node_id)
+        for node_id in old.keys() - new.keys():
+            emit('node_removed', node=old[node_id]['addr'], id=node_id)
+
+        gained = {}
+        for node_id in new.keys() & old.keys():
+            before, after = old[node_id], new[node_id]
+            if 'fail' in after['flags'] and 'fail' not in before['flags']:
+                emit('node_failed', node=after['addr'], id=node_id)
+            elif 'fail' in before['flags'] and 'fail' not in after['flags']:
+                emit('node_recovered', node=after['addr'], id=node_id)
+
+            if before['master_id'] and not after['master_id']:
+                emit('failover', node=after['addr'], id=node_id,
+                     old_master=before['master_id'], epoch=after['epoch'])
+            # SETSLOT NODE doesn't bump the epoch of a target which already
+            # has the highest one: the slots of every node are compared.
+            if after['slots'] == before['slots']:
+                continue
+            slots = _parse_slots(after['slots']) - _parse_slots(before['slots'])
+            if slots:
+                gained[node_id] = slots
+
+        if not gained:
+            return
+        # The previous owners of the slots.
+        moved = set().union(*gained.values())
+        previous = {}
+        for node_id, s in old.items():
+            if s['slots']:
+                for slot in _parse_slots(s['slots']) & moved:
+                    previous[slot] = node_id
+        for target, slots in sorted(gained.items()):
+            by_source = {}
+            for slot in slots:
+                by_source.setdefault(previous.get(slot), []).append(slot)
+            for source, source_slots in by_source.items():
+                emit('slot_moved', slots=summarize_slots(source_slots),
+                     source=old[source]['addr'] if source else '-',
+                     target=new[target]['addr'])
+
+    def _watch_open_slots(self, old, new, node_id, emit):
+        # Only the node a view comes from shows its open slots. For the
+        # other nodes, what was seen last is kept.
+        for other_id, s in new.items():
+            if s['open'] is None:
+                s['open'] = (old.get(other_id) or {}).get('open')
+        previous = (old.get(node_id) or {}).get('open') or {}
+        for slot, (direction, other) in sorted(new[node_id]['open'].items()):
+            if previous.get(slot) != (direction, other):
+                emit('open_slot', node=new[node_id]['addr'], slot=slot,
+                     direction=direction, other=other)
+
+    def _update_watch_clients(self, clients, state):
+        for node_id in clients.keys() - state.keys():
+            del clients[node_id]
+        for node_id in state.keys() - clients.keys():
+            node = Node(state[node_id]['addr'], self._password)
+            node._node_id = node_id
+            node.connect(ping=False)
+            clients[node_id] = node
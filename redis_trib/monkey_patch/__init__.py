@@ -1,2 +0,0 @@
-from .click_ import * 
-from .redis_ import *
@@ -1,27 +1,22 @@
+import click
 
 
-def patch_click_module():
-    import click
+def _set_verbose(ctx, param, value):
+    if value:
+        from redis_trib.xprint import xprint, LOG_LEVEL_VERBOSE
+        xprint.set_loglevel(LOG_LEVEL_VERBOSE)
 
-    def set_verbose(ctx, param, value):
-        if value:
-            from redis_trib.xprint import xprint, LOG_LEVEL_VERBOSE
-            xprint.set_loglevel(LOG_LEVEL_VERBOSE)
-    
-    def verbose_option(*param_decls, **attrs):
-        def decorator(f):
-            attrs.setdefault('is_flag', True)
-            attrs.setdefault('callback', set_verbose)
-            return click.option(*(param_decls or ('-v', '--verbose',)), **attrs)(f)
-        return decorator
-    
-    def password_option(*param_decls, **attrs):
-        def decorator(f):
-            return click.option(*(param_decls or ('-p', '--password',)), **attrs)(f)
-        return decorator
-    
-    
-    click.verbose_option = verbose_option
-    click.password_option = password_option
 
+def verbose_option(*param_decls, **attrs):
+    def decorator(f):
+        attrs.setdefault('is_flag', True)
+        attrs.setdefault('callback', _set_verbose)
+        attrs.setdefault('expose_value', False)
+        return click.option(*(param_decls or ('-v', '--verbose',)), **attrs)(f)
+    return decorator
 
+
+def password_option(*param_decls, **attrs):
+    def decorator(f):
+        return click.option(*(param_decls or ('-p', '--password',)), **attrs)(f)
+    return decorator
@@ -1,34 +1,44 @@
+def _parse_moving_slots(slots_exp, symbol):
+    return dict(sl[1:-1].split(symbol)
+                for sl in slots_exp
+                if sl.find(symbol) != -1)
 
 
-def patch_redis_module():
-    import redis
+def parse_node_line(line):
+    line_items = line.split(' ')
+    node_id, addr, flags, master_id, ping, pong, epoch, \
+        connected = line.split(' ')[:8]
+    slots = [sl.split('-') for sl in line_items[8:] if sl[0] != '[']
+    migrating = _parse_moving_slots(line_items[8:], '->-')
+    importing = _parse_moving_slots(line_items[8:], '-<-')
+    node_dict = {
+        'node_id': node_id,
+        'flags': flags,
+        'master_id': master_id,
+        'last_ping_sent': ping,
+        'last_pong_rcvd': pong,
+        'epoch': epoch,
+        'slots': slots,
+        'migrating': migrating,
+        'importing': importing,
+        'connected': True if connected == 'connected' else False
+    }
+    return addr, node_dict
 
-    def _parse_moving_slots(slots_exp, symbol):
-        return dict(sl[1:-1].split(symbol)
-                    for sl in slots_exp
-                    if sl.find(symbol) != -1)
-    
-    def _parse_node_line(line):
-        line_items = line.split(' ')
-        node_id, addr, flags, master_id, ping, pong, epoch, \
-            connected = line.split(' ')[:8]
-        slots = [sl.split('-') for sl in line_items[8:] if sl[0] != '[']
-        migrating = _parse_moving_slots(line_items[8:], '->-')
-        importing = _parse_moving_slots(line_items[8:], '-<-')
-        node_dict = {
-            'node_id': node_id,
-            'flags': flags.split(','),
-            'master_id': master_id,
-            'last_ping_sent': ping,
-            'last_pong_rcvd': pong,
-            'epoch': epoch,
-            'slots': slots,
-            'migrating': migrating,
-            'importing': importing,
-            'connected': True if connected == 'connected' else False
-        }
-        return addr, node_dict
 
-    redis.client._parse_moving_slots = _parse_moving_slots
-    redis.client._parse_node_line = _parse_node_line 
+def parse_cluster_nodes(response, **options):
+    if isinstance(response, bytes):
+        response = response.decode()
+    if isinstance(response, str):
+        response = response.splitlines()
+    return dict(parse_node_line(line) for line in response if line)
 
+
+def set_response_callbacks(client):
+    '''
+    Parse CLUSTER NODES of a redis-py client (sync or asyncio) the way
+    redis-trib needs it: addresses with their bus port, and the open
+    slots. Set per client, so the redis module itself is left untouched.
+    '''
+    client.set_response_callback('CLUSTER NODES', parse_cluster_nodes)
+    return client
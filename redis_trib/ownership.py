@@ -0,0 +1,105 @@
+'''
+Broadcast of the new owner of moved slots with CLUSTER SETSLOT NODE.
+
+The target and the source of a slot are told right away, in that order:
+the target to take the slot and bump its epoch, the source to stop
+serving it and redirect with MOVED rather than ASK. The other masters
+would learn it from gossip anyway and are only told to speed it up, so
+their notifications can wait: they are queued and sent in one pipeline
+per master, all masters in parallel, once `batch` slots are queued,
+`interval` seconds after the oldest one or when flushed. Until then, a
+master that wasn't told redirects clients to the source, which redirects
+them to the target.
+'''
+
+import time
+
+from .util import parallel_map, chunk, DEFAULT_PARALLEL
+from .xprint import xprint
+
+
+# Slots per SETSLOT pipeline, and slots queued before a broadcast.
+SETSLOT_BATCH = 1000
+BROADCAST_INTERVAL = 1.0
+
+
+def setslot_pipelined(node, slots, subcommand, other):
+    '''
+    CLUSTER SETSLOT <slot> <subcommand> <other> for every slot,
+    SETSLOT_BATCH per round trip. Errors are reported and the slots that
+    succeeded returned.
+    '''
+    done = []
+    for page in chunk(slots, SETSLOT_BATCH):
+        replies = node.execute_pipeline([('CLUSTER', 'SETSLOT', slot, subcommand,
+                                          other.node_id) for slot in page])
+        for slot, reply in zip(page, replies):
+            if isinstance(reply, Exception):
+                xprint.error(f"{node}: CLUSTER SETSLOT {slot} {subcommand}: {reply}")
+            else:
+                done.append(slot)
+    return done
+
+
+class OwnershipBroadcaster:
+
+    def __init__(self, masters, batch=SETSLOT_BATCH, interval=BROADCAST_INTERVAL,
+                 parallel=DEFAULT_PARALLEL, clock=time.monotonic):
+        self._masters = list(masters)
+        self._batch = batch
+        self._interval = interval
+        self._parallel = parallel
+        self._clock = clock
+        # [(node, [(slot, target)])] in the order of self._masters.
+        self._pending = [(n, []) for n in self._masters]
+        self._queued = 0
+        self._oldest = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def notify(self, source, target, slots):
+        '''
+        Tell the target then the source that target owns `slots` (a slot
+        or a list of them), and queue the notification of the other
+        masters. Returns the slots the target took.
+        '''
+        slots = slots if isinstance(slots, list) else [slots]
+        slots = setslot_pipelined(target, slots, 'NODE', target)
+        if not slots:
+            return slots
+        setslot_pipelined(source, slots, 'NODE', target)
+
+        for n, queue in self._pending:
+            if n is not source and n is not target:
+                queue.extend((slot, target) for slot in slots)
+        self._queued += len(slots)
+        if self._oldest is None:
+            self._oldest = self._clock()
+        if self._queued >= self._batch or self._clock() - self._oldest >= self._interval:
+            self.flush()
+        return slots
+
+    def flush(self):
+        '''
+        Send the queued notifications, one pipeline per master with all
+        masters in parallel.
+        '''
+        pending = [(n, queue) for n, queue in self._pending if queue]
+        self._pending = [(n, []) for n in self._masters]
+        self._queued, self._oldest = 0, None
+        if not pending:
+            return
+        for _, future in parallel_map(lambda e: self._send(*e), pending, self._parallel):
+            future.result()
+
+    def _send(self, node, queue):
+        for page in chunk(queue, SETSLOT_BATCH):
+            replies = node.execute_pipeline([('CLUSTER', 'SETSLOT', slot, 'NODE',
+                                              target.node_id) for slot, target in page])
+            for (slot, _), reply in zip(page, replies):
+                if isinstance(reply, Exception):
+                    xprint.error(f"{node}: CLUSTER SETSLOT {slot} NODE: {reply}")
@@ -0,0 +1,165 @@
+'''
+A progress line for long operations (slot migrations, imports, backups
+and restores): slots done, keys and bytes with their rate, the work in
+flight per node and an ETA.
+
+Rates are exponentially weighted moving averages, updated at each refresh,
+so the ETA follows the current speed rather than the average since the
+start. Counters can be updated from many threads and as often as needed:
+the line is only written every `interval` seconds, rewritten in place on
+a terminal, or as a new line every NON_TTY_INTERVAL seconds otherwise.
+'''
+
+import sys
+import threading
+import time
+
+
+REFRESH_INTERVAL = 0.5
+NON_TTY_INTERVAL = 10.0
+# Weight of the last interval in the moving average of the rates.
+EWMA_ALPHA = 0.3
+MAX_IN_FLIGHT_NODES = 4
+
+
+def format_bytes(nbytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if nbytes < 1024:
+            return f"{nbytes:.1f} {unit}" if unit != 'B' else f"{nbytes:.0f} B"
+        nbytes /= 1024
+    return f"{nbytes:.1f} TB"
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class Progress:
+
+    def __init__(self, title, total_slots=None, total_keys=None,
+                 interval=None, stream=None, quiet=False, clock=time.monotonic):
+        self._title = title
+        self._total_slots = total_slots
+        self._total_keys = total_keys
+        self._stream = stream or sys.stdout
+        self._tty = self._stream.isatty()
+        self._interval = interval or (REFRESH_INTERVAL if self._tty else NON_TTY_INTERVAL)
+        self._quiet = quiet
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self.slots = 0
+        self.keys = 0
+        self.bytes = 0
+        self.in_flight = {}
+        self.key_rate = None
+        self.byte_rate = None
+        self.slot_rate = None
+
+        self._started_at = self._last_at = clock()
+        self._last = (0, 0, 0)
+        self._width = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self, node, keys):
+        '''
+        `keys` are being sent to or read from `node`.
+        '''
+        with self._lock:
+            node = str(node)
+            self.in_flight[node] = self.in_flight.get(node, 0) + keys
+
+    def done(self, node, keys, nbytes=0):
+        with self._lock:
+            node = str(node)
+            in_flight = self.in_flight.get(node, 0) - keys
+            if in_flight > 0:
+                self.in_flight[node] = in_flight
+            else:
+                self.in_flight.pop(node, None)
+            self.keys += keys
+            self.bytes += nbytes or 0
+        self.refresh()
+
+    def slot_done(self, count=1):
+        with self._lock:
+            self.slots += count
+        self.refresh()
+
+    def eta(self):
+        if self._total_slots and self.slot_rate:
+            return max(self._total_slots - self.slots, 0) / self.slot_rate
+        if self._total_keys and self.key_rate:
+            return max(self._total_keys - self.keys, 0) / self.key_rate
+        return None
+
+    def refresh(self, force=False):
+        now = self._clock()
+        if not force and now - self._last_at < self._interval:
+            return
+        with self._lock:
+            # Another thread may have refreshed in the meantime.
+            elapsed = now - self._last_at
+            if not force and elapsed < self._interval:
+                return
+            if elapsed > 0:
+                self._update_rates(elapsed)
+                self._last_at = now
+            line = self.line()
+        self._write(line)
+
+    def close(self):
+        self.refresh(force=True)
+        if not self._quiet and self._tty:
+            self._stream.write('\n')
+            self._stream.flush()
+
+    def _update_rates(self, elapsed):
+        last_slots, last_keys, last_bytes = self._last
+        rates = []
+        for value, last, rate in ((self.slots, last_slots, self.slot_rate),
+                                  (self.keys, last_keys, self.key_rate),
+                                  (self.bytes, last_bytes, self.byte_rate)):
+            current = (value - last) / elapsed
+            rates.append(current if rate is None
+                         else EWMA_ALPHA * current + (1 - EWMA_ALPHA) * rate)
+        self.slot_rate, self.key_rate, self.byte_rate = rates
+        self._last = (self.slots, self.keys, self.bytes)
+
+    def line(self):
+        parts = [self._title]
+        if self._total_slots:
+            parts.append(f"slots {self.slots}/{self._total_slots}")
+        keys = f"{self.keys:,}/{self._total_keys:,}" if self._total_keys \
+                   else f"{self.keys:,}"
+        parts.append(f"keys {keys} ({self.key_rate or 0:,.0f}/s)")
+        if self.bytes:
+            parts.append(f"{format_bytes(self.bytes)} "
+                         f"({format_bytes(self.byte_rate or 0)}/s)")
+        eta = self.eta()
+        parts.append(f"ETA {format_duration(eta)}" if eta is not None else "ETA -")
+        if self.in_flight:
+            busiest = sorted(self.in_flight.items(), key=lambda e: -e[1])
+            nodes = ' '.join(f"{node}={keys}"
+                             for node, keys in busiest[:MAX_IN_FLIGHT_NODES])
+            if len(busiest) > MAX_IN_FLIGHT_NODES:
+                nodes += f" +{len(busiest) - MAX_IN_FLIGHT_NODES}"
+            parts.append(f"in flight {nodes}")
+        return ' | '.join(parts)
+
+    def _write(self, line):
+        if self._quiet:
+            return
+        if self._tty:
+            # Pad to wipe the end of a longer previous line.
+            self._stream.write(f"\r{line:<{self._width}}")
+            self._width = len(line)
+        else:
+            self._stream.write(f"{line}\n")
+        self._stream.flush()
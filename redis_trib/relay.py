@@ -0,0 +1,120 @@
+'''
+Migration of keys through this client with DUMP and RESTORE, instead of
+MIGRATE. MIGRATE needs the source to reach the target and blocks the
+source while it sends each batch; the relay only needs this client to
+reach both, and the source only serves pipelined DUMP, PTTL and UNLINK.
+
+Keys are read from the source in the calling thread with pipelined DUMP
+and PTTL, and queued to writer threads that RESTORE them on the target
+(with ASKING, as the slot is importing) then UNLINK them on the source,
+so reading the next batch overlaps writing the previous one. Payloads
+stay raw bytes from end to end.
+
+Unlike MIGRATE, a key isn't moved atomically: a write to it on the
+source between its DUMP and its UNLINK is lost.
+'''
+
+import queue
+import threading
+import time
+
+from .xprint import xprint
+
+
+# Batches read ahead of the writers.
+RELAY_MAX_PENDING = 8
+
+
+def to_records(keys, dumps, now_ms):
+    '''
+    (key, expire_at_ms, payload) records of the DUMP + PTTL replies of
+    keys, 0 meaning no expiry. Vanished keys are left out.
+    '''
+    records = []
+    for key, (payload, pttl) in zip(keys, dumps):
+        if payload is None or pttl is None or pttl == -2:
+            continue
+        records.append((key, now_ms + pttl if pttl >= 0 else 0, payload))
+    return records
+
+
+class Relay:
+
+    def __init__(self, source, target, writers=1, max_pending=RELAY_MAX_PENDING,
+                 progress=None):
+        self._source = source
+        self._target = target
+        self._progress = progress
+        self._queue = queue.Queue(max_pending)
+        self._lock = threading.Lock()
+        self._writers = [threading.Thread(target=self._run, daemon=True)
+                         for _ in range(writers)]
+        self.moved = 0
+        self.bytes = 0
+        self.errors = 0
+
+    def __enter__(self):
+        for writer in self._writers:
+            writer.start()
+        return self
+
+    def __exit__(self, *exc):
+        for _ in self._writers:
+            self._queue.put(None)
+        for writer in self._writers:
+            writer.join()
+
+    def read(self, keys):
+        '''
+        DUMP and PTTL keys on the source and queue them for the writers.
+        Blocks while RELAY_MAX_PENDING batches are waiting.
+        '''
+        if self._progress:
+            self._progress.start(self._source, len(keys))
+        now_ms = int(time.time() * 1000)
+        records = to_records(keys, self._source.dump_keys(keys), now_ms)
+        self._queue.put((len(keys), records))
+
+    def join(self):
+        # Wait for the queued batches to be written.
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is None:
+                    return
+                self._write(*batch)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, count, records):
+        try:
+            replies = self._target.restore_replies(records, asking=True)
+        except Exception as e:
+            replies = [e] * len(records)
+        restored = [r for r, reply in zip(records, replies)
+                    if not isinstance(reply, Exception)]
+        errors = [reply for reply in replies if isinstance(reply, Exception)]
+        for e in errors[:1]:
+            xprint.error(f"RESTORE on {self._target}: {e}")
+
+        # Only the keys now on the target leave the source. Those already
+        # gone from it don't matter.
+        unlinked = True
+        if restored:
+            try:
+                self._source.unlink_keys([key for key, _, _ in restored])
+            except Exception as e:
+                xprint.error(f"UNLINK on {self._source}: {e}")
+                unlinked = False
+
+        nbytes = sum(len(payload) for _, _, payload in restored)
+        with self._lock:
+            self.errors += len(errors)
+            if unlinked:
+                self.moved += len(restored)
+                self.bytes += nbytes
+        if self._progress:
+            self._progress.done(self._source, count, nbytes)
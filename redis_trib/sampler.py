@@ -0,0 +1,197 @@
+'''
+Estimates of the keyspace of a node from a sample of its keys, instead of
+a full SCAN: key count, bytes, key size percentiles, type mix and TTLs,
+each with a 95% confidence interval as [estimate, low, high].
+
+Keys are sampled either with RANDOMKEY, which draws keys uniformly, or by
+probing random slots with COUNTKEYSINSLOT and GETKEYSINSLOT. A probed key
+then stands for `keys in its slot / keys probed in its slot` keys, and
+the estimates are weighted accordingly. Probes also give the key count
+and bytes per slot, and the key count of the node when DBSIZE isn't used.
+'''
+
+import math
+
+
+# Two-sided 95% normal quantile.
+Z = 1.96
+PERCENTILES = (50, 90, 99)
+
+
+def mean_ci(values, weights=None):
+    '''
+    Weighted mean and its confidence interval, from the linearized
+    variance of the ratio estimator (the usual one without weights).
+    '''
+    weights = weights or [1] * len(values)
+    total = sum(weights)
+    if not total:
+        return None
+    mean = sum(w * v for v, w in zip(values, weights)) / total
+    n = len(values)
+    if n < 2:
+        return [mean, mean, mean]
+    variance = n / (n - 1) * sum((w * (v - mean)) ** 2
+                                 for v, w in zip(values, weights)) / total ** 2
+    half = Z * math.sqrt(variance)
+    return [mean, mean - half, mean + half]
+
+
+def effective_size(weights):
+    # Kish's effective sample size.
+    return sum(weights) ** 2 / sum(w * w for w in weights) if weights else 0
+
+
+def proportion_ci(hits, n):
+    '''
+    Wilson score interval of the proportion `hits / n`, n may be an
+    effective (non integer) sample size.
+    '''
+    if not n:
+        return None
+    p = hits / n
+    denominator = 1 + Z * Z / n
+    center = (p + Z * Z / (2 * n)) / denominator
+    half = Z * math.sqrt(p * (1 - p) / n + Z * Z / (4 * n * n)) / denominator
+    return [p, max(0.0, center - half), min(1.0, center + half)]
+
+
+def percentile_ci(values, percentile, weights=None):
+    '''
+    Weighted percentile and its distribution-free confidence interval:
+    the values at the ranks q +/- Z * sqrt(q (1 - q) / n).
+    '''
+    if not values:
+        return None
+    weights = weights or [1] * len(values)
+    pairs = sorted(zip(values, weights))
+    total = sum(weights)
+    q = percentile / 100
+    half = Z * math.sqrt(q * (1 - q) / effective_size(weights))
+
+    def at(level):
+        level = min(max(level, 0.0), 1.0) * total
+        cumulative = 0
+        for v, w in pairs:
+            cumulative += w
+            if cumulative >= level:
+                return v
+        return pairs[-1][0]
+
+    return [at(q), at(q - half), at(q + half)]
+
+
+def total_ci(values, population):
+    '''
+    Estimate of the total over a population of `population` units from
+    the values of a simple random sample of them, with the finite
+    population correction.
+    '''
+    n = len(values)
+    if not n:
+        return None
+    mean = sum(values) / n
+    total = population * mean
+    if n < 2:
+        return [total, total, total]
+    variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+    fpc = max(0.0, 1 - n / population)
+    half = Z * population * math.sqrt(variance / n * fpc)
+    return [total, max(0.0, total - half), total + half]
+
+
+def scale_ci(ci, factor):
+    return [v * factor for v in ci] if ci else None
+
+
+def sum_ci(cis):
+    '''
+    Sum of independent estimates, the half widths added in quadrature.
+    '''
+    cis = [ci for ci in cis if ci]
+    if not cis:
+        return None
+    total = sum(ci[0] for ci in cis)
+    half = math.sqrt(sum(((ci[2] - ci[1]) / 2) ** 2 for ci in cis))
+    return [total, max(0.0, total - half), total + half]
+
+
+class KeySample:
+    '''
+    The sampled keys of one node: their (type, size, pttl) and weight,
+    and the slots probed with their key counts.
+    '''
+
+    def __init__(self):
+        self.types = []
+        self.sizes = []
+        self.ttls = []
+        self.weights = []
+        # {slot: (keys in slot, estimated bytes)}
+        self.slots = {}
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def add(self, key_type, size, pttl, weight=1):
+        self.types.append(key_type)
+        self.sizes.append(size)
+        self.ttls.append(pttl)
+        self.weights.append(weight)
+
+    def add_slot(self, slot, keys, samples):
+        '''
+        A probed slot with its key count and the (type, size, pttl) of the
+        keys read from it.
+        '''
+        samples = [s for s in samples if s[1] is not None]
+        weight = keys / len(samples) if samples else 0
+        for key_type, size, pttl in samples:
+            self.add(key_type, size, pttl, weight)
+        self.slots[slot] = (keys, sum(s[1] for s in samples) * weight)
+
+    def summary(self, keys=None, owned_slots=None):
+        '''
+        The estimates. `keys` is the known key count of the node; without
+        it, the count is estimated from the probed slots, out of
+        `owned_slots`.
+        '''
+        n = len(self)
+        summary = {'sampled': n}
+        if self.slots and owned_slots:
+            counts = [c for c, _ in self.slots.values()]
+            summary['probed_slots'] = len(self.slots)
+            summary['keys'] = [keys] * 3 if keys is not None \
+                                  else total_ci(counts, owned_slots)
+            summary['bytes'] = total_ci([b for _, b in self.slots.values()], owned_slots)
+            summary['keys_per_slot'] = mean_ci(counts)
+            summary['slots'] = {str(slot): {'keys': c, 'bytes': b}
+                                for slot, (c, b) in sorted(self.slots.items())}
+        else:
+            summary['keys'] = [keys] * 3 if keys is not None else None
+        if not n or not sum(self.weights):
+            return summary
+
+        mean_size = mean_ci(self.sizes, self.weights)
+        summary['mean_size'] = mean_size
+        if 'bytes' not in summary and keys is not None:
+            summary['bytes'] = scale_ci(mean_size, keys)
+        for p in PERCENTILES:
+            summary[f'p{p}_size'] = percentile_ci(self.sizes, p, self.weights)
+
+        n_eff = effective_size(self.weights)
+        total = sum(self.weights)
+        by_type = {}
+        for key_type, w in zip(self.types, self.weights):
+            by_type[key_type] = by_type.get(key_type, 0) + w
+        summary['types'] = {t: proportion_ci(w / total * n_eff, n_eff)
+                            for t, w in sorted(by_type.items())}
+
+        volatile = [(pttl, w) for pttl, w in zip(self.ttls, self.weights) if pttl >= 0]
+        summary['volatile'] = proportion_ci(sum(w for _, w in volatile) / total * n_eff,
+                                            n_eff)
+        if volatile:
+            ttls, ttl_weights = [t / 1000 for t, _ in volatile], [w for _, w in volatile]
+            for p in PERCENTILES:
+                summary[f'p{p}_ttl'] = percentile_ci(ttls, p, ttl_weights)
+        return summary
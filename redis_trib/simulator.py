@@ -0,0 +1,867 @@
+'''
+In-process simulated Redis Cluster, for tests and benchmarks.
+
+Every simulated node listens on a local TCP port and speaks enough RESP
+for redis-py, and so Node and the mixins, to talk to it unmodified. All
+nodes are served by a single asyncio event loop in a background thread,
+so hundreds of nodes fit in one process:
+
+    with SimulatedCluster(masters=3, keys=10000) as cluster:
+        nodes, _ = NodesFactory.create_nodes_with_friends(cluster.addrs[0], None)
+
+What is simulated:
+
+* CLUSTER NODES/INFO/MYID/KEYSLOT/MEET/FORGET/REPLICATE/RESET/
+  ADDSLOTS/DELSLOTS/SETSLOT/BUMPEPOCH/SET-CONFIG-EPOCH/GETKEYSINSLOT/
+  COUNTKEYSINSLOT, with MOVED/ASK redirections and ASKING.
+* String keys: GET, SET, DEL, EXISTS, TYPE, STRLEN, PTTL/TTL, PEXPIRE/
+  EXPIRE, DUMP, RESTORE, OBJECT IDLETIME/FREQ, MEMORY USAGE, SCAN, RANDOMKEY,
+  MIGRATE.
+* PING, AUTH, SELECT, DBSIZE, INFO, CONFIG GET/SET, MULTI/EXEC/DISCARD.
+
+Gossip is instant: a node learns every change of slot ownership and
+every node met by any node it knows as soon as it happens. Replicas don't
+replicate data. DUMP payloads are opaque to clients but are not RDB.
+
+`latency` delays every command, in seconds, either by the same amount or
+by command name: {'MIGRATE': 0.002, 'CLUSTER SETSLOT': 0.001, '*': 0.0001}.
+
+SCAN returns keys slot by slot, as servers with a dictionary per slot
+(Redis 7.4+) do. With `scan_order='hash'` it returns them in the order of
+a hash of the key instead, mixing slots on every page, as older servers
+do.
+'''
+
+import asyncio
+import fnmatch
+import os
+import random
+import threading
+import time
+import zlib
+
+from .const import CLUSTER_HASH_SLOTS
+from .mixins.import_cluster import key_to_slot
+
+
+DUMP_PREFIX = b'SIMDUMP\x00'
+
+_KEY_COMMANDS = {
+    'GET', 'SET', 'DEL', 'EXISTS', 'TYPE', 'STRLEN', 'PTTL', 'TTL',
+    'PEXPIRE', 'EXPIRE', 'DUMP', 'RESTORE', 'UNLINK',
+}
+
+
+class ReplyError(Exception):
+    pass
+
+
+class Status(str):
+    pass
+
+
+OK = Status('OK')
+
+
+def encode_reply(reply, protocol=2):
+    # dicts are maps in RESP3 and flat arrays in RESP2.
+    if isinstance(reply, ReplyError):
+        return b'-' + str(reply).encode() + b'\r\n'
+    if isinstance(reply, Status):
+        return b'+' + reply.encode() + b'\r\n'
+    if reply is None:
+        return b'_\r\n' if protocol == 3 else b'$-1\r\n'
+    if isinstance(reply, bool):
+        reply = int(reply)
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, str):
+        reply = reply.encode()
+    if isinstance(reply, (bytes, bytearray)):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    if isinstance(reply, dict):
+        if protocol == 3:
+            return b'%%%d\r\n' % len(reply) + b''.join(
+                       encode_reply(i, protocol) for kv in reply.items() for i in kv)
+        reply = [i for kv in reply.items() for i in kv]
+    if isinstance(reply, (list, tuple)):
+        return b'*%d\r\n' % len(reply) + b''.join(encode_reply(r, protocol)
+                                                    for r in reply)
+    raise TypeError(f"Can't encode {reply!r}")
+
+
+async def read_command(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        # Inline command, as typed in telnet.
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        length = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class Entry:
+
+    __slots__ = ('value', 'expire_at', 'accessed_at', 'hits')
+
+    def __init__(self, value, expire_at=None):
+        self.value = value
+        self.expire_at = expire_at
+        self.accessed_at = time.time()
+        self.hits = 0
+
+
+class SimulatedNode:
+    '''
+    State of one node. Commands are executed by `execute`, which is only
+    called from the event loop thread.
+    '''
+
+    def __init__(self, cluster, host, port):
+        self.cluster = cluster
+        self.host = host
+        self.port = port
+        self.node_id = os.urandom(20).hex()
+        self.master_id = None
+        self.config_epoch = 0
+        self.known = {self.node_id}
+        self.migrating = {}
+        self.importing = {}
+        self.config = {
+            'notify-keyspace-events': '',
+            'maxmemory-policy': 'noeviction',
+            'cluster-node-timeout': '15000',
+        }
+        self.data = {}
+        self.slot_keys = {}
+        self.commands_processed = 0
+        self.server = None
+
+    @property
+    def addr(self):
+        return f"{self.host}:{self.port}"
+
+    @property
+    def slots(self):
+        return self.cluster.slots_of(self)
+
+    def is_master(self):
+        return self.master_id is None
+
+    # Key space
+
+    def get(self, key, touch=True):
+        entry = self.data.get(key)
+        if entry and entry.expire_at is not None and entry.expire_at <= _now_ms():
+            self.delete(key)
+            return None
+        if entry and touch:
+            entry.accessed_at = time.time()
+            entry.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self.data[key] = entry
+        self.slot_keys.setdefault(key_to_slot(key), {})[key] = None
+
+    def delete(self, key):
+        if self.data.pop(key, None) is None:
+            return False
+        keys = self.slot_keys.get(key_to_slot(key))
+        keys.pop(key, None)
+        if not keys:
+            del self.slot_keys[key_to_slot(key)]
+        return True
+
+    def keys_in_slot(self, slot):
+        return [k for k in list(self.slot_keys.get(slot, ())) if self.get(k, touch=False)]
+
+    # Command execution
+
+    async def execute(self, args, session):
+        name = args[0].decode().upper()
+        if name == 'CLUSTER' and len(args) > 1:
+            full_name = f"CLUSTER {args[1].decode().upper()}"
+        else:
+            full_name = name
+        await self.cluster.delay(full_name)
+        self.commands_processed += 1
+
+        if session.multi is not None and name not in ('EXEC', 'DISCARD', 'MULTI'):
+            session.multi.append(args)
+            return Status('QUEUED')
+
+        asking, session.asking = session.asking, False
+        try:
+            if name in _KEY_COMMANDS and len(args) > 1:
+                self._check_key_slots(name, args, asking)
+            method = getattr(self, f"cmd_{name.lower().replace('-', '_')}", None)
+            if method is None:
+                raise ReplyError(f"ERR unknown command '{name}'")
+            reply = method(args[1:], session)
+            if asyncio.iscoroutine(reply):
+                reply = await reply
+            return reply
+        except ReplyError as e:
+            return e
+        except (ValueError, IndexError):
+            return ReplyError(f"ERR syntax error in '{name}'")
+
+    def _check_key_slots(self, name, args, asking):
+        keys = args[1:] if name in ('DEL', 'EXISTS', 'UNLINK') else args[1:2]
+        slots = {key_to_slot(k) for k in keys}
+        if len(slots) > 1:
+            raise ReplyError("CROSSSLOT Keys in request don't hash to the same slot")
+        slot = slots.pop()
+        owner = self.cluster.owners[slot]
+        if owner is self:
+            target = self.cluster.nodes_by_id.get(self.migrating.get(slot))
+            if target and not all(self.get(k) for k in keys) and name != 'RESTORE':
+                raise ReplyError(f"ASK {slot} {target.addr}")
+            return
+        if asking and slot in self.importing:
+            return
+        if owner is None:
+            raise ReplyError("CLUSTERDOWN Hash slot not served")
+        raise ReplyError(f"MOVED {slot} {owner.addr}")
+
+    # Connection and server
+
+    def cmd_ping(self, args, session):
+        return args[0] if args else Status('PONG')
+
+    def cmd_auth(self, args, session):
+        return OK
+
+    def cmd_hello(self, args, session):
+        if args:
+            if int(args[0]) not in (2, 3):
+                raise ReplyError("NOPROTO unsupported protocol version")
+            session.protocol = int(args[0])
+        return {'server': 'redis', 'version': '7.0.0', 'proto': session.protocol,
+                'id': 1, 'mode': 'cluster',
+                'role': 'master' if self.is_master() else 'replica',
+                'modules': []}
+
+    def cmd_select(self, args, session):
+        if int(args[0]) != 0:
+            raise ReplyError("ERR SELECT is not allowed in cluster mode")
+        return OK
+
+    def cmd_client(self, args, session):
+        return OK
+
+    def cmd_asking(self, args, session):
+        session.asking = True
+        return OK
+
+    def cmd_readonly(self, args, session):
+        return OK
+
+    def cmd_multi(self, args, session):
+        session.multi = []
+        return OK
+
+    def cmd_discard(self, args, session):
+        session.multi = None
+        return OK
+
+    async def cmd_exec(self, args, session):
+        if session.multi is None:
+            raise ReplyError("ERR EXEC without MULTI")
+        queued, session.multi = session.multi, None
+        return [await self.execute(command, session) for command in queued]
+
+    def cmd_dbsize(self, args, session):
+        return len(self.data)
+
+    def cmd_randomkey(self, args, session):
+        while self.data:
+            key = random.choice(list(self.data))
+            if self.get(key, touch=False):
+                return key
+        return None
+
+    def cmd_config(self, args, session):
+        sub = args[0].decode().upper()
+        if sub == 'GET':
+            pattern = args[1].decode()
+            return {name: value for name, value in self.config.items()
+                    if fnmatch.fnmatchcase(name, pattern)}
+        if sub == 'SET':
+            for name, value in zip(args[1::2], args[2::2]):
+                self.config[name.decode()] = value.decode()
+            return OK
+        if sub in ('REWRITE', 'RESETSTAT'):
+            return OK
+        raise ReplyError(f"ERR unknown CONFIG subcommand '{sub}'")
+
+    def cmd_info(self, args, session):
+        used_memory = sum(len(k) + len(e.value) + 64 for k, e in self.data.items())
+        expires = sum(1 for e in self.data.values() if e.expire_at is not None)
+        sections = {
+            'server': {'redis_version': '7.0.0', 'tcp_port': self.port,
+                       'redis_mode': 'cluster'},
+            'clients': {'connected_clients': self.cluster.clients.get(self, 0)},
+            'memory': {'used_memory': used_memory,
+                       'used_memory_human': f"{used_memory / 1024 / 1024:.2f}M"},
+            'stats': {'total_commands_processed': self.commands_processed,
+                      'instantaneous_ops_per_sec': 0},
+            'replication': {'role': 'master' if self.is_master() else 'slave'},
+            'cluster': {'cluster_enabled': 1},
+            'keyspace': {'db0': f"keys={len(self.data)},expires={expires},avg_ttl=0"}
+                        if self.data else {},
+        }
+        wanted = [a.decode().lower() for a in args] or list(sections)
+        lines = []
+        for section in wanted:
+            if section in ('all', 'everything', 'default'):
+                return self.cmd_info([], session)
+            if section not in sections:
+                continue
+            lines.append(f"# {section.capitalize()}")
+            lines += [f"{k}:{v}" for k, v in sections[section].items()]
+            lines.append('')
+        return '\r\n'.join(lines)
+
+    def cmd_shutdown(self, args, session):
+        self.cluster.stop_node(self)
+        return OK
+
+    # Keys
+
+    def cmd_get(self, args, session):
+        entry = self.get(args[0])
+        return entry.value if entry else None
+
+    def cmd_set(self, args, session):
+        key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+        expire_at = None
+        for i, option in enumerate(options):
+            if option == b'PX':
+                expire_at = _now_ms() + int(args[2 + i + 1])
+            elif option == b'EX':
+                expire_at = _now_ms() + int(args[2 + i + 1]) * 1000
+        if b'NX' in options and self.get(key):
+            return None
+        self.put(key, Entry(bytes(value), expire_at))
+        return OK
+
+    def cmd_del(self, args, session):
+        return sum(1 for k in args if self.get(k) and self.delete(k))
+
+    cmd_unlink = cmd_del
+
+    def cmd_exists(self, args, session):
+        return sum(1 for k in args if self.get(k))
+
+    def cmd_type(self, args, session):
+        return Status('string' if self.get(args[0], touch=False) else 'none')
+
+    def cmd_strlen(self, args, session):
+        entry = self.get(args[0])
+        return len(entry.value) if entry else 0
+
+    def cmd_pttl(self, args, session):
+        entry = self.get(args[0])
+        if not entry:
+            return -2
+        if entry.expire_at is None:
+            return -1
+        return max(entry.expire_at - _now_ms(), 0)
+
+    def cmd_ttl(self, args, session):
+        pttl = self.cmd_pttl(args, session)
+        return pttl if pttl < 0 else (pttl + 500) // 1000
+
+    def cmd_pexpire(self, args, session):
+        entry = self.get(args[0])
+        if not entry:
+            return 0
+        entry.expire_at = _now_ms() + int(args[1])
+        return 1
+
+    def cmd_expire(self, args, session):
+        return self.cmd_pexpire([args[0], int(args[1]) * 1000], session)
+
+    def cmd_dump(self, args, session):
+        entry = self.get(args[0])
+        return DUMP_PREFIX + entry.value if entry else None
+
+    def cmd_restore(self, args, session):
+        key, ttl, payload = args[0], int(args[1]), args[2]
+        options = {a.upper() for a in args[3:]}
+        self.restore(key, ttl, payload, b'REPLACE' in options, b'ABSTTL' in options)
+        return OK
+
+    def restore(self, key, ttl, payload, replace=False, absttl=False):
+        if not payload.startswith(DUMP_PREFIX):
+            raise ReplyError("ERR DUMP payload version or checksum are wrong")
+        if not replace and self.get(key):
+            raise ReplyError("BUSYKEY Target key name already exists.")
+        expire_at = None
+        if ttl:
+            expire_at = ttl if absttl else _now_ms() + ttl
+        self.put(key, Entry(bytes(payload[len(DUMP_PREFIX):]), expire_at))
+
+    def cmd_object(self, args, session):
+        sub = args[0].decode().upper()
+        entry = self.get(args[1], touch=False) if len(args) > 1 else None
+        if sub == 'IDLETIME':
+            return int(time.time() - entry.accessed_at) if entry else None
+        if sub == 'FREQ':
+            if 'lfu' not in self.config['maxmemory-policy']:
+                raise ReplyError("ERR An LFU maxmemory policy is not selected, "
+                                 "access frequency not tracked.")
+            # Real counters are logarithmic, hits are enough to rank keys.
+            return min(entry.hits, 255) if entry else None
+        if sub == 'ENCODING':
+            return 'raw' if entry else None
+        raise ReplyError(f"ERR unknown OBJECT subcommand '{sub}'")
+
+    def cmd_memory(self, args, session):
+        if args[0].upper() != b'USAGE':
+            raise ReplyError("ERR unknown MEMORY subcommand")
+        entry = self.get(args[1], touch=False)
+        return len(args[1]) + len(entry.value) + 64 if entry else None
+
+    def cmd_scan(self, args, session):
+        options = {a.upper(): b for a, b in zip(args[1::2], args[2::2])}
+        count = int(options.get(b'COUNT', 10))
+        pattern = options.get(b'MATCH')
+        if self.cluster.scan_order == 'hash':
+            return self._scan_hash_order(int(args[0]), count, pattern)
+
+        # The cursor is the next slot to scan, so keys are returned slot by
+        # slot, whole slots at a time.
+        slot = int(args[0])
+        keys = []
+        while slot < CLUSTER_HASH_SLOTS and len(keys) < count:
+            keys += [k for k in self.keys_in_slot(slot)
+                     if pattern is None or fnmatch.fnmatchcase(k.decode('latin-1'),
+                                                               pattern.decode('latin-1'))]
+            slot += 1
+        return [str(slot % CLUSTER_HASH_SLOTS), keys]
+
+    def _scan_hash_order(self, cursor, count, pattern):
+        # The cursor is the next hash to scan. Keys of the same hash are
+        # returned in the same page.
+        hashed = sorted((h, k) for k in list(self.data)
+                        for h in [zlib.crc32(k) + 1] if h >= cursor)
+        keys, next_cursor = [], 0
+        for i, (h, k) in enumerate(hashed):
+            if i >= count and h != hashed[i - 1][0]:
+                next_cursor = h
+                break
+            if not self.get(k, touch=False):
+                continue
+            if pattern is None or fnmatch.fnmatchcase(k.decode('latin-1'),
+                                                       pattern.decode('latin-1')):
+                keys.append(k)
+        return [str(next_cursor), keys]
+
+    async def cmd_migrate(self, args, session):
+        host, port = args[0].decode(), int(args[1])
+        keys = [args[2]] if args[2] else []
+        options = [a.upper() for a in args[5:]]
+        copy, replace = b'COPY' in options, b'REPLACE' in options
+        if b'KEYS' in options:
+            keys = args[5 + options.index(b'KEYS') + 1:]
+
+        entries = [(k, self.get(k)) for k in keys]
+        entries = [(k, e) for k, e in entries if e]
+        if not entries:
+            return Status('NOKEY')
+
+        target = self.cluster.nodes_by_addr.get((host, port))
+        if target is None:
+            raise ReplyError("IOERR error or timeout connecting to the client")
+        await self.cluster.delay('RESTORE')
+        for key, entry in entries:
+            slot = key_to_slot(key)
+            if self.cluster.owners[slot] is not target and slot not in target.importing:
+                owner = self.cluster.owners[slot]
+                raise ReplyError(f"ERR Target instance replied with error: "
+                                 f"MOVED {slot} {owner.addr if owner else ''}")
+            try:
+                target.restore(key, entry.expire_at or 0, DUMP_PREFIX + entry.value,
+                               replace, absttl=True)
+            except ReplyError as e:
+                raise ReplyError(f"ERR Target instance replied with error: {e}")
+            if not copy:
+                self.delete(key)
+        return OK
+
+    # Cluster
+
+    def cmd_cluster(self, args, session):
+        sub = args[0].decode().upper().replace('-', '_')
+        method = getattr(self, f"cluster_{sub.lower()}", None)
+        if method is None:
+            raise ReplyError(f"ERR Unknown subcommand or wrong number of arguments for '{sub}'")
+        return method(args[1:])
+
+    def cluster_myid(self, args):
+        return self.node_id
+
+    def cluster_keyslot(self, args):
+        return key_to_slot(args[0])
+
+    def cluster_info(self, args):
+        assigned = sum(1 for owner in self.cluster.owners
+                       if owner and owner.node_id in self.known)
+        info = {
+            'cluster_state': 'ok' if assigned == CLUSTER_HASH_SLOTS else 'fail',
+            'cluster_slots_assigned': assigned,
+            'cluster_slots_ok': assigned,
+            'cluster_slots_pfail': 0,
+            'cluster_slots_fail': 0,
+            'cluster_known_nodes': len(self.known),
+            'cluster_size': sum(1 for n in self.known_nodes()
+                                if n.is_master() and n.slots),
+            'cluster_current_epoch': max(n.config_epoch for n in self.known_nodes()),
+            'cluster_my_epoch': self.config_epoch,
+        }
+        return ''.join(f"{k}:{v}\r\n" for k, v in info.items())
+
+    def known_nodes(self):
+        return [n for n in self.cluster.nodes if n.node_id in self.known]
+
+    def cluster_nodes(self, args):
+        lines = []
+        for n in self.known_nodes():
+            flags = ('myself,' if n is self else '') + ('master' if n.is_master() else 'slave')
+            line = [n.node_id, f"{n.addr}@{n.port + 10000}", flags,
+                    n.master_id or '-', '0', '0', str(n.config_epoch), 'connected']
+            line += _summarize_ranges(n.slots)
+            if n is self:
+                line += [f"[{slot}->-{node_id}]" for slot, node_id in sorted(n.migrating.items())]
+                line += [f"[{slot}-<-{node_id}]" for slot, node_id in sorted(n.importing.items())]
+            lines.append(' '.join(line))
+        return '\n'.join(lines) + '\n'
+
+    def cluster_meet(self, args):
+        other = self.cluster.nodes_by_addr.get((args[0].decode(), int(args[1])))
+        if other is None:
+            raise ReplyError(f"ERR Invalid node address specified: {args[0].decode()}:{args[1].decode()}")
+        group = self.known | other.known
+        for n in self.cluster.nodes:
+            if n.node_id in group:
+                n.known = set(group)
+        return OK
+
+    def cluster_forget(self, args):
+        node_id = args[0].decode()
+        if node_id == self.node_id:
+            raise ReplyError("ERR I tried hard but I can't forget myself...")
+        if node_id not in self.known:
+            raise ReplyError(f"ERR Unknown node {node_id}")
+        self.known.discard(node_id)
+        return OK
+
+    def cluster_replicate(self, args):
+        master = self.cluster.nodes_by_id.get(args[0].decode())
+        if master is None or master.node_id not in self.known:
+            raise ReplyError(f"ERR Unknown node {args[0].decode()}")
+        if self.slots or self.data:
+            raise ReplyError("ERR To set a master the node must be empty and "
+                             "without assigned slots.")
+        self.master_id = master.node_id
+        return OK
+
+    def cluster_reset(self, args):
+        if self.data and self.is_master():
+            raise ReplyError("ERR CLUSTER RESET can't be called with master nodes containing keys")
+        for slot in self.slots:
+            self.cluster.set_owner(slot, None)
+        for n in self.cluster.nodes:
+            n.known.discard(self.node_id)
+        self.known = {self.node_id}
+        self.master_id = None
+        self.migrating, self.importing = {}, {}
+        if args and args[0].upper() == b'HARD':
+            self.node_id = os.urandom(20).hex()
+            self.known = {self.node_id}
+            self.cluster.reindex()
+            self.config_epoch = 0
+        return OK
+
+    def cluster_addslots(self, args):
+        slots = [int(s) for s in args]
+        for slot in slots:
+            if self.cluster.owners[slot] is not None:
+                raise ReplyError(f"ERR Slot {slot} is already busy")
+        for slot in slots:
+            self.cluster.set_owner(slot, self)
+        return OK
+
+    def cluster_delslots(self, args):
+        for slot in map(int, args):
+            if self.cluster.owners[slot] is None:
+                raise ReplyError(f"ERR Slot {slot} is already unassigned")
+            self.cluster.set_owner(slot, None)
+        return OK
+
+    def cluster_bumpepoch(self, args=()):
+        epoch = self.cluster.current_epoch()
+        if self.config_epoch == epoch and sum(n.config_epoch == epoch
+                                              for n in self.cluster.nodes) == 1:
+            return Status(f"STILL {epoch}")
+        self.config_epoch = epoch + 1
+        return Status(f"BUMPED {self.config_epoch}")
+
+    def cluster_set_config_epoch(self, args):
+        if len(self.known) > 1:
+            raise ReplyError("ERR The user can assign a config epoch only when "
+                             "the node does not know any other node.")
+        if self.config_epoch:
+            raise ReplyError("ERR Node config epoch is already non-zero")
+        self.config_epoch = int(args[0])
+        return OK
+
+    def cluster_setslot(self, args):
+        slot, sub = int(args[0]), args[1].decode().upper()
+        node_id = args[2].decode() if len(args) > 2 else None
+        owner = self.cluster.owners[slot]
+        if sub == 'MIGRATING':
+            if owner is not self:
+                raise ReplyError(f"ERR I'm not the owner of hash slot {slot}")
+            self._known_node(node_id)
+            self.migrating[slot] = node_id
+        elif sub == 'IMPORTING':
+            if owner is self:
+                raise ReplyError(f"ERR I'm already the owner of hash slot {slot}")
+            self._known_node(node_id)
+            self.importing[slot] = node_id
+        elif sub == 'STABLE':
+            self.migrating.pop(slot, None)
+            self.importing.pop(slot, None)
+        elif sub == 'NODE':
+            target = self._known_node(node_id)
+            if owner is self and target is not self and self.keys_in_slot(slot):
+                raise ReplyError(f"ERR Can't assign hashslot {slot} to a different "
+                                 f"node while I still hold keys for this hash slot.")
+            if target is not self:
+                self.migrating.pop(slot, None)
+            elif self.importing.pop(slot, None) is not None:
+                self.cluster_bumpepoch()
+            self.cluster.set_owner(slot, target)
+        else:
+            raise ReplyError("ERR Invalid CLUSTER SETSLOT action or number of arguments")
+        return OK
+
+    def _known_node(self, node_id):
+        n = self.cluster.nodes_by_id.get(node_id)
+        if n is None or node_id not in self.known:
+            raise ReplyError(f"ERR I don't know about node {node_id}")
+        return n
+
+    def cluster_countkeysinslot(self, args):
+        return len(self.keys_in_slot(int(args[0])))
+
+    def cluster_getkeysinslot(self, args):
+        return self.keys_in_slot(int(args[0]))[:int(args[1])]
+
+
+def _summarize_ranges(slots):
+    ranges = []
+    for slot in slots:
+        if ranges and ranges[-1][1] == slot - 1:
+            ranges[-1][1] = slot
+        else:
+            ranges.append([slot, slot])
+    return [f"{s}-{e}" if s != e else str(s) for s, e in ranges]
+
+
+class _Session:
+
+    __slots__ = ('asking', 'multi', 'protocol')
+
+    def __init__(self):
+        self.asking = False
+        self.multi = None
+        self.protocol = 2
+
+
+class SimulatedCluster:
+    '''
+    A set of SimulatedNodes served from a background event loop.
+
+    With `create` (the default) the first `masters` nodes share the hash
+    slots evenly and every node knows the others, `replicas` replicas are
+    attached to each master and `keys` keys of `value_size` bytes are
+    spread over the cluster. Without it the nodes are empty and unaware of
+    each other, as before `create`.
+    '''
+
+    def __init__(self, masters=3, replicas=0, keys=0, value_size=16,
+                 latency=None, create=True, host='127.0.0.1', scan_order='slot'):
+        self._host = host
+        self._num_nodes = masters * (1 + replicas)
+        self._masters, self._replicas = masters, replicas
+        self._keys, self._value_size = keys, value_size
+        self._create = create
+        self.latency = latency
+        self.scan_order = scan_order
+        self.nodes = []
+        self.owners = [None] * CLUSTER_HASH_SLOTS
+        self._slots_by_owner = None
+        self.nodes_by_id = {}
+        self.nodes_by_addr = {}
+        self.clients = {}
+        self._sessions = {}
+        self._loop = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def addrs(self):
+        return [n.addr for n in self.nodes]
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        for _ in range(self._num_nodes):
+            self.run(self._start_node())
+        if self._create:
+            self.run(self._create_cluster())
+        if self._keys:
+            self.populate(self._keys, self._value_size)
+
+    def stop(self):
+        if not self._loop:
+            return
+        self.run(self._shutdown())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def run(self, coro):
+        # Run a coroutine on the cluster's loop and wait for its result.
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def call(self, func, *args):
+        # Call func in the loop thread, where the node state may be touched.
+        async def call():
+            return func(*args)
+        return self.run(call())
+
+    def add_node(self):
+        # A new empty node, unaware of the cluster, as for add-node.
+        return self.run(self._start_node()).addr
+
+    def populate(self, keys, value_size=16, prefix='key'):
+        def populate():
+            value = b'x' * value_size
+            for i in range(keys):
+                key = f"{prefix}:{i}".encode()
+                owner = self.owners[key_to_slot(key)]
+                if owner:
+                    owner.put(key, Entry(value))
+        self.call(populate)
+
+    def set_owner(self, slot, node):
+        self.owners[slot] = node
+        self._slots_by_owner = None
+
+    def slots_of(self, node):
+        # Built once per change of ownership, CLUSTER NODES of a large
+        # cluster would otherwise scan every slot for every node.
+        if self._slots_by_owner is None:
+            self._slots_by_owner = {}
+            for slot, owner in enumerate(self.owners):
+                self._slots_by_owner.setdefault(owner, []).append(slot)
+        return self._slots_by_owner.get(node, [])
+
+    def current_epoch(self):
+        return max(n.config_epoch for n in self.nodes)
+
+    def reindex(self):
+        self.nodes_by_id = {n.node_id: n for n in self.nodes}
+
+    async def delay(self, command):
+        latency = self.latency
+        if isinstance(latency, dict):
+            latency = latency.get(command, latency.get(command.split(' ')[0],
+                                                       latency.get('*', 0)))
+        if latency:
+            await asyncio.sleep(latency)
+
+    def stop_node(self, node):
+        self._loop.create_task(self._stop_node(node))
+
+    async def _start_node(self):
+        node = SimulatedNode(self, self._host, 0)
+        node.server = await asyncio.start_server(
+                          lambda r, w: self._serve(node, r, w), self._host, 0)
+        node.port = node.server.sockets[0].getsockname()[1]
+        self.nodes.append(node)
+        self.nodes_by_addr[(node.host, node.port)] = node
+        self.reindex()
+        return node
+
+    async def _stop_node(self, node):
+        if node.server:
+            node.server.close()
+            node.server = None
+
+    async def _shutdown(self):
+        for n in self.nodes:
+            await self._stop_node(n)
+        # Closing the connections ends their sessions at the next read.
+        sessions = dict(self._sessions)
+        for writer in sessions.values():
+            writer.transport.abort()
+        await asyncio.gather(*sessions, return_exceptions=True)
+
+    async def _create_cluster(self):
+        masters = self.nodes[:self._masters]
+        for i, n in enumerate(masters):
+            start = i * CLUSTER_HASH_SLOTS // len(masters)
+            end = (i + 1) * CLUSTER_HASH_SLOTS // len(masters)
+            for slot in range(start, end):
+                self.set_owner(slot, n)
+            n.config_epoch = i + 1
+        group = {n.node_id for n in self.nodes}
+        for n in self.nodes:
+            n.known = set(group)
+        for i, n in enumerate(self.nodes[self._masters:]):
+            n.master_id = masters[i % len(masters)].node_id
+
+    async def _serve(self, node, reader, writer):
+        self.clients[node] = self.clients.get(node, 0) + 1
+        self._sessions[asyncio.current_task()] = writer
+        session = _Session()
+        try:
+            while True:
+                try:
+                    args = await read_command(reader)
+                except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+                    break
+                if not args:
+                    if args is None:
+                        break
+                    continue
+                writer.write(encode_reply(await node.execute(args, session),
+                                          session.protocol))
+                await writer.drain()
+        finally:
+            self.clients[node] -= 1
+            self._sessions.pop(asyncio.current_task(), None)
+            writer.close()
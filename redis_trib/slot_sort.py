@@ -0,0 +1,100 @@
+'''
+Records of SCAN pages put back in slot order with bounded memory.
+
+SCAN only returns keys slot by slot on servers that keep a dictionary
+per slot (Redis 7.4+). Older servers return them in hash order, so every
+page mixes slots, and SCAN may return a key more than once on any of
+them. SlotSorter takes (slot, key, value, payload) records in any order
+and gives them back sorted by slot then key, each key once.
+
+Records are kept in memory up to `max_bytes`, then sorted and spilled to
+a temporary run file; reading merges the runs. The memory used doesn't
+depend on the size of the dataset, the temporary files do.
+'''
+
+import heapq
+import struct
+import tempfile
+
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+_RECORD = struct.Struct('>HIqI')
+# Rough size of the tuple, ints and bytes objects of a record in memory.
+_RECORD_OVERHEAD = 160
+
+
+def _sort_key(record):
+    return record[0], record[1]
+
+
+class SlotSorter:
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, tmp_dir=None):
+        self._max_bytes = max_bytes
+        self._tmp_dir = tmp_dir
+        self._records = []
+        self._bytes = 0
+        self._runs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def runs(self):
+        return len(self._runs)
+
+    def write(self, slot, key, value=0, payload=b''):
+        # Same arguments as BackupWriter.write, value being an int64.
+        self._records.append((slot, key, value, payload))
+        self._bytes += len(key) + len(payload) + _RECORD_OVERHEAD
+        if self._bytes >= self._max_bytes:
+            self._spill()
+
+    def _spill(self):
+        self._records.sort(key=_sort_key)
+        f = tempfile.TemporaryFile(dir=self._tmp_dir)
+        for slot, key, value, payload in self._records:
+            f.write(_RECORD.pack(slot, len(key), value, len(payload)))
+            f.write(key)
+            f.write(payload)
+        f.seek(0)
+        self._runs.append(f)
+        self._records = []
+        self._bytes = 0
+
+    def __iter__(self):
+        '''
+        Yield the records sorted by slot then key. Of the records of a key
+        written more than once, only the first is returned.
+        '''
+        # Sorts are stable and merge prefers the earlier runs, so the first
+        # record of a key comes first.
+        self._records.sort(key=_sort_key)
+        runs = [_read_run(f) for f in self._runs] + [iter(self._records)]
+        last = None
+        for record in heapq.merge(*runs, key=_sort_key):
+            if _sort_key(record) == last:
+                continue
+            last = _sort_key(record)
+            yield record
+
+    def close(self):
+        for f in self._runs:
+            f.close()
+        self._runs = []
+        self._records = []
+        self._bytes = 0
+
+
+def _read_run(f):
+    while True:
+        header = f.read(_RECORD.size)
+        if not header:
+            return
+        slot, key_len, value, payload_len = _RECORD.unpack(header)
+        key = f.read(key_len)
+        yield slot, key, value, f.read(payload_len)
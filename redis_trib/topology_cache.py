@@ -0,0 +1,160 @@
+'''
+On-disk cache of the cluster topology, so read-only commands on big
+clusters don't have to connect to every node and parse CLUSTER NODES
+on every run.
+
+The cache holds the parsed CLUSTER NODES of the node given on the command
+line and its CLUSTER INFO. It is trusted only if a few nodes (that node
+and up to VALIDATE_NODES - 1 other masters) still report the same node
+id, config epoch, current epoch, known nodes and slot states: a failover,
+a finished slot migration or a node joining or leaving changes one of
+them. A slot migration in progress doesn't, so topologies with open slots
+are never cached.
+'''
+
+import asyncio
+import json
+import os
+import random
+
+import redis
+
+from .util import parallel_map
+
+
+CACHE_VERSION = 1
+VALIDATE_NODES = 3
+
+# CLUSTER INFO fields that must be unchanged for the cache to be used.
+CHECKED_FIELDS = (
+    'cluster_state',
+    'cluster_current_epoch',
+    'cluster_known_nodes',
+    'cluster_slots_assigned',
+    'cluster_slots_pfail',
+    'cluster_slots_fail',
+)
+
+_SKIPPED_FLAGS = {'noaddr', 'disconnected', 'fail'}
+
+
+def default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.environ.get('REDIS_TRIB_CACHE_DIR') or os.path.join(cache_home, 'redis-trib')
+
+
+class TopologyCache:
+
+    def __init__(self, cache_dir=None):
+        self._cache_dir = cache_dir or default_cache_dir()
+
+    def path(self, addr):
+        return os.path.join(self._cache_dir, addr.replace(':', '_') + '.json')
+
+    def load(self, addr):
+        try:
+            with open(self.path(addr)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('version') == CACHE_VERSION else None
+
+    def save(self, addr, cluster_nodes, info, unreachable_masters=0):
+        if any(n['migrating'] or n['importing'] for n in cluster_nodes.values()):
+            self.invalidate(addr)
+            return
+        os.makedirs(self._cache_dir, exist_ok=True)
+        # Written aside and renamed, for concurrent runs.
+        tmp_path = f"{self.path(addr)}.{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': CACHE_VERSION,
+                'addr': addr,
+                'cluster_nodes': cluster_nodes,
+                'info': {k: str(info.get(k)) for k in CHECKED_FIELDS},
+                'unreachable_masters': unreachable_masters,
+            }, f)
+        os.replace(tmp_path, self.path(addr))
+
+    def invalidate(self, addr):
+        try:
+            os.remove(self.path(addr))
+        except FileNotFoundError:
+            pass
+
+    def make_nodes(self, entry, node_class, password):
+        '''
+        Nodes of the cached topology, not connected, the node the cache
+        was made from first.
+        '''
+        nodes = []
+        for addr, n in entry['cluster_nodes'].items():
+            flags = set(n['flags'].split(','))
+            if flags & _SKIPPED_FLAGS:
+                continue
+            if 'myself' in flags:
+                # Its own address may be blank in CLUSTER NODES.
+                node = node_class(entry['addr'], password)
+                nodes.insert(0, node)
+            else:
+                node = node_class(addr, password)
+                nodes.append(node)
+            node.load_entry(addr, n, cached=True)
+        return nodes
+
+    def validation_nodes(self, nodes):
+        masters = [n for n in nodes[1:] if n.is_master() and n.slots]
+        return nodes[:1] + random.sample(masters, min(len(masters), VALIDATE_NODES - 1))
+
+    def is_valid(self, entry, nodes, replies):
+        '''
+        `replies` are the (CLUSTER INFO, CLUSTER MYID) replies of `nodes`.
+        '''
+        epochs = {n['node_id']: n['epoch'] for n in entry['cluster_nodes'].values()}
+        for node, (info, node_id) in zip(nodes, replies):
+            if node_id != node.node_id \
+                    or str(info.get('cluster_my_epoch')) != epochs[node.node_id]:
+                return False
+            if any(str(info.get(k)) != v for k, v in entry['info'].items()):
+                return False
+        return True
+
+    def load_nodes(self, addr, password, node_class):
+        '''
+        The nodes of the cached topology of addr, connected lazily, and
+        the number of unreachable masters when it was cached. None when
+        there is no cache or it doesn't match the cluster anymore.
+        '''
+        entry = self.load(addr)
+        if not entry:
+            return None
+        nodes = self.make_nodes(entry, node_class, password)
+        for n in nodes:
+            n.connect(ping=False)
+        try:
+            results = list(parallel_map(lambda n: n.cluster_info_and_id(),
+                                        self.validation_nodes(nodes)))
+            checked = [n for n, _ in results]
+            replies = [future.result() for _, future in results]
+        except redis.exceptions.RedisError:
+            return None
+        if not self.is_valid(entry, checked, replies):
+            return None
+        return nodes, entry['unreachable_masters']
+
+    async def load_nodes_async(self, addr, password, node_class):
+        entry = self.load(addr)
+        if not entry:
+            return None
+        nodes = self.make_nodes(entry, node_class, password)
+        for n in nodes:
+            await n.connect(ping=False)
+        checked = self.validation_nodes(nodes)
+        try:
+            replies = await asyncio.gather(*(n.cluster_info_and_id() for n in checked))
+        except redis.exceptions.RedisError:
+            replies = None
+        if replies is None or not self.is_valid(entry, checked, replies):
+            await asyncio.gather(*(n.close() for n in nodes))
+            return None
+        return nodes, entry['unreachable_masters']
@@ -2,13 +2,17 @@ from .mixins import (
     Common, CreateCluster, CheckCluster,
     ShowCluster, AddNode, DelNode,
     MoveSlot, ReshardCluster, RebalanceCluster, FixCluster,
-    CallCluster, ImportCluster
+    CallCluster, ImportCluster, BackupCluster, RestoreCluster,
+    VerifyCluster, WatchCluster, HeatmapCluster, BigKeysCluster,
+    SampleCluster
 )
 
 
 class RedisTrib(Common, CreateCluster, CheckCluster,
                 MoveSlot, ReshardCluster, RebalanceCluster, FixCluster,
-                ShowCluster, AddNode, DelNode, CallCluster, ImportCluster):
+                ShowCluster, AddNode, DelNode, CallCluster, ImportCluster,
+                BackupCluster, RestoreCluster, VerifyCluster, WatchCluster,
+                HeatmapCluster, BigKeysCluster, SampleCluster):
 
     def __init__(self, nodes, password=None, unreachable_masters=0):
         self._nodes = nodes
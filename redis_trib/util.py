@@ -1,10 +1,16 @@
 from itertools import (
     groupby
 )
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
 import sys
 from .xprint import xprint
 
 
+DEFAULT_PARALLEL = 32
+_DIGEST_MASK = (1 << 64) - 1
+
+
 def group_by(iterable, key):
     return {k: list(v) for k, v in groupby(sorted(iterable, key=key), key=key)}
 
@@ -14,6 +20,21 @@ def chunk(iterable, size):
         yield iterable[i:i+size]
 
 
+def parallel_map(func, items, parallel=DEFAULT_PARALLEL):
+    '''
+    Run func for every item on a thread pool of at most `parallel` workers
+    and yield (item, future) pairs in completion order.
+    '''
+    items = list(items)
+    if not items:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(parallel, len(items))) as executor:
+        futures = {executor.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            yield futures[future], future
+
+
 def query_yes_no(question, default=None):
     '''ref: http://code.activestate.com/recipes/577058/'''
     _valid = {'yes': True, 'y': True, 'no': False, 'n': False}
@@ -45,3 +66,32 @@ def summarize_slots(slots):
         _temp_slots[-1][1:] = [slot]
     return ','.join(map(lambda slot_exp: '-'.join(map(str, slot_exp)), _temp_slots)) 
    
+
+
+def parse_slots_expression(expression):
+    '''
+    The inverse of summarize_slots: '0-5,9' -> [0, 1, 2, 3, 4, 5, 9]
+    '''
+    slots = set()
+    for exp in expression.split(','):
+        if not exp.strip():
+            continue
+        start, _, end = exp.partition('-')
+        slots.update(range(int(start), int(end or start) + 1))
+    return sorted(slots)
+
+
+def fold_digest(digest, *parts):
+    '''
+    Add the hash of parts to a 64-bit digest. Addition is commutative, so
+    the result doesn't depend on the order items are folded in.
+    '''
+    h = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode())
+        h.update(b'\0')
+    return (digest + int.from_bytes(h.digest(), 'big')) & _DIGEST_MASK
+
+
+def merge_digests(a, b):
+    return (a + b) & _DIGEST_MASK
@@ -0,0 +1,160 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock
+
+from redis_trib.backup_file import BackupReader
+from redis_trib.factory import NodesFactory
+from redis_trib.mixins.backup_cluster import extract_backup, load_manifest
+from redis_trib.mixins.import_cluster import key_to_slot
+from redis_trib.simulator import SimulatedCluster
+from redis_trib.trib import RedisTrib
+from redis_trib.util import fold_digest, parse_slots_expression
+
+
+def fake_master(node_id, keys):
+    slots = {}
+    for k in keys:
+        slots.setdefault(key_to_slot(k), []).append(k)
+    node = Mock()
+    node.node_id, node.addr = node_id, f"{node_id}:7000"
+    node.slots = {s: False for s in slots}
+    node.is_master.return_value = True
+    node.scan_pages.return_value = iter([list(keys)])
+    node.get_all_keys_in_slot.side_effect = lambda slot: slots.get(slot, [])
+    node.dump_keys.side_effect = lambda keys: [(b'payload:' + k, -1) for k in keys]
+    node.object_idletime.side_effect = lambda keys: [3600] * len(keys)
+    return node
+
+
+class TestBackupCluster(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._keys = [b'a', b'b', b'{a}c', b'd']
+
+    def _path(self, *name):
+        return os.path.join(self._dir.name, *name)
+
+    def _records(self, backup_dir, node_id='n1'):
+        with BackupReader(self._path(backup_dir, f"{node_id}.rtb")) as r:
+            return [key for _, key, _, _ in r]
+
+    def test_fold_digest_is_order_independent(self):
+        d1 = fold_digest(fold_digest(0, b'a'), b'b')
+        d2 = fold_digest(fold_digest(0, b'b'), b'a')
+        self.assertEqual(d1, d2)
+        self.assertNotEqual(d1, fold_digest(0, b'a'))
+
+    def test_parse_slots_expression(self):
+        self.assertListEqual(parse_slots_expression('0-2,10'), [0, 1, 2, 10])
+
+    def test_slot_filtered_backup(self):
+        n = fake_master('n1', self._keys)
+        RedisTrib([n]).backup(self._path('full'), slots=[key_to_slot(b'a')])
+        self.assertListEqual(self._records('full'), [b'a', b'{a}c'])
+
+    def test_incremental_backup(self):
+        n = fake_master('n1', self._keys)
+        manifest = RedisTrib([n]).backup(self._path('base'))
+        self.assertEqual(len(manifest['masters'][0]['slot_digests']), 3)
+
+        # Nothing touched since the base backup: every slot is skipped.
+        n = fake_master('n1', self._keys)
+        RedisTrib([n]).backup(self._path('inc1'), incremental_from=self._path('base'))
+        self.assertListEqual(self._records('inc1'), [])
+        n.dump_keys.assert_not_called()
+
+        # Only the recently touched key is written.
+        n = fake_master('n1', self._keys)
+        n.object_idletime.side_effect = lambda keys: [0 if k == b'd' else 3600 for k in keys]
+        RedisTrib([n]).backup(self._path('inc2'), incremental_from=self._path('base'))
+        self.assertListEqual(self._records('inc2'), [b'd'])
+
+    def test_scan_backup(self):
+        n = fake_master('n1', self._keys)
+        RedisTrib([n]).backup(self._path('full'))
+        self.assertListEqual(sorted(self._records('full')), sorted(self._keys))
+        n.get_all_keys_in_slot.assert_not_called()
+
+    def test_by_slot_backup(self):
+        n = fake_master('n1', self._keys)
+        RedisTrib([n]).backup(self._path('full'), by_slot=True)
+        self.assertListEqual(sorted(self._records('full')), sorted(self._keys))
+        n.scan_pages.assert_not_called()
+
+    def test_scan_duplicates(self):
+        n = fake_master('n1', self._keys)
+        # SCAN returns b'a' twice, within its slot.
+        n.scan_pages.return_value = iter([[b'a', b'b'], [b'{a}c', b'a'], [b'd']])
+        manifest = RedisTrib([n]).backup(self._path('full'))
+        self.assertListEqual(sorted(self._records('full')), sorted(self._keys))
+
+        n = fake_master('n1', self._keys)
+        slots_manifest = RedisTrib([n]).backup(self._path('slots'), by_slot=True)
+        self.assertDictEqual(manifest['masters'][0]['slot_digests'],
+                             slots_manifest['masters'][0]['slot_digests'])
+        self.assertEqual(manifest['masters'][0]['keys'], len(self._keys))
+
+    def test_scan_duplicates_across_pages(self):
+        n = fake_master('n1', self._keys)
+        # b'a' comes back after a page without its slot.
+        n.scan_pages.return_value = iter([[b'a', b'b'], [b'd'], [b'{a}c', b'a']])
+        manifest = RedisTrib([n]).backup(self._path('full'))
+        self.assertListEqual(sorted(self._records('full')), sorted(self._keys))
+        self.assertEqual(manifest['masters'][0]['slot_digests'][key_to_slot(b'a')][0], 2)
+
+    def test_ttl_from_backup_start(self):
+        n = fake_master('n1', self._keys)
+        n.scan_pages.return_value = iter([[b'a'], [b'b']])
+
+        def dump_keys(keys):
+            # The first page takes a while.
+            if keys == [b'a']:
+                time.sleep(0.3)
+            return [(b'payload:' + k, 5000) for k in keys]
+        n.dump_keys.side_effect = dump_keys
+        RedisTrib([n]).backup(self._path('full'))
+        with BackupReader(self._path('full', 'n1.rtb')) as r:
+            pttls = {key: pttl for _, key, pttl, _ in r}
+        self.assertLess(pttls[b'a'], 5300)
+        self.assertGreaterEqual(pttls[b'b'], 5300)
+
+    def test_extract(self):
+        n = fake_master('n1', self._keys)
+        RedisTrib([n]).backup(self._path('full'))
+        extract_backup(self._path('full'), self._path('slot'), [key_to_slot(b'd')])
+        self.assertListEqual(self._records('slot'), [b'd'])
+        entry, = load_manifest(self._path('slot'))['masters']
+        self.assertListEqual(list(entry['slot_digests']), [str(key_to_slot(b'd'))])
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+
+class TestBackupHashOrderScan(unittest.TestCase):
+    # Servers before Redis 7.4 return SCAN pages mixing slots.
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._cluster = SimulatedCluster(masters=2, keys=3000, scan_order='hash')
+        self._cluster.start()
+        nodes, _ = NodesFactory.create_nodes_with_friends(self._cluster.addrs[0], None)
+        self._trib = RedisTrib(nodes)
+
+    def test_one_extent_per_slot(self):
+        manifest = self._trib.backup(os.path.join(self._dir.name, 'scan'), count=100)
+        slots_manifest = self._trib.backup(os.path.join(self._dir.name, 'slots'),
+                                           by_slot=True)
+        for entry, node in zip(manifest['masters'], slots_manifest['masters']):
+            with BackupReader(os.path.join(self._dir.name, 'scan', entry['file'])) as r:
+                self.assertTrue(all(len(extents) == 1 for extents in r.index.values()))
+                self.assertEqual(r.records, len(self._cluster.nodes_by_id[
+                                                    entry['node_id']].data))
+            # The slot engine also records the empty slots.
+            self.assertDictEqual(entry['slot_digests'],
+                                 {slot: digest for slot, digest
+                                  in node['slot_digests'].items() if digest[0]})
+
+    def tearDown(self):
+        self._cluster.stop()
+        self._dir.cleanup()
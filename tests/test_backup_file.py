@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+from redis_trib.backup_file import (
+    BackupWriter, BackupReader, BackupFileError, MAGIC, VERSION,
+)
+
+
+class TestBackupFile(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._dir.name, 'node.rtb')
+        self._records = [
+            (slot, f"key:{i}".encode(), -1 if i % 2 else 1000, os.urandom(i % 50))
+            for i, slot in enumerate([1, 1, 2, 3, 3, 3, 16383] * 20)
+        ]
+
+    def _write(self, compress=True, block_size=64):
+        with BackupWriter(self._path, compress, block_size) as w:
+            for record in self._records:
+                w.write(*record)
+        return w
+
+    def test_round_trip(self):
+        for compress in (True, False):
+            w = self._write(compress)
+            self.assertEqual(w.records, len(self._records))
+            with BackupReader(self._path) as r:
+                self.assertListEqual(list(r), self._records)
+
+    def test_slot_index(self):
+        self._write()
+        with BackupReader(self._path) as r:
+            self.assertListEqual(r.slots, [1, 2, 3, 16383])
+            self.assertEqual(sum(n for _, _, n in r.index[3]), 60)
+            self.assertEqual(r.records, len(self._records))
+            records = [rec for _, _, recs in r.iter_slots([16383])
+                       for rec in recs]
+            self.assertListEqual(records, [rec for rec in self._records
+                                           if rec[0] == 16383])
+
+    def test_sorted_slots_are_single_extents(self):
+        self._records.sort(key=lambda rec: rec[0])
+        self._write()
+        with BackupReader(self._path) as r:
+            self.assertTrue(all(len(extents) == 1 for extents in r.index.values()))
+            blocks = list(r.iter_slots([2, 3]))
+            self.assertEqual(sum(len(recs) for _, _, recs in blocks), 80)
+            # Resume from the second block of the range.
+            resumed = list(r.iter_slots([2, 3], blocks[1][0]))
+            self.assertListEqual(resumed, blocks[1:])
+
+    def test_not_a_backup_file(self):
+        with open(self._path, 'wb') as f:
+            f.write(b'x' * 64)
+        with self.assertRaises(BackupFileError):
+            BackupReader(self._path)
+
+    def test_newer_version(self):
+        self._write()
+        with open(self._path, 'r+b') as f:
+            f.seek(len(MAGIC))
+            f.write(bytes([VERSION + 1]))
+        with self.assertRaisesRegex(BackupFileError, 'version'):
+            BackupReader(self._path)
+
+    def tearDown(self):
+        self._dir.cleanup()
@@ -0,0 +1,30 @@
+import unittest
+
+from benchmarks.run import baselines, find_regressions
+
+
+def run(scale, **medians):
+    return {'scale': scale,
+            'results': {name: {'median': m} for name, m in medians.items()}}
+
+
+class TestBenchmarkHistory(unittest.TestCase):
+    def setUp(self):
+        self._history = [run('small', a=1.0, b=2.0),
+                         run('small', a=3.0),
+                         run('small', a=2.0, b=2.2),
+                         run('full', a=100.0)]
+
+    def test_baselines(self):
+        self.assertDictEqual(baselines(self._history, 'small', window=5),
+                             {'a': 2.0, 'b': 2.1})
+        self.assertDictEqual(baselines(self._history, 'small', window=1),
+                             {'a': 2.0, 'b': 2.2})
+
+    def test_find_regressions(self):
+        results = {'a': {'median': 2.5}, 'b': {'median': 2.2}, 'c': {'median': 9.0}}
+        regressions = find_regressions(results, {'a': 2.0, 'b': 2.0}, threshold=0.2)
+        self.assertDictEqual(regressions, {'a': 1.25})
+
+    def tearDown(self):
+        pass
@@ -0,0 +1,90 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from redis_trib.exceptions import RedisTribException
+from redis_trib.factory import NodesFactory
+from redis_trib.mixins.bigkeys_cluster import TopK
+from redis_trib.mixins.import_cluster import key_to_slot
+from redis_trib.simulator import SimulatedCluster
+from redis_trib.trib import RedisTrib
+
+
+class TestBigKeysCluster(unittest.TestCase):
+    def setUp(self):
+        self._cluster = SimulatedCluster(masters=3, keys=2000)
+        self._cluster.start()
+        self._cluster.populate(3, value_size=100000, prefix='big')
+        nodes, _ = NodesFactory.create_nodes_with_friends(self._cluster.addrs[0], None)
+        self._trib = RedisTrib(nodes)
+
+    def test_bigkeys(self):
+        path = os.path.join(tempfile.mkdtemp(), 'bigkeys.json')
+        out = io.StringIO()
+        with redirect_stdout(out):
+            report = self._trib.bigkeys(top=5, slot_top=2, count=100, output=path)
+
+        self.assertListEqual(sorted(k['key'] for k in report['keys'][:3]),
+                             ['big:0', 'big:1', 'big:2'])
+        self.assertEqual(len(report['keys']), 5)
+        self.assertEqual(report['keys'][0]['slot'], key_to_slot(report['keys'][0]['key'].encode()))
+        self.assertEqual(report['types']['string']['keys'], 2003)
+        self.assertEqual(sum(n['keys'] for n in report['nodes'].values()), 2003)
+        self.assertEqual(sum(s['keys'] for s in report['slots'].values()), 2003)
+        self.assertTrue(all(len(s['top']) <= 2 for s in report['slots'].values()))
+        big_slot = str(key_to_slot(b'big:0'))
+        self.assertEqual(report['slots'][big_slot]['top'][0]['key'], 'big:0')
+        self.assertIn('big:0', out.getvalue().split('Top 5 keys')[1])
+
+        with open(path) as f:
+            self.assertEqual(json.load(f), report)
+
+    def test_hot_keys(self):
+        with self.assertRaises(RedisTribException):
+            self._trib.bigkeys(hot=True)
+
+        for n in self._trib._get_masters():
+            n.r.config_set('maxmemory-policy', 'allkeys-lfu')
+        r = next(n for n in self._trib._get_masters() if key_to_slot(b'key:7') in n.slots).r
+        for _ in range(20):
+            r.get('key:7')
+        with redirect_stdout(io.StringIO()):
+            report = self._trib.bigkeys(top=3, hot=True)
+        self.assertEqual(report['metric'], 'freq')
+        self.assertEqual(report['keys'][0]['key'], 'key:7')
+        self.assertEqual(report['keys'][0]['weight'], 20)
+
+    def test_top_k(self):
+        top = TopK(3)
+        for i in (5, 1, 9, 3, 7):
+            top.push((i, b'k%d' % i, 'string'))
+        self.assertListEqual([e[0] for e in top.entries()], [9, 7, 5])
+        other = TopK(3)
+        other.push((8, b'x', 'string'))
+        other.push((9, b'k9', 'string'))
+        self.assertListEqual([e[1] for e in top.merge(other).entries()],
+                             [b'k9', b'x', b'k7'])
+        # The evicted key can come back.
+        top.push((10, b'k5', 'string'))
+        self.assertListEqual([e[1] for e in top.entries()], [b'k5', b'k9', b'x'])
+
+    def test_scan_duplicates(self):
+        # Pages mixing slots, as before Redis 7.4.
+        self._cluster.scan_order = 'hash'
+        masters = self._trib._get_masters()
+        for n in masters:
+            scan_pages = n.scan_pages
+            # SCAN returns every page twice.
+            n.scan_pages = lambda count, scan_pages=scan_pages: (
+                page for page in scan_pages(count) for _ in range(2))
+        with redirect_stdout(io.StringIO()):
+            report = self._trib.bigkeys(top=5, slot_top=2, count=100)
+        self.assertEqual(len({k['key'] for k in report['keys']}), 5)
+        self.assertEqual(report['types']['string']['keys'], 2003)
+        self.assertEqual(sum(s['keys'] for s in report['slots'].values()), 2003)
+
+    def tearDown(self):
+        self._cluster.stop()
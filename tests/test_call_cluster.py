@@ -0,0 +1,189 @@
+import asyncio
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import Mock, AsyncMock
+
+import redis
+
+from redis_trib.command import check_cluster_command
+from redis_trib.simulator import SimulatedCluster
+from redis_trib.trib import RedisTrib
+from redis_trib.async_node import AsyncNode
+from redis_trib.mixins.call_cluster import parse_command_lines
+
+
+def fake_node(addr, replicate=None, result=None, error=None):
+    node = Mock()
+    node.__str__ = Mock(return_value=addr)
+    node.node_id = addr.replace(':', '')
+    node.is_slave.return_value = replicate is not None
+    node.is_master.return_value = replicate is None
+    if error:
+        node.r.execute_command.side_effect = redis.exceptions.ResponseError(error)
+    else:
+        node.r.execute_command.return_value = result
+    return node
+
+
+class TestCallCluster(unittest.TestCase):
+    def setUp(self):
+        self._nodes = [
+            fake_node('127.0.0.1:7000', result='PONG'),
+            fake_node('127.0.0.1:7001', replicate='127.0.0.1:7000', result='PONG'),
+            fake_node('127.0.0.1:7002', error='ERR unknown command'),
+        ]
+
+    def _call(self, *command, **kwargs):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            RedisTrib(self._nodes).call(*command, **kwargs)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_call_all_nodes(self):
+        lines = self._call('PING', parallel=2)
+        self.assertEqual(len(lines), 3)
+        by_node = {l['node']: l for l in lines}
+        self.assertEqual(by_node['127.0.0.1:7000']['result'], 'PONG')
+        self.assertEqual(by_node['127.0.0.1:7001']['role'], 'replica')
+        self.assertEqual(by_node['127.0.0.1:7002']['error'], 'ERR unknown command')
+        self.assertTrue(all('latency_ms' in l for l in lines))
+
+    def test_call_by_role(self):
+        lines = self._call('PING', role='master')
+        self.assertSetEqual({l['node'] for l in lines},
+                            {'127.0.0.1:7000', '127.0.0.1:7002'})
+        lines = self._call('PING', role='replica')
+        self.assertListEqual([l['node'] for l in lines], ['127.0.0.1:7001'])
+
+    def tearDown(self):
+        pass
+
+
+class TestCallBatch(unittest.TestCase):
+    def setUp(self):
+        self._nodes = [fake_node('127.0.0.1:7000'), fake_node('127.0.0.1:7001')]
+        for n in self._nodes:
+            n.execute_pipeline.return_value = [
+                ['maxmemory', '0'], redis.exceptions.ResponseError('ERR bad')]
+
+    def test_parse_command_lines(self):
+        lines = ['# comment', '', 'CONFIG GET maxmemory', 'SET "a b" 1']
+        self.assertListEqual(parse_command_lines(lines),
+                             [['CONFIG', 'GET', 'maxmemory'], ['SET', 'a b', '1']])
+
+    def test_call_batch(self):
+        commands = [['CONFIG', 'GET', 'maxmemory'], ['BAD']]
+        out = io.StringIO()
+        with redirect_stdout(out):
+            RedisTrib(self._nodes).call_batch(commands)
+        results = json.loads(out.getvalue())
+        self.assertListEqual([r['command'] for r in results], commands)
+        self.assertListEqual(results[0]['replies']['127.0.0.1:7001'], ['maxmemory', '0'])
+        self.assertDictEqual(results[1]['replies']['127.0.0.1:7000'], {'error': 'ERR bad'})
+        self._nodes[0].execute_pipeline.assert_called_once_with(commands)
+
+    def test_call_batch_repeated_command(self):
+        commands = [['INCR', 'a b'], ['INCR', 'a b'], ['GET', 'a b']]
+        for n in self._nodes:
+            n.execute_pipeline.return_value = [1, 2, '2']
+        out = io.StringIO()
+        with redirect_stdout(out):
+            RedisTrib(self._nodes).call_batch(commands)
+        results = json.loads(out.getvalue())
+        self.assertListEqual([r['replies']['127.0.0.1:7000'] for r in results],
+                             [1, 2, '2'])
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            RedisTrib(self._nodes).call_batch(commands, output_format='table')
+        lines = out.getvalue().splitlines()
+        self.assertListEqual([l for l in lines if not l.startswith(' ')],
+                             ["INCR 'a b'", "INCR 'a b'", "GET 'a b'"])
+        self.assertIn('127.0.0.1:7000  2', lines[4])
+
+    def tearDown(self):
+        pass
+
+
+class TestCallAsync(unittest.TestCase):
+    def setUp(self):
+        self._nodes = [fake_node('127.0.0.1:7000'),
+                       fake_node('127.0.0.1:7001', replicate='127.0.0.1:7000')]
+        self._nodes[0].execute_command = AsyncMock(return_value='PONG')
+        self._nodes[1].execute_command = AsyncMock(
+            side_effect=redis.exceptions.ResponseError('ERR bad'))
+        for n in self._nodes:
+            n.execute_pipeline = AsyncMock(return_value=[['maxmemory', '0']])
+
+    def _run(self, coro):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            asyncio.run(coro)
+        return out.getvalue()
+
+    def test_call_async(self):
+        out = self._run(RedisTrib(self._nodes).call_async('PING', parallel=1))
+        by_node = {l['node']: l for l in map(json.loads, out.splitlines())}
+        self.assertEqual(by_node['127.0.0.1:7000']['result'], 'PONG')
+        self.assertEqual(by_node['127.0.0.1:7001']['error'], 'ERR bad')
+        self.assertEqual(by_node['127.0.0.1:7001']['role'], 'replica')
+
+    def test_call_batch_async(self):
+        commands = [['CONFIG', 'GET', 'maxmemory']]
+        out = self._run(RedisTrib(self._nodes).call_batch_async(commands, role='master'))
+        self.assertListEqual(json.loads(out),
+            [{'command': commands[0], 'replies': {'127.0.0.1:7000': ['maxmemory', '0']}}])
+
+    def test_call_batch_async_repeated_command(self):
+        commands = [['INCR', 'a'], ['INCR', 'a'], ['GET', 'a']]
+        self._nodes[0].execute_pipeline = AsyncMock(return_value=[1, 2, '2'])
+        out = self._run(RedisTrib(self._nodes).call_batch_async(commands, role='master'))
+        self.assertListEqual([(r['command'], r['replies']['127.0.0.1:7000'])
+                              for r in json.loads(out)],
+                             list(zip(commands, [1, 2, '2'])))
+
+    def test_async_node_load_info(self):
+        node = AsyncNode('127.0.0.1:7000')
+        node._r = Mock()
+        node._r.cluster = AsyncMock(return_value={
+            '127.0.0.1:7000@17000': {'node_id': 'a' * 40, 'flags': 'myself,master',
+                                     'master_id': '-', 'slots': [['0', '2']],
+                                     'migrating': {}, 'importing': {}},
+            '127.0.0.1:7001@17001': {'node_id': 'b' * 40, 'flags': 'slave',
+                                     'master_id': 'a' * 40, 'slots': [],
+                                     'migrating': {}, 'importing': {}},
+        })
+        asyncio.run(node.load_info())
+        self.assertEqual(node.node_id, 'a' * 40)
+        self.assertListEqual(sorted(node.slots), [0, 1, 2])
+        self.assertListEqual(list(node.friends), [('127.0.0.1:7001@17001', ['slave'])])
+        # The signature uses the loaded snapshot instead of a sync refresh.
+        node.get_config_signature()
+        node._r.cluster.assert_awaited_once_with('NODES')
+
+
+class TestAsyncCheck(unittest.TestCase):
+    def setUp(self):
+        self._cluster = SimulatedCluster(masters=3, replicas=1, keys=10)
+        self._cluster.start()
+
+    def _check(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            check_cluster_command(self._cluster.addrs[0], None)
+        return out.getvalue()
+
+    def test_check(self):
+        out = self._check()
+        self.assertIn('[OK] All 16384 slots covered.', out)
+        self.assertNotIn('[ERR]', out)
+        self.assertNotIn('migrating', out)
+
+        source, target = self._cluster.nodes[:2]
+        self._cluster.call(lambda: source.migrating.update({0: target.node_id}))
+        self.assertIn('migrating', self._check())
+
+    def tearDown(self):
+        self._cluster.stop()
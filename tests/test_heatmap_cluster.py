@@ -0,0 +1,75 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import redis
+
+from redis_trib.factory import NodesFactory
+from redis_trib.mixins.heatmap_cluster import slot_stats, histogram, UNREACHABLE
+from redis_trib.mixins.import_cluster import key_to_slot
+from redis_trib.simulator import SimulatedCluster
+from redis_trib.trib import RedisTrib
+
+
+class TestHeatmapCluster(unittest.TestCase):
+    def setUp(self):
+        self._cluster = SimulatedCluster(masters=3, keys=2000)
+        self._cluster.start()
+        # A hot slot.
+        self._cluster.populate(500, prefix='{hot}')
+
+    def test_heatmap(self):
+        nodes, _ = NodesFactory.create_nodes_with_friends(self._cluster.addrs[0], None)
+        path = os.path.join(tempfile.mkdtemp(), 'heatmap.json')
+        out = io.StringIO()
+        with redirect_stdout(out):
+            counts = RedisTrib(nodes).heatmap(top=3, batch=100, output=path)
+
+        hot = key_to_slot(b'{hot}')
+        self.assertEqual(sum(counts), 2500)
+        self.assertGreaterEqual(counts[hot], 500)
+        self.assertIn(f"slot {hot:>5}", out.getvalue().split('Top 3 slots')[1].splitlines()[1])
+
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(report['counts'], counts.tolist())
+        self.assertEqual(report['stats']['keys'], 2500)
+        self.assertEqual(sum(sum(n['histogram']) for n in report['nodes'].values()), 16384)
+
+    def test_unreachable_master(self):
+        nodes, _ = NodesFactory.create_nodes_with_friends(self._cluster.addrs[0], None)
+        trib = RedisTrib(nodes)
+        down = trib._get_masters()[0]
+        path = os.path.join(tempfile.mkdtemp(), 'heatmap.json')
+        out = io.StringIO()
+        with redirect_stdout(out), \
+             patch.object(down, 'count_keys_in_slots',
+                          side_effect=redis.ConnectionError('down')):
+            counts = trib.heatmap(batch=100, output=path)
+
+        self.assertTrue(all(counts[s] == UNREACHABLE for s in down.slots))
+        keys = sum(len(n.data) for n in self._cluster.nodes if n.addr != down.addr)
+        self.assertEqual(sum(c for c in counts if c > 0), keys)
+        row = next(l for l in out.getvalue().splitlines() if l.split()[:1] == [down.addr])
+        self.assertListEqual(row.split()[1:], ['-'] * 7)
+
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(report['stats']['keys'], keys)
+        self.assertIsNone(report['nodes'][down.addr]['histogram'])
+
+    def test_stats(self):
+        stats = slot_stats([0, 0, 0, 10])
+        self.assertEqual(stats['mean'], 2.5)
+        self.assertEqual(stats['max_to_mean'], 4)
+        self.assertEqual(stats['empty'], 3)
+        self.assertAlmostEqual(stats['gini'], 0.75)
+        self.assertAlmostEqual(slot_stats([5, 5, 5])['gini'], 0)
+        self.assertListEqual(histogram([0, 5, 10, 11, 1000000]), [1, 2, 1, 0, 0, 0, 1])
+
+    def tearDown(self):
+        self._cluster.stop()
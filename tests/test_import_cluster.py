@@ -0,0 +1,125 @@
+import unittest
+from unittest.mock import Mock, MagicMock, patch
+
+import redis
+
+from redis_trib.exceptions import RedisTribException
+from redis_trib.mixins import import_cluster
+from redis_trib.mixins.import_cluster import ChangedKeys, key_to_slot
+from redis_trib.trib import RedisTrib
+
+
+def fake_master(port, slots):
+    node = Mock()
+    node.host, node.port = '127.0.0.1', port
+    node.slots = {s: False for s in slots}
+    node.is_master.return_value = True
+    return node
+
+
+def fake_source(existing):
+    r = Mock()
+    pipe = MagicMock()
+    pipe.__enter__.return_value = pipe
+    keys = []
+    pipe.exists.side_effect = keys.append
+    pipe.execute.side_effect = lambda: [int(k in existing) for k in keys]
+    r.pipeline.return_value = pipe
+    return r
+
+
+class TestChangedKeys(unittest.TestCase):
+    def test_dedup(self):
+        changed = ChangedKeys()
+        changed.add(0, 'a')
+        changed.add(0, 'a')
+        changed.add(1, 'a')
+        self.assertEqual(len(changed), 2)
+        keys, overflowed = changed.drain()
+        self.assertEqual(keys, [(0, 'a'), (1, 'a')])
+        self.assertFalse(overflowed)
+        self.assertEqual(len(changed), 0)
+
+    def test_overflow(self):
+        changed = ChangedKeys(max_keys=2)
+        for k in 'abc':
+            changed.add(0, k)
+        self.assertEqual(len(changed), 2)
+        _, overflowed = changed.drain()
+        self.assertTrue(overflowed)
+        _, overflowed = changed.drain()
+        self.assertFalse(overflowed)
+
+
+class TestImportSync(unittest.TestCase):
+    def setUp(self):
+        self._masters = [fake_master(7000, range(0, 8192)),
+                         fake_master(7001, range(8192, 16384))]
+        self._trib = RedisTrib(self._masters, None)
+
+    def test_replay_migrates_live_and_deletes_missing(self):
+        source = fake_source({'a', 'b'})
+        slot_table = self._trib._make_slots_table()
+        self._trib._replay_keys(source, ['a', 'b', 'gone'], slot_table, 60)
+
+        migrated = [k for c in source.migrate.call_args_list for k in c[0][2]]
+        self.assertEqual(sorted(migrated), ['a', 'b'])
+        for c in source.migrate.call_args_list:
+            self.assertTrue(c[1]['copy'] and c[1]['replace'])
+            self.assertEqual(len({key_to_slot(k) for k in c[0][2]}), 1)
+
+        owner = self._masters[0] if key_to_slot('gone') < 8192 else self._masters[1]
+        owner.execute_pipeline.assert_called_once_with([('DEL', 'gone')])
+
+    def test_sync_until_lag_is_low(self):
+        source = fake_source({'a'})
+        changed = ChangedKeys()
+        rounds = []
+
+        def replay(r, keys, slot_table, timeout):
+            rounds.append(keys)
+            # Writes keep coming while the first round is replayed.
+            if len(rounds) == 1:
+                changed.add(0, 'a')
+
+        self._trib._replay_keys = replay
+        for k in ('a', 'b', 'c'):
+            changed.add(0, k)
+        self._trib._sync_changes([source], {}, changed, 60, max_lag=1, batch=2)
+        self.assertEqual(rounds, [['a', 'b'], ['c'], ['a']])
+
+    def test_sync_gives_up_when_always_overflowing(self):
+        changed = ChangedKeys(max_keys=1)
+        imports = []
+
+        def import_keys(*args, **kwargs):
+            imports.append(args)
+            changed.add(0, 'a')
+            changed.add(0, 'b')
+
+        self._trib._import_keys = import_keys
+        import_keys()
+        with self.assertRaises(RedisTribException):
+            self._trib._sync_changes([fake_source(set())], {}, changed, 60,
+                                     max_lag=1, batch=2, max_resyncs=2)
+        # The first copy and two more.
+        self.assertEqual(len(imports), 3)
+
+    def test_sync_setup_undone_when_a_node_fails(self):
+        nodes = [Mock(), Mock(), Mock()]
+        nodes[0].config_get.return_value = {'notify-keyspace-events': ''}
+        nodes[1].config_get.return_value = {'notify-keyspace-events': 'KA'}
+        nodes[2].config_get.return_value = {'notify-keyspace-events': 'Ex'}
+        listeners = [Mock(), Mock()]
+        with patch.object(import_cluster, 'KeyspaceListener',
+                          side_effect=listeners + [redis.ConnectionError('down')]):
+            with self.assertRaises(redis.ConnectionError):
+                self._trib._import_sync(nodes, {}, 60, 1, 10, 2)
+
+        for l in listeners:
+            l.start.assert_called_once_with()
+            l.stop.assert_called_once_with()
+        # Only the settings that were changed are put back.
+        nodes[0].config_set.assert_called_with('notify-keyspace-events', '')
+        nodes[1].config_set.assert_not_called()
+        nodes[2].config_set.assert_called_with('notify-keyspace-events', 'Ex')
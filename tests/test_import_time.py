@@ -0,0 +1,31 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'benchmarks'))
+
+from import_time import measure, forbidden_imports
+
+
+class TestImportTime(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def test_help_is_lazy(self):
+        modules, _ = measure(['--help'], repeat=1)
+        self.assertIn('click', modules)
+        self.assertListEqual(forbidden_imports(modules), [])
+
+    def test_subcommand_help_is_lazy(self):
+        modules, _ = measure(['info', '--help'], repeat=1)
+        self.assertListEqual(forbidden_imports(modules), [])
+
+    def test_redis_module_not_patched(self):
+        import redis._parsers.helpers as helpers
+        parse = helpers._parse_node_line
+        import redis_trib.cluster_node
+        self.assertIs(helpers._parse_node_line, parse)
+
+    def tearDown(self):
+        pass
@@ -0,0 +1,69 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from redis_trib.factory import NodesFactory
+from redis_trib.metrics import enable_metrics, disable_metrics, get_metrics, Histogram
+from redis_trib.mixins.import_cluster import key_to_slot
+from redis_trib.simulator import SimulatedCluster
+from redis_trib.trib import RedisTrib
+
+
+class TestHistogram(unittest.TestCase):
+    def test_quantile(self):
+        h = Histogram()
+        for value in [0.0001] * 98 + [0.02, 3.0]:
+            h.observe(value)
+        self.assertEqual(h.count, 100)
+        self.assertEqual(h.quantile(0.5), 0.0005)
+        self.assertEqual(h.quantile(0.99), 0.025)
+        self.assertEqual(h.max, 3.0)
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self._cluster = SimulatedCluster(masters=2, keys=1000)
+        self._cluster.start()
+
+    def test_disabled(self):
+        disable_metrics()
+        nodes, _ = NodesFactory.create_nodes_with_friends(self._cluster.addrs[0], None)
+        self.assertIsNone(get_metrics())
+        self.assertNotIn('execute_command', vars(nodes[0].r))
+
+    def test_commands_and_slots(self):
+        metrics = enable_metrics()
+        try:
+            nodes, _ = NodesFactory.create_nodes_with_friends(self._cluster.addrs[0], None)
+            slot = key_to_slot(b'key:0')
+            source = next(n for n in nodes if slot in n.slots)
+            target = next(n for n in nodes if n is not source)
+            keys = source.cluster_count_keys_in_slot(slot)
+            with redirect_stdout(io.StringIO()):
+                RedisTrib(nodes)._move_slot(source, target, slot, probe_key_size=True)
+                source.load_stats()
+        finally:
+            disable_metrics()
+
+        summary = metrics.summary()
+        commands = {(c['node'], c['command']): c for c in summary['commands']}
+        # MIGRATING, then NODE through the ownership broadcast pipeline.
+        self.assertEqual(commands[(str(source), 'CLUSTER SETSLOT')]['count'], 1)
+        self.assertEqual(commands[(str(source), 'MIGRATE')]['count'], 1)
+        self.assertEqual(commands[(str(source), 'PIPELINE')]['errors'], 0)
+        pipelined = {(c['node'], c['command']): c['count'] for c in summary['pipelined']}
+        self.assertEqual(pipelined[(str(source), 'DBSIZE')], 1)
+        self.assertEqual(pipelined[(str(source), 'CLUSTER SETSLOT')], 1)
+        self.assertEqual(pipelined[(str(source), 'MEMORY USAGE')], keys)
+
+        self.assertEqual(summary['slots'][slot]['keys'], keys)
+        self.assertGreater(summary['slots'][slot]['bytes'], 0)
+        self.assertEqual(summary['keys_moved'], keys)
+
+        text = metrics.prometheus_text()
+        self.assertIn(f'redis_trib_slot_keys_moved_total{{slot="{slot}"}} {keys}', text)
+        self.assertIn(f'redis_trib_command_duration_seconds_count{{node="{source}",'
+                      f'command="MIGRATE"}} 1', text)
+
+    def tearDown(self):
+        self._cluster.stop()
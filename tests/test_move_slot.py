@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import Mock
+
+from redis_trib.mixins.move_slot import MoveSlot, plan_migrate_batches
+
+
+class TestPlanMigrateBatches(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def test_pack_by_bytes(self):
+        keys = ['a', 'b', 'c', 'd']
+        sizes = [40, 40, 40, 40]
+        batches = list(plan_migrate_batches(keys, sizes, batch_bytes=100,
+                                            large_key_threshold=1000))
+        self.assertListEqual(batches, [(['a', 'b'], False), (['c', 'd'], False)])
+
+    def test_isolate_large_keys(self):
+        keys = ['a', 'big', 'b']
+        sizes = [10, 5000, 10]
+        batches = list(plan_migrate_batches(keys, sizes, batch_bytes=100,
+                                            large_key_threshold=1000))
+        self.assertListEqual(batches, [(['big'], True), (['a', 'b'], False)])
+
+    def test_missing_keys_and_max_keys(self):
+        keys = ['a', 'b', 'c']
+        sizes = [None, None, None]
+        batches = list(plan_migrate_batches(keys, sizes, max_keys=2))
+        self.assertListEqual(batches, [(['a', 'b'], False), (['c'], False)])
+
+    def test_sized_batches_timeout(self):
+        source = Mock()
+        source.cluster_get_keys_in_slot.side_effect = [['a', 'big'], []]
+        source.memory_usage.return_value = [10, 5000]
+        batches = list(MoveSlot._iter_sized_batches(None, source, 1, 100, 1000, 600, 60))
+        self.assertListEqual(batches, [(['big'], 600, 5000), (['a'], 60, 10)])
+
+    def tearDown(self):
+        pass
@@ -0,0 +1,200 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import redis
+
+from redis_trib import cluster_node
+from redis_trib.exceptions import MigrationStalledException
+from redis_trib.factory import NodesFactory
+from redis_trib.metrics import enable_metrics, disable_metrics
+from redis_trib.mixins.import_cluster import key_to_slot
+from redis_trib.simulator import SimulatedCluster, Entry
+from redis_trib.trib import RedisTrib
+
+
+class TestMoveSlots(unittest.TestCase):
+    def setUp(self):
+        self._cluster = SimulatedCluster(masters=4, keys=100)
+        self._cluster.start()
+
+    def _load(self):
+        nodes, _ = NodesFactory.create_nodes_with_friends(self._cluster.addrs[0], None)
+        return RedisTrib(nodes)
+
+    def test_move_slots(self):
+        trib = self._load()
+        masters = trib._get_masters()
+        target = masters[0]
+        moves = [(n, slot) for n in masters[1:] for slot in sorted(n.slots)[:500]]
+        keys = sum(n.cluster_count_keys_in_slot(slot) for n, slot in moves)
+        self.assertGreater(keys, 0)
+
+        with redirect_stdout(io.StringIO()):
+            moved = trib._move_empty_slots(moves, target)
+            self.assertEqual(len(moved), len(moves) - sum(
+                1 for n, slot in moves if n.cluster_count_keys_in_slot(slot)))
+            # The slots with keys were left alone.
+            trib._move_slots([(n, slot) for n, slot in moves if slot not in moved],
+                             target)
+
+        self.assertEqual(sum(target.cluster_count_keys_in_slot(slot) for _, slot in moves),
+                         keys)
+        trib = self._load()
+        target = next(n for n in trib._get_masters() if n.node_id == target.node_id)
+        self.assertEqual(len(target.slots), 16384 // 4 + 1500)
+        with redirect_stdout(io.StringIO()):
+            trib.check()
+        self.assertEqual(trib._num_errors, 0)
+        for n in self._cluster.nodes:
+            self.assertFalse(n.migrating or n.importing)
+
+    def test_migrate_connections(self):
+        self._cluster.populate(3000, prefix='{giant}')
+        trib = self._load()
+        slot = key_to_slot(b'{giant}')
+        source = next(n for n in trib._get_masters() if slot in n.slots)
+        target = next(n for n in trib._get_masters() if n is not source)
+        keys = source.cluster_count_keys_in_slot(slot)
+
+        with redirect_stdout(io.StringIO()):
+            trib._move_slot(source, target, slot, pipeline=50, migrate_connections=4,
+                            probe_key_size=True, batch_bytes=2000)
+        self.assertEqual(source.cluster_count_keys_in_slot(slot), 0)
+        self.assertEqual(target.cluster_count_keys_in_slot(slot), keys)
+
+    def test_fanout_migrated_keys(self):
+        self._cluster.populate(1000, prefix='{giant}')
+        trib = self._load()
+        slot = key_to_slot(b'{giant}')
+        source = next(n for n in trib._get_masters() if slot in n.slots)
+        target = next(n for n in trib._get_masters() if n is not source)
+        keys = source.cluster_count_keys_in_slot(slot)
+        trib._set_importing_and_migrating(source, target, slot)
+
+        # Every key is in two batches: the second MIGRATE finds it gone.
+        def plan(keys):
+            for i in range(0, len(keys), 10):
+                yield keys[i:i + 10], 60, None
+                yield keys[i:i + 10], 60, None
+        with redirect_stdout(io.StringIO()):
+            trib._migrate_fanout(source, target, slot, 8, plan, False, None)
+        self.assertEqual(source.cluster_count_keys_in_slot(slot), 0)
+        self.assertEqual(target.cluster_count_keys_in_slot(slot), keys)
+
+    def test_migrate_stalled(self):
+        self._cluster.populate(50, prefix='{giant}')
+        trib = self._load()
+        slot = key_to_slot(b'{giant}')
+        source = next(n for n in trib._get_masters() if slot in n.slots)
+        target = next(n for n in trib._get_masters() if n is not source)
+        # The target already has every key: MIGRATE fails with BUSYKEY.
+        sim_source, sim_target = (next(n for n in self._cluster.nodes if n.addr == m.addr)
+                                  for m in (source, target))
+        self._cluster.call(lambda: [sim_target.put(k, Entry(b'old'))
+                                    for k in sim_source.keys_in_slot(slot)])
+
+        with redirect_stdout(io.StringIO()):
+            with self.assertRaises(MigrationStalledException):
+                trib._move_slot(source, target, slot, migrate_connections=4)
+        self.assertEqual(source.cluster_count_keys_in_slot(slot), 50)
+        self.assertEqual(self._cluster.owners[slot].addr, source.addr)
+        self.assertIn(slot, sim_source.migrating)
+        self.assertIn(slot, sim_target.importing)
+
+    def test_migrate_stalled_one_connection(self):
+        self._cluster.populate(50, prefix='{giant}')
+        trib = self._load()
+        slot = key_to_slot(b'{giant}')
+        source = next(n for n in trib._get_masters() if slot in n.slots)
+        target = next(n for n in trib._get_masters() if n is not source)
+        sim_source, sim_target = (next(n for n in self._cluster.nodes if n.addr == m.addr)
+                                  for m in (source, target))
+        self._cluster.call(lambda: [sim_target.put(k, Entry(b'old'))
+                                    for k in sim_source.keys_in_slot(slot)])
+
+        for probe_key_size in (False, True):
+            with redirect_stdout(io.StringIO()):
+                with self.assertRaises(MigrationStalledException):
+                    trib._move_slot(source, target, slot, probe_key_size=probe_key_size)
+            self.assertEqual(source.cluster_count_keys_in_slot(slot), 50)
+            self.assertIn(slot, sim_source.migrating)
+
+    def test_large_key_timeout(self):
+        self._cluster.populate(2, prefix='{giant}')
+        self._cluster.latency = {'MIGRATE': 1}
+        slot = key_to_slot(b'{giant}')
+        with patch.object(cluster_node, 'SOCKET_TIMEOUT', 0.5):
+            trib = self._load()
+            source = next(n for n in trib._get_masters() if slot in n.slots)
+            target = next(n for n in trib._get_masters() if n is not source)
+            # Keys over the threshold wait for their longer MIGRATE timeout.
+            with redirect_stdout(io.StringIO()):
+                trib._move_slot(source, target, slot, probe_key_size=True,
+                                large_key_threshold=1, large_key_timeout=2000)
+        self.assertEqual(target.cluster_count_keys_in_slot(slot), 2)
+        self.assertEqual(self._cluster.owners[slot].addr, target.addr)
+
+    def test_migrate_timeout(self):
+        self._cluster.populate(3, prefix='{giant}')
+        trib = self._load()
+        slot = key_to_slot(b'{giant}')
+        source = next(n for n in trib._get_masters() if slot in n.slots)
+        target = next(n for n in trib._get_masters() if n is not source)
+        with redirect_stdout(io.StringIO()), \
+             patch.object(source, 'migrate',
+                          side_effect=redis.exceptions.TimeoutError('Timeout reading')):
+            with self.assertRaises(MigrationStalledException):
+                trib._move_slot(source, target, slot)
+        self.assertEqual(self._cluster.owners[slot].addr, source.addr)
+        self.assertIn(slot, next(n for n in self._cluster.nodes
+                                 if n.addr == source.addr).migrating)
+
+    def test_relay(self):
+        self._cluster.populate(2000, prefix='{giant}')
+        trib = self._load()
+        slot = key_to_slot(b'{giant}')
+        source = next(n for n in trib._get_masters() if slot in n.slots)
+        target = next(n for n in trib._get_masters() if n is not source)
+        source.raw_r.set(b'{giant}:binary', b'\xff\x00\xfe', px=600000)
+        keys = source.cluster_count_keys_in_slot(slot)
+
+        metrics = enable_metrics()
+        try:
+            with redirect_stdout(io.StringIO()):
+                trib._move_slot(source, target, slot, pipeline=50, relay=True,
+                                migrate_connections=3)
+        finally:
+            disable_metrics()
+        commands = {c['command'] for c in metrics.summary()['commands']}
+        self.assertNotIn('MIGRATE', commands)
+        self.assertEqual(metrics.summary()['keys_moved'], keys)
+
+        self.assertEqual(source.cluster_count_keys_in_slot(slot), 0)
+        self.assertEqual(target.cluster_count_keys_in_slot(slot), keys)
+        self.assertEqual(target.raw_r.get(b'{giant}:binary'), b'\xff\x00\xfe')
+        self.assertGreater(target.raw_r.pttl(b'{giant}:binary'), 590000)
+        self.assertEqual(target.raw_r.pttl(b'{giant}:0'), -1)
+        trib = self._load()
+        with redirect_stdout(io.StringIO()):
+            trib.check()
+        self.assertEqual(trib._num_errors, 0)
+
+    def test_relay_stalled(self):
+        self._cluster.populate(50, prefix='{giant}')
+        trib = self._load()
+        slot = key_to_slot(b'{giant}')
+        source = next(n for n in trib._get_masters() if slot in n.slots)
+        target = next(n for n in trib._get_masters() if n is not source)
+
+        refuse = lambda records, **_: [Exception('OOM')] * len(records)
+        with patch.object(target, 'restore_replies', refuse), \
+                redirect_stdout(io.StringIO()):
+            with self.assertRaises(MigrationStalledException):
+                trib._move_slot(source, target, slot, relay=True)
+        self.assertEqual(source.cluster_count_keys_in_slot(slot), 50)
+        self.assertEqual(self._cluster.owners[slot].addr, source.addr)
+
+    def tearDown(self):
+        self._cluster.stop()
@@ -0,0 +1,76 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from redis_trib.factory import NodesFactory
+from redis_trib.metrics import enable_metrics, disable_metrics
+from redis_trib.ownership import OwnershipBroadcaster
+from redis_trib.simulator import SimulatedCluster
+from redis_trib.trib import RedisTrib
+
+
+class TestOwnershipBroadcaster(unittest.TestCase):
+    def setUp(self):
+        self._cluster = SimulatedCluster(masters=4, keys=0)
+        self._cluster.start()
+        self._now = 0.0
+
+    def _load(self):
+        nodes, _ = NodesFactory.create_nodes_with_friends(self._cluster.addrs[0], None)
+        return RedisTrib(nodes)
+
+    def _open(self, source, target, slots):
+        for slot in slots:
+            target.cluster_setslot_importing(slot, source)
+            source.cluster_setslot_migrating(slot, target)
+
+    def test_coalesce(self):
+        metrics = enable_metrics()
+        try:
+            trib = self._load()
+            source, target, *others = trib._get_masters()
+            slots = sorted(source.slots)[:10]
+            self._open(source, target, slots)
+            broadcaster = OwnershipBroadcaster(trib._get_masters(), batch=8,
+                                               clock=lambda: self._now)
+            for slot in slots[:5]:
+                self.assertListEqual(broadcaster.notify(source, target, slot), [slot])
+            self._now = 0.5
+            broadcaster.notify(source, target, slots[5:7])
+            # 8 slots queued: sent.
+            broadcaster.notify(source, target, slots[7])
+            broadcaster.notify(source, target, slots[8])
+            self._now = 2
+            # The oldest one is too old: sent.
+            broadcaster.notify(source, target, slots[9])
+        finally:
+            disable_metrics()
+
+        summary = metrics.summary()
+        pipelines = {c['node']: c['count'] for c in summary['commands']
+                     if c['command'] == 'PIPELINE'}
+        pipelined = {(c['node'], c['command']): c['count'] for c in summary['pipelined']}
+        for n in others:
+            self.assertEqual(pipelines[str(n)], 2)
+            self.assertEqual(pipelined[(str(n), 'CLUSTER SETSLOT')], 10)
+        # One pipeline per notify for the target and the source.
+        self.assertEqual(pipelines[str(target)], 9)
+        self.assertEqual(pipelines[str(source)], 9)
+
+    def test_move_slots(self):
+        trib = self._load()
+        masters = trib._get_masters()
+        self._cluster.populate(200)
+        moves = [(masters[1], slot) for slot in sorted(masters[1].slots)[:300]]
+        with redirect_stdout(io.StringIO()):
+            trib._move_slots(moves, masters[0])
+
+        trib = self._load()
+        with redirect_stdout(io.StringIO()):
+            trib.check()
+        self.assertEqual(trib._num_errors, 0)
+        target = next(n for n in trib._get_masters() if n.node_id == masters[0].node_id)
+        self.assertTrue(all(slot in target.slots for _, slot in moves))
+
+    def tearDown(self):
+        self._cluster.stop()
@@ -0,0 +1,71 @@
+import io
+import unittest
+
+from redis_trib.progress import Progress, format_bytes, format_duration
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        self._clock = FakeClock()
+        self._stream = io.StringIO()
+        self._progress = Progress('Moving', total_slots=10, interval=1,
+                                  stream=self._stream, clock=self._clock)
+
+    def test_throttled(self):
+        for _ in range(1000):
+            self._progress.start('a:1', 10)
+            self._progress.done('a:1', 10)
+        self.assertEqual(self._stream.getvalue(), '')
+
+        self._clock.now = 1.0
+        self._progress.done('a:1', 0)
+        self.assertEqual(self._stream.getvalue().count('\n'), 1)
+        self.assertIn('keys 10,000 (10,000/s)', self._stream.getvalue())
+
+    def test_ewma_rate_and_eta(self):
+        self._clock.now = 1.0
+        self._progress.slot_done(2)
+        self.assertEqual(self._progress.slot_rate, 2)
+        self.assertEqual(self._progress.eta(), 4)
+
+        # A slow interval only pulls the average down by EWMA_ALPHA.
+        self._clock.now = 2.0
+        self._progress.slot_done(0)
+        self.assertAlmostEqual(self._progress.slot_rate, 1.4)
+        self.assertIn('slots 2/10', self._stream.getvalue())
+        self.assertIn('ETA 0:00:05', self._stream.getvalue())
+
+    def test_in_flight(self):
+        self._progress.start('a:1', 10)
+        self._progress.start('b:2', 5)
+        self._progress.done('b:2', 5, nbytes=2048)
+        self.assertEqual(self._progress.in_flight, {'a:1': 10})
+        line = self._progress.line()
+        self.assertIn('in flight a:1=10', line)
+        self.assertIn('2.0 KB', line)
+
+    def test_close_and_quiet(self):
+        self._progress.close()
+        self.assertIn('slots 0/10', self._stream.getvalue())
+        self.assertIn('ETA -', self._stream.getvalue())
+
+        stream = io.StringIO()
+        with Progress('Moving', stream=stream, quiet=True) as p:
+            p.done('a:1', 1)
+        self.assertEqual(stream.getvalue(), '')
+
+    def test_format(self):
+        self.assertEqual(format_bytes(100), '100 B')
+        self.assertEqual(format_bytes(3 * 1024 * 1024), '3.0 MB')
+        self.assertEqual(format_duration(3725), '1:02:05')
+
+    def tearDown(self):
+        pass
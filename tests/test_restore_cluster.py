@@ -0,0 +1,69 @@
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import Mock
+
+from redis_trib.backup_file import BackupWriter
+from redis_trib.mixins.backup_cluster import MANIFEST_FILE
+from redis_trib.mixins.restore_cluster import RESTORE_STATE_FILE
+from redis_trib.trib import RedisTrib
+
+
+def fake_master(port, slots):
+    node = Mock()
+    node.host, node.port = '127.0.0.1', port
+    node.slots = {s: False for s in slots}
+    node.is_master.return_value = True
+    node.restore_keys.return_value = []
+    return node
+
+
+class TestRestoreCluster(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._created_at = time.time()
+        with BackupWriter(os.path.join(self._dir.name, 'a.rtb'), block_size=16) as w:
+            w.write(0, b'k0', -1, b'p0')
+            w.write(9000, b'k1', 60000, b'p1')
+            w.write(9000, b'k2', 0, b'p2')
+        with open(os.path.join(self._dir.name, MANIFEST_FILE), 'w') as f:
+            json.dump({'created_at': self._created_at,
+                       'masters': [{'file': 'a.rtb'}]}, f)
+        self._masters = [fake_master(7000, range(0, 8192)),
+                         fake_master(7001, range(8192, 16384))]
+
+    def _restored(self, node):
+        return [r for c in node.restore_keys.call_args_list for r in c[0][0]]
+
+    def test_restore_routes_by_slot(self):
+        RedisTrib(self._masters).restore(self._dir.name)
+        self.assertListEqual(self._restored(self._masters[0]), [(b'k0', 0, b'p0')])
+        expire_at = int(self._created_at * 1000) + 60000
+        # k2 expired right when it was backed up.
+        self.assertListEqual(self._restored(self._masters[1]),
+                             [(b'k1', expire_at, b'p1')])
+
+    def test_unowned_slots_skipped(self):
+        masters = [fake_master(7000, range(0, 8192))]
+        out = io.StringIO()
+        with redirect_stdout(out):
+            RedisTrib(masters).restore(self._dir.name)
+        self.assertListEqual(self._restored(masters[0]), [(b'k0', 0, b'p0')])
+        self.assertIn('1 keys of slots without an owner skipped: 9000', out.getvalue())
+
+    def test_resume(self):
+        RedisTrib(self._masters).restore(self._dir.name)
+        with open(os.path.join(self._dir.name, RESTORE_STATE_FILE)) as f:
+            self.assertIn('a.rtb', json.load(f))
+
+        masters = [fake_master(7000, range(0, 8192)),
+                   fake_master(7001, range(8192, 16384))]
+        RedisTrib(masters).restore(self._dir.name, resume=True)
+        self.assertFalse(any(m.restore_keys.called for m in masters))
+
+    def tearDown(self):
+        self._dir.cleanup()
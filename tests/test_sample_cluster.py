@@ -0,0 +1,95 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from redis_trib.factory import NodesFactory
+from redis_trib.sampler import (
+    KeySample, mean_ci, percentile_ci, proportion_ci, total_ci, sum_ci,
+)
+from redis_trib.simulator import SimulatedCluster
+from redis_trib.trib import RedisTrib
+
+
+class TestSampleCluster(unittest.TestCase):
+    def setUp(self):
+        self._cluster = SimulatedCluster(masters=3, keys=3000)
+        self._cluster.start()
+        self._cluster.populate(3000, value_size=1000, prefix='large')
+        nodes, _ = NodesFactory.create_nodes_with_friends(self._cluster.addrs[0], None)
+        self._trib = RedisTrib(nodes)
+        self._bytes = {n.addr: sum(len(k) + len(e.value) + 64 for k, e in n.data.items())
+                       for n in self._cluster.nodes}
+
+    def test_sample(self):
+        path = os.path.join(tempfile.mkdtemp(), 'sample.json')
+        with redirect_stdout(io.StringIO()):
+            summaries = self._trib.sample(size=400, batch=50, output=path)
+
+        for addr, s in summaries.items():
+            node = next(n for n in self._cluster.nodes if n.addr == addr)
+            self.assertEqual(s['sampled'], 400)
+            self.assertEqual(s['keys'][0], len(node.data))
+            # Half of the keys are small and half large, the standard
+            # error of the estimate is about 4% of the total.
+            self.assertAlmostEqual(s['bytes'][0] / self._bytes[addr], 1, delta=0.25)
+            self.assertLess(s['bytes'][1], s['bytes'][0])
+            self.assertEqual(s['types']['string'][0], 1)
+            self.assertLess(s['p50_size'][1], s['p99_size'][0])
+            self.assertEqual(s['volatile'][0], 0)
+        with open(path) as f:
+            self.assertEqual(json.load(f), summaries)
+
+    def test_sample_by_slot(self):
+        with redirect_stdout(io.StringIO()):
+            summaries = self._trib.sample(size=5000, by_slot=True, probe_keys=5)
+
+        for addr, s in summaries.items():
+            self.assertEqual(s['probed_slots'], 1000)
+            self.assertAlmostEqual(s['bytes'][0] / self._bytes[addr], 1, delta=0.25)
+            node = next(n for n in self._cluster.nodes if n.addr == addr)
+            for slot, probe in s['slots'].items():
+                self.assertEqual(probe['keys'], len(node.keys_in_slot(int(slot))))
+
+    def test_info_and_planner_estimates(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self._trib.show(sample=200)
+        self.assertIn('KEY_BYTES', out.getvalue())
+        self.assertIn('of keys estimated', out.getvalue())
+
+        source = self._trib._get_masters()[0]
+        moves = [(source, slot) for slot in sorted(source.slots)[:500]]
+        keys, nbytes = self._trib._estimate_moves(moves)
+        node = next(n for n in self._cluster.nodes if n.addr == source.addr)
+        self.assertEqual(keys, sum(len(node.keys_in_slot(slot)) for _, slot in moves))
+        self.assertLess(nbytes[1], nbytes[0])
+        self.assertGreater(nbytes[0], keys * 88)
+
+    def test_statistics(self):
+        self.assertEqual(mean_ci([1, 2, 3])[0], 2)
+        self.assertAlmostEqual(mean_ci([1, 3], [3, 1])[0], 1.5)
+        self.assertEqual(percentile_ci(list(range(1, 101)), 50)[0], 50)
+        p, low, high = percentile_ci(list(range(1, 101)), 50)
+        self.assertLess(low, p)
+        self.assertGreater(high, p)
+        p, low, high = proportion_ci(0, 100)
+        self.assertEqual((p, low), (0, 0))
+        self.assertGreater(high, 0)
+        self.assertListEqual(total_ci([2, 2], 2), [4, 4, 4])
+        self.assertListEqual(sum_ci([[1, 0, 2], None, [1, 1, 1]]), [2, 1, 3])
+
+        sample = KeySample()
+        sample.add_slot(1, 10, [('string', 100, -1), ('hash', 300, 5000)])
+        sample.add_slot(2, 0, [])
+        summary = sample.summary(owned_slots=2)
+        self.assertEqual(summary['keys'][0], 10)
+        self.assertEqual(summary['bytes'][0], 2000)
+        self.assertEqual(summary['mean_size'][0], 200)
+        self.assertEqual(summary['types']['hash'][0], 0.5)
+        self.assertEqual(summary['p50_ttl'][0], 5)
+
+    def tearDown(self):
+        self._cluster.stop()
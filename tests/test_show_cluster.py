@@ -0,0 +1,60 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import redis
+
+from redis_trib.factory import NodesFactory
+from redis_trib.simulator import SimulatedCluster
+from redis_trib.trib import RedisTrib
+
+
+class TestShowCluster(unittest.TestCase):
+    def setUp(self):
+        self._cluster = SimulatedCluster(masters=3, keys=300)
+        self._cluster.start()
+        nodes, _ = NodesFactory.create_nodes_with_friends(self._cluster.addrs[0], None)
+        self._trib = RedisTrib(nodes)
+
+    def _rows(self, out):
+        # {addr: columns} of the table rows.
+        return {line.split()[0]: line.split() for line in out.splitlines()
+                if line.split() and ':' in line.split()[0]}
+
+    def test_load_stats(self):
+        for n in self._trib._get_masters():
+            node = next(s for s in self._cluster.nodes if s.addr == n.addr)
+            stats = n.load_stats()
+            self.assertEqual(n.dbsize, len(node.data))
+            self.assertIn('used_memory_human', stats)
+            self.assertIn('instantaneous_ops_per_sec', stats)
+            self.assertEqual(stats['db0']['keys'], len(node.data))
+
+    def test_show(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self._trib.show()
+        rows = self._rows(out.getvalue())
+        for node in self._cluster.nodes:
+            row = rows[node.addr]
+            self.assertEqual(int(row[2]), len(node.data))
+            self.assertEqual(int(row[5]), len(node.slots))
+        self.assertIn('300 keys in 3 masters', out.getvalue())
+
+    def test_show_unreachable_master(self):
+        down = self._cluster.nodes[0]
+        n = next(n for n in self._trib._get_masters() if n.addr == down.addr)
+        out = io.StringIO()
+        with redirect_stdout(out), \
+             patch.object(n, 'load_stats', side_effect=redis.ConnectionError('down')):
+            self._trib.show()
+        rows = self._rows(out.getvalue())
+        self.assertEqual(rows[down.addr][2], '-')
+        self.assertEqual(rows[down.addr][6], '-')
+        for node in self._cluster.nodes[1:]:
+            self.assertEqual(int(rows[node.addr][2]), len(node.data))
+        self.assertIn(f"{300 - len(down.data)} keys in 3 masters", out.getvalue())
+
+    def tearDown(self):
+        self._cluster.stop()
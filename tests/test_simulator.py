@@ -0,0 +1,105 @@
+import asyncio
+import io
+import time
+import unittest
+from contextlib import redirect_stdout
+
+import redis
+
+from redis_trib.factory import NodesFactory, AsyncNodesFactory
+from redis_trib.mixins.import_cluster import key_to_slot
+from redis_trib.simulator import SimulatedCluster
+from redis_trib.trib import RedisTrib
+
+
+class TestSimulator(unittest.TestCase):
+    def setUp(self):
+        self._cluster = SimulatedCluster(masters=3, replicas=1, keys=1000)
+        self._cluster.start()
+
+    def _load(self):
+        nodes, _ = NodesFactory.create_nodes_with_friends(self._cluster.addrs[0], None)
+        return nodes
+
+    def test_discovery(self):
+        nodes = self._load()
+        self.assertEqual(len(nodes), 6)
+        masters = [n for n in nodes if n.is_master()]
+        self.assertEqual(sum(len(n.slots) for n in masters), 16384)
+        self.assertTrue(all(len(n.replicas) == 1 for n in masters))
+        self.assertEqual(sum(n.dbsize for n in masters), 1000)
+
+        trib = RedisTrib(nodes)
+        with redirect_stdout(io.StringIO()):
+            trib.check()
+        self.assertEqual(trib._num_errors, 0)
+
+    def test_async_discovery(self):
+        async def load():
+            nodes, _ = await AsyncNodesFactory.create_nodes_with_friends(
+                                self._cluster.addrs[0], None)
+            await asyncio.gather(*(n.close() for n in nodes))
+            return nodes
+        self.assertEqual(len(asyncio.run(load())), 6)
+
+    def test_move_slot(self):
+        nodes = self._load()
+        slot = key_to_slot(b'key:0')
+        source = next(n for n in nodes if slot in n.slots)
+        target = next(n for n in nodes if n.is_master() and n is not source)
+        keys = source.cluster_count_keys_in_slot(slot)
+
+        with redirect_stdout(io.StringIO()):
+            RedisTrib(nodes)._move_slot(source, target, slot)
+
+        self.assertEqual(source.cluster_count_keys_in_slot(slot), 0)
+        self.assertEqual(target.cluster_count_keys_in_slot(slot), keys)
+        for n in self._load():
+            self.assertEqual(slot in n.slots, n.node_id == target.node_id)
+
+    def test_redirections(self):
+        slot = key_to_slot(b'key:0')
+        owner = next(n for n in self._cluster.nodes if slot in n.slots)
+        other = next(n for n in self._cluster.nodes
+                     if n.is_master() and n is not owner)
+        r = redis.StrictRedis(other.host, other.port)
+        with self.assertRaises(redis.exceptions.MovedError) as e:
+            r.get('key:0')
+        self.assertEqual(e.exception.slot_id, slot)
+        self.assertEqual(e.exception.port, owner.port)
+
+        r_owner = redis.StrictRedis(owner.host, owner.port)
+        r_owner.cluster('SETSLOT', slot, 'MIGRATING', other.node_id)
+        r.cluster('SETSLOT', slot, 'IMPORTING', owner.node_id)
+        self.assertEqual(r_owner.get('key:0'), b'x' * 16)
+        with self.assertRaises(redis.exceptions.AskError) as e:
+            r_owner.get('{key:0}missing')
+        self.assertNotIsInstance(e.exception, redis.exceptions.MovedError)
+        self.assertEqual(e.exception.port, other.port)
+
+        with r.pipeline(transaction=False) as p:
+            p.execute_command('ASKING')
+            p.set('{key:0}new', 'v')
+            self.assertEqual(p.execute(), [True, True])
+
+    def test_latency(self):
+        self._cluster.latency = {'PING': 0.05}
+        r = redis.StrictRedis(*self._cluster.addrs[0].split(':'))
+        r.dbsize()
+        start = time.monotonic()
+        r.ping()
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_scan_hash_order(self):
+        self._cluster.scan_order = 'hash'
+        master = next(n for n in self._load() if n.is_master())
+        pages = list(master.scan_pages(100))
+        keys = [k for page in pages for k in page]
+        self.assertEqual(len(keys), master.dbsize)
+        self.assertEqual(len(set(keys)), len(keys))
+        # Every page mixes slots, unlike the default slot order.
+        self.assertTrue(all(len({key_to_slot(k) for k in page}) > 50
+                            for page in pages[:-1]))
+
+    def tearDown(self):
+        self._cluster.stop()
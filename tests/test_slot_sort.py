@@ -0,0 +1,31 @@
+import random
+import unittest
+
+from redis_trib.slot_sort import SlotSorter
+
+
+class TestSlotSorter(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self._records = [(rng.randrange(16384), f"key:{i}".encode(), i, b'x' * (i % 30))
+                         for i in range(2000)]
+
+    def _sorted(self, max_bytes):
+        with SlotSorter(max_bytes) as sorter:
+            for record in self._records:
+                sorter.write(*record)
+            # The same keys again, with other values.
+            for slot, key, _, _ in self._records[:500]:
+                sorter.write(slot, key, -1, b'again')
+            return sorter.runs, list(sorter)
+
+    def test_sorted_and_unique(self):
+        runs, records = self._sorted(1 << 30)
+        self.assertEqual(runs, 0)
+        self.assertListEqual(records, sorted(self._records, key=lambda r: r[:2]))
+
+    def test_spilled_runs(self):
+        runs, records = self._sorted(20000)
+        self.assertGreater(runs, 5)
+        # The first record of a key is the one kept.
+        self.assertListEqual(records, sorted(self._records, key=lambda r: r[:2]))
@@ -0,0 +1,121 @@
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from redis_trib.command import _call_cluster
+from redis_trib.factory import (
+    NodeFactory,
+    NodesFactory,
+    AsyncNodeFactory,
+    AsyncNodesFactory,
+)
+from redis_trib.simulator import SimulatedCluster
+from redis_trib.topology_cache import TopologyCache
+from redis_trib.trib import RedisTrib
+
+
+class TestTopologyCache(unittest.TestCase):
+    def setUp(self):
+        self._cluster = SimulatedCluster(masters=3, replicas=1, keys=100)
+        self._cluster.start()
+        self._addr = self._cluster.addrs[0]
+        self._dir = tempfile.mkdtemp()
+        self._cache = TopologyCache(self._dir)
+
+    def _load(self):
+        with patch.object(NodeFactory, 'create_normal_node',
+                          wraps=NodeFactory.create_normal_node) as discovery:
+            nodes, _ = NodesFactory.create_nodes_with_friends(self._addr, None,
+                                                              self._cache)
+        return nodes, discovery.called
+
+    def _summary(self, nodes):
+        return sorted((n.node_id, n.addr, n.replicate, sorted(n.slots), len(n.replicas))
+                      for n in nodes)
+
+    def test_hit(self):
+        nodes, discovered = self._load()
+        self.assertTrue(discovered)
+        self.assertTrue(os.path.exists(self._cache.path(self._addr)))
+
+        cached, discovered = self._load()
+        self.assertFalse(discovered)
+        self.assertEqual(self._summary(cached), self._summary(nodes))
+        self.assertEqual(cached[0].addr, self._addr)
+        # Lazily connected nodes still work.
+        self.assertEqual(sum(n.r.dbsize() for n in cached if n.is_master()), 100)
+
+    def test_invalidated_by_epoch(self):
+        nodes, _ = self._load()
+        trib = RedisTrib(nodes)
+        source, target, _ = trib._get_masters()
+        slot = min(source.slots)
+        with redirect_stdout(io.StringIO()):
+            trib._move_slot(source, target, slot)
+
+        nodes, discovered = self._load()
+        self.assertTrue(discovered)
+        owner, = [n for n in nodes if slot in n.slots]
+        self.assertEqual(owner.node_id, target.node_id)
+
+        _, discovered = self._load()
+        self.assertFalse(discovered)
+
+    def test_open_slots_not_cached(self):
+        nodes, _ = self._load()
+        source, target, _ = RedisTrib(nodes)._get_masters()
+        RedisTrib(nodes)._set_importing_and_migrating(source, target, min(source.slots))
+        self._cache.invalidate(self._addr)
+
+        self._load()
+        self.assertFalse(os.path.exists(self._cache.path(self._addr)))
+
+    def test_async_hit(self):
+        async def load():
+            nodes, _ = await AsyncNodesFactory.create_nodes_with_friends(
+                                self._addr, None, self._cache)
+            ids = sorted(n.node_id for n in nodes)
+            await asyncio.gather(*(n.close() for n in nodes))
+            return ids
+
+        ids = asyncio.run(load())
+        with patch.object(AsyncNodeFactory, 'create_normal_node') as discovery:
+            self.assertEqual(asyncio.run(load()), ids)
+        self.assertFalse(discovery.called)
+        self.assertEqual(len(ids), 6)
+
+    def test_flags(self):
+        nodes, _ = self._load()
+        cached, _ = self._load()
+        # Discovered nodes are loaded from their own view, with 'myself'.
+        flags = {n.node_id: set(n.flags) - {'myself'} for n in nodes}
+        for n in cached:
+            self.assertTrue(n.cached)
+            self.assertEqual(set(n.flags) - {'myself'}, flags[n.node_id])
+        self.assertListEqual(['myself' in n.flags for n in cached],
+                             [True] + [False] * (len(cached) - 1))
+
+    def test_call_twice(self):
+        def call():
+            out = io.StringIO()
+            with redirect_stdout(out):
+                asyncio.run(_call_cluster(self._addr, None, ('DBSIZE',), None, 8,
+                                          'master', 'json', self._cache))
+            return sorted(json.loads(l)['result'] for l in out.getvalue().splitlines())
+
+        first = call()
+        self.assertTrue(os.path.exists(self._cache.path(self._addr)))
+        with patch.object(AsyncNodeFactory, 'create_normal_node') as discovery:
+            self.assertEqual(call(), first)
+        self.assertFalse(discovery.called)
+        self.assertEqual(sum(first), 100)
+
+    def tearDown(self):
+        self._cluster.stop()
+        shutil.rmtree(self._dir)
@@ -0,0 +1,87 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import Mock
+
+from redis_trib.mixins.import_cluster import key_to_slot
+from redis_trib.trib import RedisTrib
+
+
+def fake_master(data, node_id='n1'):
+    node = Mock()
+    node.node_id, node.addr = node_id, f"{node_id}:7000"
+    node.slots = {key_to_slot(k): False for k in data}
+    node.is_master.return_value = True
+    node.scan_pages.side_effect = lambda *args: iter([list(data)])
+    node.get_all_keys_in_slot.side_effect = \
+        lambda slot: [k for k in data if key_to_slot(k) == slot]
+    node.dump_keys.side_effect = lambda keys: [(data.get(k), -1) for k in keys]
+    node.key_types.side_effect = lambda keys: [b'string' if k in data else b'none' for k in keys]
+    node.key_lengths.side_effect = lambda keys, types: [len(data.get(k, b'')) for k in keys]
+    return node
+
+
+class TestVerifyCluster(unittest.TestCase):
+    def setUp(self):
+        self._data = {b'a': b'1', b'b': b'2', b'c': b'3'}
+
+    def _verify(self, target, source, **kwargs):
+        with redirect_stdout(io.StringIO()) as out:
+            diff = RedisTrib([target]).verify([source], **kwargs)
+        return diff, out.getvalue()
+
+    def test_identical(self):
+        for mode in ('dump', 'light'):
+            diff, _ = self._verify(fake_master(self._data),
+                                   fake_master(dict(self._data), 'n2'), mode=mode)
+            self.assertListEqual(diff, [])
+
+    def test_different_value(self):
+        source = {**self._data, b'b': b'changed'}
+        diff, out = self._verify(fake_master(self._data),
+                                 fake_master(source, 'n2'), drill_down=True)
+        self.assertListEqual(diff, [key_to_slot(b'b')])
+        self.assertIn("different key b'b'", out)
+
+    def test_missing_key(self):
+        source = {**self._data, b'd': b'4'}
+        diff, out = self._verify(fake_master(self._data),
+                                 fake_master(source, 'n2'), mode='light',
+                                 drill_down=True)
+        self.assertListEqual(diff, [key_to_slot(b'd')])
+        self.assertIn("missing key b'd'", out)
+
+    def test_scan_duplicates(self):
+        source = fake_master(dict(self._data), 'n2')
+        # A standalone source, whose SCAN returns b'a' twice.
+        source.node_id = None
+        source.scan_pages.side_effect = lambda *args: iter([[b'a', b'b'], [b'a', b'c']])
+        target = fake_master(self._data)
+        target.scan_pages.side_effect = lambda *args: iter([[b'a', b'b', b'a', b'c']])
+        diff, out = self._verify(target, source)
+        self.assertListEqual(diff, [])
+        self.assertIn('(3 keys)', out)
+
+    def test_standalone_drill_down_scans_once(self):
+        source = fake_master({**self._data, b'b': b'changed', b'd': b'4'}, 'n2')
+        source.node_id = None
+        diff, out = self._verify(fake_master(self._data), source, drill_down=True)
+        self.assertListEqual(diff, sorted([key_to_slot(b'b'), key_to_slot(b'd')]))
+        self.assertIn("different key b'b'", out)
+        self.assertIn("missing key b'd'", out)
+        # One scan for the digests and one for every differing slot.
+        self.assertEqual(source.scan_pages.call_count, 2)
+
+    def test_backup(self):
+        backup_dir = tempfile.TemporaryDirectory()
+        target = fake_master(self._data)
+        with redirect_stdout(io.StringIO()):
+            RedisTrib([target]).backup(backup_dir.name)
+            diff = RedisTrib([fake_master(self._data)]).verify(backup_dir=backup_dir.name)
+        self.assertListEqual(diff, [])
+        backup_dir.cleanup()
+
+    def tearDown(self):
+        pass
@@ -0,0 +1,136 @@
+import io
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from redis_trib.factory import NodesFactory
+from redis_trib.simulator import SimulatedCluster
+from redis_trib.trib import RedisTrib
+
+
+class TestWatchCluster(unittest.TestCase):
+    def setUp(self):
+        self._cluster = SimulatedCluster(masters=3, replicas=1, keys=100)
+        self._cluster.start()
+        nodes, _ = NodesFactory.create_nodes_with_friends(self._cluster.addrs[0], None)
+        self._trib = RedisTrib(nodes)
+        self._events = []
+
+    def _watch(self, ticks=2, **kwargs):
+        self._events = []
+        self._trib.watch(interval=0, ticks=ticks, nodes_per_tick=1,
+                         emit=lambda event, **fields: self._events.append((event, fields)),
+                         **kwargs)
+        return [event for event, _ in self._events]
+
+    def _watch_change(self, change, expected, until=None, **kwargs):
+        # Make the change while watching, and wait for the expected events
+        # (or for until(events) to be true).
+        until = until or (lambda events: set(expected) <= {e for e, _ in events})
+        self._events = []
+        stop = threading.Event()
+        watcher = threading.Thread(target=self._trib.watch, kwargs={
+            'interval': 0.01, 'ticks': 500, 'nodes_per_tick': 1, 'stop': stop,
+            'emit': lambda event, **fields: self._events.append((event, fields)),
+            **kwargs})
+        watcher.start()
+        time.sleep(0.05)
+        change()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not until(self._events):
+            time.sleep(0.01)
+        stop.set()
+        watcher.join()
+        return [event for event, _ in self._events]
+
+    def test_quiet(self):
+        self.assertListEqual(self._watch(ticks=10), [])
+
+    def _moved_slots(self):
+        return sorted(int(s) for e, f in self._events if e == 'slot_moved'
+                      for s in f['slots'].replace('-', ',').split(','))
+
+    def test_slot_moved(self):
+        source, target, _ = self._trib._get_masters()
+        slots = sorted(source.slots)[:2]
+
+        def move():
+            with redirect_stdout(io.StringIO()):
+                for slot in slots:
+                    self._trib._move_slot(source, target, slot)
+        events = self._watch_change(move, ['slot_moved'],
+                                    until=lambda _: self._moved_slots() == slots)
+        # A sweep may also see the slot open during the move.
+        self.assertEqual(set(events) - {'open_slot'}, {'slot_moved'})
+        self.assertEqual(self._moved_slots(), slots)
+        self.assertEqual({(f['source'], f['target']) for e, f in self._events
+                          if e == 'slot_moved'},
+                         {(source.addr, target.addr)})
+
+    def test_slot_moved_to_highest_epoch(self):
+        source, target, _ = self._trib._get_masters()
+        first, second = sorted(source.slots)[:2]
+        with redirect_stdout(io.StringIO()):
+            self._trib._move_slot(source, target, first)
+        # The target has the highest epoch now: the next move changes
+        # nothing in CLUSTER INFO, only the sweep finds it.
+        def move():
+            with redirect_stdout(io.StringIO()):
+                self._trib._move_slot(source, target, second)
+        events = self._watch_change(move, ['slot_moved'], sweep_ticks=2)
+        self.assertListEqual([e for e in events if e != 'open_slot'], ['slot_moved'])
+        self.assertEqual(self._moved_slots(), [second])
+
+    def test_failover_and_join(self):
+        def failover():
+            replica = next(n for n in self._cluster.nodes if n.master_id)
+            master = self._cluster.nodes_by_id[replica.master_id]
+            for slot in list(self._cluster.slots_of(master)):
+                self._cluster.set_owner(slot, replica)
+            replica.master_id, master.master_id = None, replica.node_id
+            replica.config_epoch = self._cluster.current_epoch() + 1
+            return replica.addr
+
+        def change():
+            self._failover_addr = self._cluster.call(failover)
+            new_addr = self._cluster.add_node()
+            self._trib._nodes[0].r.cluster('MEET', *new_addr.split(':'))
+        events = self._watch_change(change, ['failover', 'node_joined', 'slot_moved'])
+        self.assertIn('failover', events)
+        self.assertIn('node_joined', events)
+        self.assertIn('slot_moved', events)
+        self.assertEqual(dict(self._events)['failover']['node'], self._failover_addr)
+
+    def test_node_local_state(self):
+        # One node sees failing slots while the others don't.
+        n = self._trib._nodes[1]
+        cluster, fetched = n.r.cluster, []
+
+        def local_view(*args):
+            if args[0] == 'NODES':
+                fetched.append(args)
+            reply = cluster(*args)
+            if args[0] == 'INFO':
+                reply = {**reply, 'cluster_state': 'fail', 'cluster_slots_pfail': 1}
+            return reply
+
+        with patch.object(n.r, 'cluster', side_effect=local_view):
+            events = self._watch(ticks=24, sweep_ticks=0)
+        self.assertListEqual(events, ['state'])
+        self.assertEqual(self._events[0][1]['node'], str(n))
+        self.assertEqual(len(fetched), 1)
+
+    def test_open_slot(self):
+        source, target, _ = self._trib._get_masters()
+        slot = min(source.slots)
+        self._trib._set_importing_and_migrating(source, target, slot)
+        # Found by the sweep of the masters' own views.
+        events = self._watch(ticks=6, sweep_ticks=1)
+        self.assertEqual(events.count('open_slot'), 2)
+        self.assertEqual({f['direction'] for _, f in self._events},
+                         {'migrating', 'importing'})
+
+    def tearDown(self):
+        self._cluster.stop()